@@ -0,0 +1,83 @@
+# benchmarks/bench_bus_codec.py
+"""
+Encode/decode throughput and wire size for the Redis bus codecs.
+
+Payloads mirror real bus traffic: a small tool command, a research result with
+a few KB of text, a shell result with ~64KB of `ls`-style output and a
+stream chunk. Every codec available in this environment is measured (install
+msgpack and zstandard to see all of them); the JSON row is the old
+json.dumps/json.loads path.
+
+Usage: python benchmarks/bench_bus_codec.py [--iterations 2000] [--threshold 4096]
+"""
+import argparse
+import os
+import sys
+import time
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(project_root, "gpt-nexus"))
+
+from app.bus_codec import MessageCodec, decode_message, supported_codecs
+
+
+def sample_payloads():
+    research_text = " ".join(
+        f"Finding {i}: AI-driven services in logistics grew {i % 17}% quarter over quarter, "
+        f"with automation adoption concentrated in regional carriers." for i in range(40)
+    )
+    listing = "\n".join(f"-rw-r--r-- 1 app app {1000 + i * 37:>8} Jun 12 10:{i % 60:02d} report_{i:05d}.txt" for i in range(1100))
+    return {
+        "tool_command": {
+            "sender_id": "gpt-nexus", "message_type": "tool_command",
+            "payload": {"tool_name": "execute_shell_command", "tool_arguments": {"command": "ls", "args": ["-la"]}, "request_id": "5f1c7a2e-0d2b-4a51-9a7e-3c1f0b8d9e10"},
+        },
+        "research_result": {
+            "sender_id": "gpt-agent_research-001", "message_type": "result",
+            "payload": {"result": research_text, "source": "simulated_web_search", "request_id": "5f1c7a2e-0d2b-4a51-9a7e-3c1f0b8d9e10"},
+        },
+        "shell_result": {
+            "sender_id": "gpt-agent_ops_execution-001", "message_type": "result",
+            "payload": {"stdout": listing, "stderr": "", "success": True, "return_code": 0, "truncated": False, "timed_out": False, "duration_ms": 3.2},
+        },
+        "stream_chunk": {
+            "sender_id": "gpt-agent_ops_execution-001", "message_type": "stream",
+            "payload": {"request_id": "5f1c7a2e-0d2b-4a51-9a7e-3c1f0b8d9e10", "stream": "stdout", "seq": 7, "data": listing[:8192]},
+        },
+    }
+
+
+def measure(codec: MessageCodec, message, iterations: int):
+    frame = codec.encode(message)
+    started = time.perf_counter()
+    for _ in range(iterations):
+        codec.encode(message)
+    encode_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    for _ in range(iterations):
+        decode_message(frame)
+    decode_seconds = time.perf_counter() - started
+    assert decode_message(frame) == message
+    return len(frame), encode_seconds / iterations * 1e6, decode_seconds / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--threshold", type=int, default=4096, help="zstd compression threshold in bytes")
+    args = parser.parse_args()
+
+    codecs = [MessageCodec(name, compress_threshold=args.threshold) for name in supported_codecs()]
+    print(f"Codecs: {', '.join(codec.name for codec in codecs)}   ({args.iterations} iterations each)\n")
+    for payload_name, message in sample_payloads().items():
+        print(payload_name)
+        baseline = None
+        for codec in sorted(codecs, key=lambda c: c.name != "json"):
+            size, encode_us, decode_us = measure(codec, message, args.iterations)
+            baseline = baseline or size
+            print(f"  {codec.name:<14} {size:>8} bytes ({size / baseline:>6.1%})   encode {encode_us:>8.1f}us   decode {decode_us:>8.1f}us")
+        print()
+
+
+if __name__ == "__main__":
+    main()
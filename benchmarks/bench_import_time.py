@@ -0,0 +1,109 @@
+# benchmarks/bench_import_time.py
+"""
+Import-time regression check for Nexus and the agents (CI-runnable).
+
+Each target module is imported in a fresh interpreter `--runs` times. The
+median import time and the number of modules loaded are compared against
+benchmarks/import_time_budget.json. The script exits 1 when a target:
+
+- exceeds its time budget (max_ms) multiplied by --tolerance,
+- loads more modules than max_modules,
+- or eagerly imports a module listed under "lazy".
+
+Module counts and the lazy list do not depend on machine speed, so they catch
+most regressions even on noisy CI runners. The time budget is a coarse
+backstop. Run with --update after an intentional change to rewrite the
+budgets from the current measurements (with headroom).
+
+Usage: python benchmarks/bench_import_time.py [--runs 5] [--tolerance 1.5] [--update]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUDGET_PATH = os.path.join(project_root, "benchmarks", "import_time_budget.json")
+
+# Target name -> (working directory, module to import)
+TARGETS = {
+    "gpt-nexus": ("gpt-nexus", "main"),
+    "gpt-agent_comms": ("gpt-agent_comms", "agent_app"),
+    "gpt-agent_ops_execution": ("gpt-agent_ops_execution", "agent_app"),
+    "gpt-agent_research": ("gpt-agent_research", "agent_app"),
+    "gpt-agent_strategy": ("gpt-agent_strategy", "agent_app"),
+}
+
+PROBE = """
+import json, sys, time
+baseline = set(sys.modules)
+started = time.perf_counter()
+import {module}
+elapsed_ms = (time.perf_counter() - started) * 1000
+print(json.dumps({{"ms": elapsed_ms, "modules": sorted(set(sys.modules) - baseline)}}))
+"""
+
+
+def measure(directory: str, module: str, runs: int):
+    timings, modules = [], []
+    for _ in range(runs):
+        completed = subprocess.run(
+            [sys.executable, "-c", PROBE.format(module=module)],
+            cwd=os.path.join(project_root, directory), capture_output=True, text=True,
+        )
+        if completed.returncode != 0:
+            raise RuntimeError(f"Importing {module} in {directory} failed:\n{completed.stderr}")
+        result = json.loads(completed.stdout.strip().splitlines()[-1])
+        timings.append(result["ms"])
+        modules = result["modules"]
+    return statistics.median(timings), modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--tolerance", type=float, default=1.5, help="multiplier applied to max_ms before failing")
+    parser.add_argument("--update", action="store_true", help="rewrite the budget file from this run")
+    parser.add_argument("targets", nargs="*", default=list(TARGETS))
+    args = parser.parse_args()
+
+    with open(BUDGET_PATH) as handle:
+        budgets = json.load(handle)
+
+    failures = []
+    for name in args.targets:
+        directory, module = TARGETS[name]
+        # One warm-up import so bytecode compilation is not counted.
+        measure(directory, module, 1)
+        median_ms, modules = measure(directory, module, args.runs)
+        budget = budgets.setdefault(name, {"lazy": []})
+        eager = sorted({loaded.split(".")[0] for loaded in modules} & set(budget.get("lazy", [])))
+        print(f"{name:<26} {median_ms:>8.1f}ms (budget {budget.get('max_ms', '-')})   "
+              f"{len(modules):>5} modules (budget {budget.get('max_modules', '-')})")
+
+        if args.update:
+            budget["max_ms"] = round(median_ms * 2, -1)
+            budget["max_modules"] = int(len(modules) * 1.05) + 5
+            continue
+        if "max_ms" in budget and median_ms > budget["max_ms"] * args.tolerance:
+            failures.append(f"{name}: import took {median_ms:.1f}ms, budget {budget['max_ms']}ms x {args.tolerance}")
+        if "max_modules" in budget and len(modules) > budget["max_modules"]:
+            failures.append(f"{name}: imported {len(modules)} modules, budget {budget['max_modules']}")
+        if eager:
+            failures.append(f"{name}: imports {', '.join(eager)} eagerly; these must stay lazy")
+
+    if args.update:
+        with open(BUDGET_PATH, "w") as handle:
+            json.dump(budgets, handle, indent=2, sort_keys=True)
+            handle.write("\n")
+        print(f"Updated {BUDGET_PATH}")
+        return
+    for failure in failures:
+        print(f"FAIL {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
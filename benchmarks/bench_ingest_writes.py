@@ -0,0 +1,137 @@
+# benchmarks/bench_ingest_writes.py
+"""
+Before/after benchmark for the ingest and reprocess write paths.
+
+"before" is the old pattern. It uses a session that expires objects on commit,
+then does add() + commit() + refresh() for an ingest, and SELECT + UPDATE +
+commit() + refresh() for a reprocess. "after" is the current pattern. Ingest is
+add() + commit(), with server defaults brought back by INSERT ... RETURNING.
+Reprocess is a single UPDATE ... RETURNING + commit().
+
+Each pattern runs `--writes` times, `--concurrency` at a time. The report shows
+writes per second and SQL statements per write.
+
+Needs a reachable database. The tables are created if missing, and the rows
+written by the benchmark are deleted afterwards.
+
+Usage: DATABASE_URL=postgresql+asyncpg://... python benchmarks/bench_ingest_writes.py [--writes 2000] [--concurrency 10]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from uuid import uuid4
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(project_root, "gpt-nexus"))
+
+from sqlalchemy import delete, event, select, update
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.models import Base, File, User
+
+
+def new_file(user_id: int) -> File:
+    file_id = str(uuid4())
+    return File(user_id=user_id, file_name=f"{file_id}.txt", file_path=f"files/{user_id}/{file_id}.txt",
+                file_size_bytes=1024, file_type="text/plain", processing_status="uploaded")
+
+
+async def ingest_before(sessions, user_id: int) -> int:
+    async with sessions() as db:
+        record = new_file(user_id)
+        db.add(record)
+        await db.commit()
+        await db.refresh(record)
+        return record.id
+
+
+async def ingest_after(sessions, user_id: int) -> int:
+    async with sessions() as db:
+        record = new_file(user_id)
+        db.add(record)
+        await db.commit()
+        return record.id
+
+
+async def reprocess_before(sessions, user_id: int, file_id: int) -> None:
+    async with sessions() as db:
+        record = (await db.execute(select(File).filter(File.id == file_id, File.user_id == user_id))).scalar_one()
+        record.processing_status = "reprocessing"
+        record.last_processed_at = None
+        db.add(record)
+        await db.commit()
+        await db.refresh(record)
+
+
+async def reprocess_after(sessions, user_id: int, file_id: int) -> None:
+    async with sessions() as db:
+        await db.execute(
+            update(File).where(File.id == file_id, File.user_id == user_id)
+            .values(processing_status="reprocessing", last_processed_at=None)
+            .returning(File.id, File.file_path, File.file_name, File.metadata_json, File.processing_status)
+        )
+        await db.commit()
+
+
+async def timed(label: str, calls, concurrency: int, statements) -> list:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(call):
+        async with semaphore:
+            return await call()
+
+    statements[0] = 0
+    started = time.perf_counter()
+    results = await asyncio.gather(*(one(call) for call in calls))
+    elapsed = time.perf_counter() - started
+    print(f"{label:<20} {len(calls) / elapsed:>9.1f} writes/s   {statements[0] / len(calls):>5.2f} statements/write")
+    return results
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default=os.getenv("DATABASE_URL"))
+    parser.add_argument("--writes", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=10)
+    args = parser.parse_args()
+    if not args.database_url:
+        parser.error("set DATABASE_URL or pass --database-url")
+
+    engine = create_async_engine(args.database_url, pool_size=args.concurrency, max_overflow=0)
+    statements = [0]
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def count_statement(*_):
+        statements[0] += 1
+
+    old_sessions = async_sessionmaker(engine, expire_on_commit=True)
+    new_sessions = async_sessionmaker(engine, expire_on_commit=False, autoflush=False)
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with new_sessions() as db:
+        user = User(username=f"bench-{uuid4()}", hashed_password="x")
+        db.add(user)
+        await db.commit()
+        user_id = user.id
+
+    try:
+        ingest_calls = lambda fn, sessions: [lambda: fn(sessions, user_id) for _ in range(args.writes)]
+        await timed("ingest  before", ingest_calls(ingest_before, old_sessions), args.concurrency, statements)
+        file_ids = await timed("ingest  after", ingest_calls(ingest_after, new_sessions), args.concurrency, statements)
+
+        reprocess_calls = lambda fn, sessions: [lambda file_id=file_id: fn(sessions, user_id, file_id) for file_id in file_ids]
+        await timed("reprocess before", reprocess_calls(reprocess_before, old_sessions), args.concurrency, statements)
+        await timed("reprocess after", reprocess_calls(reprocess_after, new_sessions), args.concurrency, statements)
+    finally:
+        async with new_sessions() as db:
+            await db.execute(delete(File).where(File.user_id == user_id))
+            await db.execute(delete(User).where(User.id == user_id))
+            await db.commit()
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,111 @@
+# benchmarks/bench_jwt_auth.py
+"""
+Per-request bearer-token verification cost for get_current_user.
+
+First, a parity check: every case (valid, expired, not yet valid, tampered,
+wrong key, alg=none, disallowed algorithm, audience, garbage) must be accepted
+or rejected identically by the jose and native backends. The script exits 1 on
+any mismatch.
+
+Then it simulates high-RPS traffic. `--sessions` distinct tokens are replayed
+for `--requests` verifications, so each token is seen many times, as with the
+UI. The report shows microseconds per request and requests per second for
+each backend, with and without the claims cache.
+
+Usage: python benchmarks/bench_jwt_auth.py [--requests 200000] [--sessions 500]
+"""
+import argparse
+import base64
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(project_root, "gpt-nexus"))
+
+from jose import jwt
+
+from app.token_cache import InvalidTokenError, TokenVerifier
+
+SECRET = "bench-secret"
+ALGORITHM = "HS256"
+
+
+def make_token(claims=None, minutes=30, key=SECRET, algorithm=ALGORITHM, **extra):
+    payload = {"sub": "alice", "exp": datetime.utcnow() + timedelta(minutes=minutes), **extra}
+    if claims is not None:
+        payload = claims
+    return jwt.encode(payload, key, algorithm=algorithm)
+
+
+def parity_cases():
+    valid = make_token()
+    header, payload, signature = valid.split(".")
+    forged_payload = base64.urlsafe_b64encode(json.dumps({"sub": "admin", "exp": 9999999999}).encode()).rstrip(b"=").decode()
+    unsigned_header = base64.urlsafe_b64encode(b'{"alg":"none","typ":"JWT"}').rstrip(b"=").decode()
+    return {
+        "valid": valid,
+        "expired": make_token(minutes=-1),
+        "not_yet_valid": make_token(nbf=int(time.time()) + 3600),
+        "with_iat": make_token(iat=int(time.time())),
+        "no_exp": make_token(claims={"sub": "alice"}),
+        "tampered_payload": f"{header}.{forged_payload}.{signature}",
+        "wrong_key": make_token(key="other-secret"),
+        "alg_none": f"{unsigned_header}.{payload}.",
+        "disallowed_hs512": make_token(algorithm="HS512"),
+        "audience": make_token(aud="someone"),
+        "garbage": "not.a.token",
+        "two_segments": f"{header}.{payload}",
+    }
+
+
+def check_parity() -> bool:
+    jose_verifier = TokenVerifier(SECRET, [ALGORITHM], cache_size=0, backend="jose")
+    native_verifier = TokenVerifier(SECRET, [ALGORITHM], cache_size=0, backend="native")
+    ok = True
+    for name, token in parity_cases().items():
+        outcomes = []
+        for verifier in (jose_verifier, native_verifier):
+            try:
+                outcomes.append(("accepted", verifier.verify(token)))
+            except InvalidTokenError:
+                outcomes.append(("rejected", None))
+        match = outcomes[0] == outcomes[1]
+        ok = ok and match
+        print(f"  {name:<18} jose={outcomes[0][0]:<9} native={outcomes[1][0]:<9} {'ok' if match else 'MISMATCH'}")
+    return ok
+
+
+def run(verifier: TokenVerifier, tokens, requests: int):
+    started = time.perf_counter()
+    for i in range(requests):
+        verifier.verify(tokens[i % len(tokens)])
+    elapsed = time.perf_counter() - started
+    return elapsed / requests * 1e6, requests / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200000)
+    parser.add_argument("--sessions", type=int, default=500)
+    args = parser.parse_args()
+
+    print("Parity (jose vs native):")
+    parity_ok = check_parity()
+    print()
+
+    tokens = [make_token(claims={"sub": f"user{i}", "exp": datetime.utcnow() + timedelta(minutes=30)}) for i in range(args.sessions)]
+    print(f"{args.requests} requests over {args.sessions} sessions:")
+    for backend in ("jose", "native"):
+        for cache_size in (0, 10000):
+            verifier = TokenVerifier(SECRET, [ALGORITHM], cache_size=cache_size, backend=backend)
+            per_request_us, rps = run(verifier, tokens, args.requests)
+            label = f"{backend} {'cached' if cache_size else 'uncached'}"
+            print(f"  {label:<18} {per_request_us:>8.2f}us/request   {rps:>11,.0f} verifications/s   {verifier.stats}")
+    sys.exit(0 if parity_ok else 1)
+
+
+if __name__ == "__main__":
+    main()
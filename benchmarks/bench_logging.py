@@ -0,0 +1,89 @@
+# benchmarks/bench_logging.py
+"""
+Caller-side cost of a log line: print() versus the queued logger in
+gpt-nexus/app/async_logging.py.
+
+Both write to the same sink, a stream whose write() sleeps `--sink-delay-ms` to
+stand in for a slow terminal, pipe, or disk. With print() that delay lands on
+the caller, which in Nexus is the event loop. With the queued logger the
+caller only enqueues, and the writer thread absorbs the delay. The script
+reports per-call p50/p99 and total caller time for `--lines` lines, plus how
+many heartbeat lines sampling removed.
+
+Usage: python benchmarks/bench_logging.py [--lines 2000] [--sink-delay-ms 0.2]
+"""
+import argparse
+import io
+import logging
+import os
+import statistics
+import sys
+import time
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(project_root, "gpt-nexus"))
+
+from app import async_logging
+
+
+class SlowSink(io.StringIO):
+    def __init__(self, delay_seconds: float):
+        super().__init__()
+        self.delay_seconds = delay_seconds
+        self.lines = 0
+
+    def write(self, text: str) -> int:
+        time.sleep(self.delay_seconds)
+        self.lines += text.count("\n")
+        return super().write(text)
+
+
+def report(label: str, timings) -> None:
+    timings = sorted(timings)
+    p99 = timings[int(len(timings) * 0.99) - 1]
+    print(f"{label:<26} p50 {statistics.median(timings) * 1e6:>8.1f}us   p99 {p99 * 1e6:>8.1f}us   "
+          f"caller total {sum(timings) * 1000:>8.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lines", type=int, default=2000)
+    parser.add_argument("--sink-delay-ms", type=float, default=0.2)
+    args = parser.parse_args()
+    delay = args.sink_delay_ms / 1000
+
+    sink = SlowSink(delay)
+    timings = []
+    for i in range(args.lines):
+        started = time.perf_counter()
+        print(f"Received heartbeat from agent: agent-{i % 8}. Registry size: 8", file=sink)
+        timings.append(time.perf_counter() - started)
+    report("print()", timings)
+
+    sink = SlowSink(delay)
+    real_stdout, sys.stdout = sys.stdout, sink  # configure_logging() binds the handler to sys.stdout
+    try:
+        async_logging.configure_logging("bench", json_output=True, sample_rates="heartbeat=0.1", queue_size=args.lines * 2)
+        logger = logging.getLogger("bench")
+        for sampled in (False, True):
+            timings = []
+            extra = {"agent_id": "agent-1", "registry_size": 8}
+            if sampled:
+                extra["sample_key"] = "heartbeat"
+            for _ in range(args.lines):
+                started = time.perf_counter()
+                logger.info("Received heartbeat", extra=extra)
+                timings.append(time.perf_counter() - started)
+            sys.stdout = real_stdout
+            report("queued JSON (sampled)" if sampled else "queued JSON", timings)
+            sys.stdout = sink
+        drain_started = time.perf_counter()
+        async_logging.shutdown_logging()
+        drain_ms = (time.perf_counter() - drain_started) * 1000
+    finally:
+        sys.stdout = real_stdout
+    print(f"writer thread drained the backlog in {drain_ms:.1f}ms; {sink.lines} lines written, {async_logging.logging_stats()}")
+
+
+if __name__ == "__main__":
+    main()
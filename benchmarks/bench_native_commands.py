@@ -0,0 +1,54 @@
+# benchmarks/bench_native_commands.py
+"""
+Benchmark for the ops agent's in-process command fast path: the same read-only
+commands through a real subprocess and through the native implementations.
+Parity between the two paths is checked by tests/test_native_commands.py.
+
+Usage: python benchmarks/bench_native_commands.py [--iterations 200]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(project_root, "gpt-agent_ops_execution"))
+
+from executor import CommandExecutor
+
+
+def build_fixture(root: str):
+    os.makedirs(os.path.join(root, "docs"))
+    with open(os.path.join(root, "docs", "notes.txt"), "w") as f:
+        f.write("line one\nline two\n")
+    with open(os.path.join(root, "docs", "Zeta.md"), "w") as f:
+        f.write("# Zeta\n")
+
+
+async def benchmark(root: str, iterations: int):
+    for native_commands in (False, True):
+        executor = CommandExecutor(native_commands=native_commands)
+        started = time.perf_counter()
+        for _ in range(iterations):
+            for argv in (["ls", "docs"], ["cat", "docs/notes.txt"], ["echo", "hi"], ["pwd"]):
+                await executor.run(argv, cwd=root)
+        elapsed = time.perf_counter() - started
+        calls = iterations * 4
+        label = "native fast path" if native_commands else "subprocess"
+        print(f"{label:<18} {calls / elapsed:>10.1f} calls/s   {elapsed / calls * 1e6:>8.1f} us/call")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=200)
+    options = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        build_fixture(root)
+        await benchmark(root, options.iterations)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,78 @@
+# benchmarks/bench_ops_executor.py
+"""
+Burst benchmark for the ops agent's CommandExecutor.
+
+Runs a burst of short `ls` / `cat` commands (the typical housekeeping load) and
+compares the bounded, streaming executor against the old one-process-per-call
+communicate() path, launched all at once with no concurrency cap. Executor
+latencies are per process (time queued behind the cap is not included), so
+compare calls/s for end-to-end throughput.
+
+Usage: python benchmarks/bench_ops_executor.py [--calls 500] [--concurrency 16]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(project_root, "gpt-agent_ops_execution"))
+
+from executor import CommandExecutor
+
+
+def burst_commands(calls: int):
+    target = os.path.join(project_root, "gpt-agent_ops_execution", "executor.py")
+    return [["ls", "-la", project_root] if i % 2 == 0 else ["cat", target] for i in range(calls)]
+
+
+async def run_unbounded(commands):
+    async def one(argv):
+        started = time.perf_counter()
+        process = await asyncio.create_subprocess_exec(*argv, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+        await process.communicate()
+        return (time.perf_counter() - started) * 1000
+    return await asyncio.gather(*(one(argv) for argv in commands))
+
+
+async def run_executor(commands, concurrency: int, stream: bool):
+    executor = CommandExecutor(max_concurrency=concurrency)
+    chunks = [0]
+
+    async def on_output(stream_name, data):
+        chunks[0] += 1
+
+    results = await asyncio.gather(*(executor.run(argv, on_output=on_output if stream else None) for argv in commands))
+    return [result["duration_ms"] for result in results], chunks[0]
+
+
+def report(label: str, wall_seconds: float, latencies_ms, calls: int, extra: str = ""):
+    latencies_ms = sorted(latencies_ms)
+    p99 = latencies_ms[min(len(latencies_ms) - 1, int(len(latencies_ms) * 0.99))]
+    print(f"{label:<32} {calls / wall_seconds:>9.1f} calls/s   p50 {statistics.median(latencies_ms):>7.2f}ms   p99 {p99:>7.2f}ms {extra}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=16)
+    options = parser.parse_args()
+    commands = burst_commands(options.calls)
+
+    started = time.perf_counter()
+    latencies = await run_unbounded(commands)
+    report("unbounded communicate()", time.perf_counter() - started, latencies, options.calls)
+
+    started = time.perf_counter()
+    latencies, _ = await run_executor(commands, options.concurrency, stream=False)
+    report(f"executor (cap {options.concurrency})", time.perf_counter() - started, latencies, options.calls)
+
+    started = time.perf_counter()
+    latencies, chunks = await run_executor(commands, options.concurrency, stream=True)
+    report(f"executor + streaming (cap {options.concurrency})", time.perf_counter() - started, latencies, options.calls, f"  {chunks} chunks")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
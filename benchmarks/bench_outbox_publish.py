@@ -0,0 +1,81 @@
+# benchmarks/bench_outbox_publish.py
+"""
+Publish throughput: one PUBLISH per command, as endpoints used to do from
+background tasks, versus the outbox relay's pipelined batches (see
+gpt-nexus/app/outbox.py).
+
+Publishes `--commands` JSON-encoded commands to a channel nobody listens on,
+sequentially and then in pipelines of `--batch` commands, and reports
+commands per second. With --redis-host this measures a real server, where
+each sequential publish costs a network round trip and pipelining is what
+removes it. Without it, fakeredis (if installed) runs in process and mostly
+shows client overhead.
+
+Usage: python benchmarks/bench_outbox_publish.py [--commands 5000] [--batch 200] [--redis-host localhost]
+"""
+import argparse
+import asyncio
+import json
+import time
+from uuid import uuid4
+
+
+def build_commands(count: int):
+    return [
+        json.dumps({"command": "process_file", "file_id": i, "user_id": i % 50, "file_path": f"files/{i % 50}/{uuid4()}_report.pdf",
+                    "request_id": str(uuid4()), "sent_at": time.time()})
+        for i in range(count)
+    ]
+
+
+async def sequential(redis, channel, commands):
+    for command in commands:
+        await redis.publish(channel, command)
+
+
+async def pipelined(redis, channel, commands, batch: int):
+    for start in range(0, len(commands), batch):
+        pipeline = redis.pipeline(transaction=False)
+        for command in commands[start:start + batch]:
+            pipeline.publish(channel, command)
+        await pipeline.execute()
+
+
+async def run(args):
+    if args.redis_host:
+        from redis.asyncio import Redis
+        redis, label = Redis(host=args.redis_host, port=args.redis_port), f"Redis {args.redis_host}"
+    else:
+        try:
+            import fakeredis.aioredis
+        except ImportError:
+            print("fakeredis not installed and no --redis-host; nothing to measure")
+            return
+        redis, label = fakeredis.aioredis.FakeRedis(), "fakeredis"
+    channel = "bench_outbox_publish"
+    commands = build_commands(args.commands)
+    await sequential(redis, channel, commands[:100])  # warm up the connection
+
+    print(f"{args.commands} commands to {label}")
+    started = time.perf_counter()
+    await sequential(redis, channel, commands)
+    baseline = args.commands / (time.perf_counter() - started)
+    print(f"{'one PUBLISH per command':<28} {baseline:>10.0f} commands/s")
+    started = time.perf_counter()
+    await pipelined(redis, channel, commands, args.batch)
+    rate = args.commands / (time.perf_counter() - started)
+    print(f"{f'pipelines of {args.batch}':<28} {rate:>10.0f} commands/s   x{rate / baseline:.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--commands", type=int, default=5000)
+    parser.add_argument("--batch", type=int, default=200)
+    parser.add_argument("--redis-host")
+    parser.add_argument("--redis-port", type=int, default=6379)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+# benchmarks/bench_rate_limit.py
+"""
+Per-request overhead of the rate limiter in gpt-nexus/app/rate_limit.py.
+
+Drives a minimal ASGI app directly (no HTTP server, no network) in three
+configurations and reports p50/p99 per request:
+
+- no middleware, as the baseline;
+- the middleware with the in-process GCRA (the fallback path);
+- the middleware with the Redis GCRA script. With --redis-host this is a real
+  Redis server, so the figure includes one network round trip. Without it,
+  fakeredis (if installed) runs the script in process, which checks the
+  logic but says little about latency.
+
+Requests cycle through `--clients` client keys, so the limiter works across
+many keys. The limit is set high enough that every request is allowed and the
+full allow path is measured.
+
+Usage: python benchmarks/bench_rate_limit.py [--requests 5000] [--clients 100] [--redis-host localhost]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(project_root, "gpt-nexus"))
+
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+
+from app.rate_limit import RateLimiter, RateLimitMiddleware
+
+
+async def hello(request):
+    return PlainTextResponse("ok")
+
+
+def build_app():
+    return Starlette(routes=[Route("/query/{query_id}", hello)])
+
+
+async def drive(app, requests: int, clients: int):
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    timings = []
+    for i in range(requests):
+        scope = {
+            "type": "http", "method": "GET", "path": f"/query/{i % 50}", "raw_path": b"", "query_string": b"",
+            "headers": [], "client": (f"10.0.{i % clients // 250}.{i % clients % 250}", 5000),
+            "server": ("test", 80), "scheme": "http", "root_path": "", "http_version": "1.1", "app": app,
+        }
+        started = time.perf_counter()
+        await app(scope, receive, send)
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def report(label: str, timings, baseline=None):
+    timings = sorted(timings)
+    p50 = statistics.median(timings)
+    p99 = timings[int(len(timings) * 0.99) - 1]
+    extra = f"   +{(p50 - baseline) * 1e6:>7.1f}us over baseline" if baseline is not None else ""
+    print(f"{label:<28} p50 {p50 * 1e6:>8.1f}us   p99 {p99 * 1e6:>8.1f}us{extra}")
+    return p50
+
+
+async def run(args):
+    app = build_app()
+    await drive(app, 200, args.clients)  # warm up routing and the event loop
+    baseline = report("no rate limiting", await drive(app, args.requests, args.clients))
+
+    def with_limiter(limiter):
+        limited = build_app()
+        limited.add_middleware(RateLimitMiddleware, get_limiter=lambda: limiter,
+                               identify=lambda scope: f"ip:{scope['client'][0]}")
+        return limited
+
+    local = RateLimiter(None, per_minute=10 ** 9, route_limits={})
+    report("middleware, local GCRA", await drive(with_limiter(local), args.requests, args.clients), baseline)
+
+    redis = None
+    if args.redis_host:
+        from redis.asyncio import Redis
+        redis, label = Redis(host=args.redis_host, port=args.redis_port), f"middleware, Redis {args.redis_host}"
+    else:
+        try:
+            import fakeredis.aioredis
+            redis, label = fakeredis.aioredis.FakeRedis(), "middleware, fakeredis"
+        except ImportError:
+            print("fakeredis not installed and no --redis-host; skipping the Redis run")
+    if redis is not None:
+        limiter = RateLimiter(redis, per_minute=10 ** 9, route_limits={"/query/{query_id}": 10 ** 9},
+                              namespace="bench-ratelimit", redis_timeout_ms=1000)
+        timings = await drive(with_limiter(limiter), args.requests, args.clients)
+        report(label, timings, baseline)
+        if limiter.fallbacks_total:
+            print(f"  ({limiter.fallbacks_total} checks fell back to the local limiter)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--clients", type=int, default=100)
+    parser.add_argument("--redis-host")
+    parser.add_argument("--redis-port", type=int, default=6379)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+# benchmarks/sim_autoscaler.py
+"""
+Replays a synthetic demand curve through the autoscaler in
+gpt-nexus/app/autoscaler.py and prints, per controller step, the arrival rate,
+the backlog, p99 latency and the replica count.
+
+The model is one agent type whose replicas each finish `--service-rate`
+commands per second. Demand is a baseline with a burst and a short lull, plus
+noise. Every command is dispatched through a CommandBacklog and answered
+oldest first as capacity allows. Latency is queueing time (backlog / capacity)
+plus the service time (1 / service rate). No
+Redis, processes or real time are involved. A LogActuator stands in for the
+local-process actuator, and the clock is simulated.
+
+With hysteresis the replica count steps up during the burst, holds through
+the lull, and only steps down once the stabilization window has passed. With
+--no-hysteresis (no tolerance, cooldown or stabilization) it follows every
+wiggle. The summary counts scaling actions and the worst p99 for both.
+
+Usage: python benchmarks/sim_autoscaler.py [--steps 120] [--service-rate 0.5] [--no-hysteresis]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import sys
+from collections import deque
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(project_root, "gpt-nexus"))
+
+from app.agent_load import LoadHistory
+from app.autoscaler import Autoscaler, CommandBacklog, LogActuator, ScalingPolicy
+
+AGENT_TYPE = "gpt-agent_research"
+
+
+def demand(step: int, steps: int, baseline: float) -> float:
+    """Arrivals per second: baseline, a 4x burst in the second quarter, a lull inside it, then baseline."""
+    if steps // 4 <= step < steps // 2:
+        return baseline * (0.5 if steps * 3 // 8 <= step < steps * 3 // 8 + 3 else 4)
+    return baseline
+
+
+async def simulate(args, policy: ScalingPolicy, verbose: bool):
+    rng = random.Random(args.seed)
+    load, backlog = LoadHistory(), CommandBacklog(ttl_seconds=float("inf"))
+    actuator = LogActuator()
+    scaler = Autoscaler(load, backlog, actuator, [AGENT_TYPE], policy, interval_seconds=args.interval)
+    actions, worst_p99, carry = 0, 0.0, 0.0
+    outstanding, request = deque(), 0
+    for step in range(args.steps):
+        now = step * args.interval
+        replicas = actuator.replicas(AGENT_TYPE)
+        carry += max(0.0, rng.gauss(demand(step, args.steps, args.baseline), args.baseline * 0.2)) * args.interval
+        arrivals, carry = int(carry), carry - int(carry)
+        for _ in range(arrivals):
+            request += 1
+            outstanding.append(str(request))
+            backlog.dispatched(AGENT_TYPE, str(request), now)
+        for _ in range(min(len(outstanding), int(replicas * args.service_rate * args.interval))):
+            backlog.completed(outstanding.popleft())
+        service_ms = 1000 / args.service_rate
+        p99_ms = len(outstanding) / (replicas * args.service_rate) * 1000 + service_ms
+        worst_p99 = max(worst_p99, p99_ms)
+        for index in range(1, replicas + 1):
+            load.record(f"{AGENT_TYPE}-{index:03d}", {"latency_p50_ms": service_ms, "latency_p99_ms": p99_ms}, now)
+
+        decision = (await scaler.step(now))[0]
+        actions += decision.desired != decision.current
+        if verbose:
+            print(f"t={now:>5.0f}s  demand {arrivals / args.interval:>5.2f}/s  backlog {decision.backlog:>4}  busy {decision.busy:>5.2f}  "
+                  f"p99 {p99_ms:>8.0f}ms  replicas {decision.current} -> {decision.desired}  {decision.reason}")
+    return actions, worst_p99
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--steps", type=int, default=120)
+    parser.add_argument("--interval", type=float, default=15.0, help="controller interval in simulated seconds")
+    parser.add_argument("--baseline", type=float, default=0.4, help="baseline arrivals per second")
+    parser.add_argument("--service-rate", type=float, default=0.5, help="commands per second per replica")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--no-hysteresis", action="store_true", help="print the run without hysteresis")
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    damped = ScalingPolicy(min_replicas=1, max_replicas=8)
+    undamped = ScalingPolicy(min_replicas=1, max_replicas=8, tolerance=0.0, up_cooldown_seconds=0.0,
+                             down_stabilization_seconds=0.0)
+    results = {}
+    for label, policy in (("hysteresis", damped), ("no hysteresis", undamped)):
+        results[label] = asyncio.run(simulate(args, policy, verbose=(label == "no hysteresis") == args.no_hysteresis))
+    for label, (actions, worst_p99) in results.items():
+        print(f"{label:<14} {actions:>3} scaling actions, worst p99 {worst_p99:>8.0f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+# benchmarks/sim_retry_storm.py
+"""
+Load on a failing dependency when every command sent to it fails: retried
+at a fixed interval versus the way gpt-nexus/app/retry.py retries.
+
+Simulated clock: `--commands` commands fail at t=0 because a dependency is
+down for `--outage` seconds. Every attempt during the outage fails again.
+
+- Fixed interval: every failed command retries `--interval` seconds later,
+  with no cap. The whole backlog hits the dependency in lockstep, once per
+  interval.
+- Retry scheduler: full-jitter exponential backoff (backoff_seconds), with
+  at most `--batch` retries taken per poll of `--poll` seconds, and up to
+  `--max-attempts` dispatches before a command is dead-lettered.
+
+Reports the peak retries in one second, total retries, how many commands
+were dead-lettered, and when the last command succeeded.
+
+Usage: python benchmarks/sim_retry_storm.py [--commands 5000] [--outage 60]
+"""
+import argparse
+import heapq
+import os
+import random
+import sys
+from collections import Counter
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(project_root, "gpt-nexus"))
+
+from app.retry import backoff_seconds
+
+
+def simulate(args, scheduled: bool):
+    rng = random.Random(args.seed)
+    # (time of the retry, command, attempt number); every first attempt failed at t=0
+    due = [(backoff_seconds(1, args.base, args.cap, rng) if scheduled else args.interval, i, 2) for i in range(args.commands)]
+    heapq.heapify(due)
+    per_second = Counter()
+    attempts = dead = 0
+    last_success = 0.0
+    now = 0.0
+    while due:
+        now = max(now + args.poll, due[0][0]) if scheduled else due[0][0]
+        taken = []
+        while due and due[0][0] <= now and (not scheduled or len(taken) < args.batch):
+            taken.append(heapq.heappop(due))
+        for _, command, attempt in taken:
+            attempts += 1
+            per_second[int(now)] += 1
+            if now >= args.outage:
+                last_success = now
+            elif scheduled and attempt >= args.max_attempts:  # the last allowed dispatch failed
+                dead += 1
+            elif scheduled:
+                heapq.heappush(due, (now + backoff_seconds(attempt, args.base, args.cap, rng), command, attempt + 1))
+            else:
+                heapq.heappush(due, (now + args.interval, command, attempt + 1))
+    return max(per_second.values()), attempts, dead, last_success
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--commands", type=int, default=5000)
+    parser.add_argument("--outage", type=float, default=60, help="seconds the dependency fails every attempt")
+    parser.add_argument("--interval", type=float, default=5, help="fixed retry interval")
+    parser.add_argument("--base", type=float, default=2, help="RETRY_BASE_SECONDS")
+    parser.add_argument("--cap", type=float, default=300, help="RETRY_MAX_SECONDS")
+    parser.add_argument("--batch", type=int, default=100, help="RETRY_BATCH_SIZE")
+    parser.add_argument("--poll", type=float, default=1, help="RETRY_POLL_SECONDS")
+    parser.add_argument("--max-attempts", type=int, default=5, help="RETRY_MAX_ATTEMPTS")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    print(f"{args.commands} commands failing for {args.outage:.0f}s")
+    for label, scheduled in (("fixed interval", False), ("retry scheduler", True)):
+        peak, attempts, dead, last = simulate(args, scheduled)
+        print(f"  {label:<16} peak {peak:>6}/s  retries {attempts:>7}  dead-lettered {dead:>5}  last success {last:>7.1f}s")
+
+
+if __name__ == "__main__":
+    main()
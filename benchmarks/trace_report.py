@@ -0,0 +1,83 @@
+# benchmarks/trace_report.py
+"""
+Latency hotspots from trace files written by the "file" exporter
+(TRACE_EXPORTERS=file, see gpt-nexus/app/tracing.py).
+
+Reads one or more JSON-lines span files, e.g. the Nexus file plus each agent's.
+It prints:
+- each hop (span name) by total time, with count, p50, p99 and max;
+- the slowest traces end to end;
+- with --trace, the span tree of one trace.
+
+Usage: python benchmarks/trace_report.py traces.jsonl [more.jsonl ...] [--slowest 10] [--trace TRACE_ID]
+"""
+import argparse
+import json
+import os
+import sys
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(project_root, "gpt-nexus"))
+
+from app.tracing import summarize
+
+
+def load(paths):
+    spans = []
+    for path in paths:
+        with open(path) as handle:
+            for line in handle:
+                line = line.strip()
+                if line:
+                    spans.append(json.loads(line))
+    return spans
+
+
+def print_tree(spans):
+    # The same span can arrive twice: from an agent's own file and shipped back to Nexus.
+    unique = {span["span_id"]: span for span in spans}
+    children = {}
+    for span in unique.values():
+        children.setdefault(span["parent_id"], []).append(span)
+    started = min(span["start"] for span in unique.values())
+
+    def walk(parent_id, depth):
+        for span in sorted(children.get(parent_id, []), key=lambda span: span["start"]):
+            offset_ms = (span["start"] - started) * 1000
+            print(f"  {'  ' * depth}{span['name']:<{34 - 2 * depth}} +{offset_ms:>9.2f}ms {span['duration_ms']:>9.2f}ms  "
+                  f"{span['service']} {span['status']}")
+            walk(span["span_id"], depth + 1)
+
+    roots = [span["span_id"] for span in unique.values() if span["parent_id"] not in unique]
+    for root_parent in {unique[span_id]["parent_id"] for span_id in roots}:
+        walk(root_parent, 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("files", nargs="+")
+    parser.add_argument("--slowest", type=int, default=10)
+    parser.add_argument("--trace", help="print the span tree of this trace id")
+    args = parser.parse_args()
+
+    spans = load(args.files)
+    if args.trace:
+        trace_spans = [span for span in spans if span["trace_id"] == args.trace]
+        if not trace_spans:
+            sys.exit(f"Trace {args.trace} not found")
+        print(f"Trace {args.trace}:")
+        print_tree(trace_spans)
+        return
+
+    summary = summarize(spans, slowest=args.slowest)
+    print(f"{len(spans)} spans. Hops by total time:")
+    for name, stats in summary["spans"].items():
+        print(f"  {name:<26} {stats['count']:>7} spans  p50 {stats['p50_ms']:>9.2f}ms  p99 {stats['p99_ms']:>9.2f}ms  "
+              f"max {stats['max_ms']:>9.2f}ms  total {stats['total_ms']:>11.2f}ms")
+    print("Slowest traces:")
+    for trace in summary["slowest_traces"]:
+        print(f"  {trace['trace_id']}  {trace['duration_ms']:>9.2f}ms  {trace['spans']} spans")
+
+
+if __name__ == "__main__":
+    main()
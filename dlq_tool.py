@@ -0,0 +1,72 @@
+# dlq_tool.py
+"""
+Inspect and replay the Nexus dead-letter queue from a shell.
+
+Talks to Redis directly through gpt-nexus/app/retry.py, so it works while
+Nexus is down. Replayed commands go back on the retry schedule with a fresh
+attempt count, and the next running Nexus worker sends them through the
+outbox.
+
+Usage:
+  python dlq_tool.py stats
+  python dlq_tool.py list [--count 20]
+  python dlq_tool.py replay [REQUEST_ID ...] [--limit 100]
+  python dlq_tool.py purge --yes
+
+Connects to REDIS_HOST / REDIS_PORT, like Nexus.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+
+project_root = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(project_root, "gpt-nexus"))
+
+from redis.asyncio import Redis
+
+from app.retry import RetryScheduler
+
+
+async def run(args):
+    redis = Redis(host=os.getenv("REDIS_HOST", "localhost"), port=int(os.getenv("REDIS_PORT", 6379)), decode_responses=True)
+    retry = RetryScheduler(redis)
+    try:
+        if args.action == "stats":
+            print(json.dumps(await retry.stats(), indent=2))
+        elif args.action == "list":
+            for entry in await retry.dead_letters(0, args.count):
+                print(f"{entry['request_id']}  {entry['agent_type']:<28} {entry['priority']:<12} attempts {entry['attempts']}  {entry['error']}")
+        elif args.action == "replay":
+            replayed = await retry.replay(args.request_ids or None, limit=args.limit)
+            print(f"Replayed {len(replayed)} command(s)")
+            for request_id in replayed:
+                print(f"  {request_id}")
+        elif args.action == "purge":
+            if not args.yes:
+                print("Refusing to purge without --yes")
+                return 1
+            print(f"Purged {await retry.purge()} command(s)")
+    finally:
+        await redis.aclose()
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    actions = parser.add_subparsers(dest="action", required=True)
+    actions.add_parser("stats", help="scheduled retries and DLQ size")
+    list_parser = actions.add_parser("list", help="newest dead-lettered commands")
+    list_parser.add_argument("--count", type=int, default=20)
+    replay_parser = actions.add_parser("replay", help="send dead-lettered commands again")
+    replay_parser.add_argument("request_ids", nargs="*", help="defaults to the oldest entries, up to --limit")
+    replay_parser.add_argument("--limit", type=int, default=100)
+    purge_parser = actions.add_parser("purge", help="drop every dead-lettered command")
+    purge_parser.add_argument("--yes", action="store_true")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,7 @@
 # generate_agents.py
 import os
 import json
+import shutil
 from jinja2 import Environment, FileSystemLoader
 
 # --- Agent Definitions ---
@@ -12,13 +13,29 @@ AGENTS_CONFIG = [
         "agent_id": "gpt-agent_comms-001",
         "agent_name": "Communication Agent Prime",
         "agent_type": "comms",
-        "agent_capabilities": "Send SMS, Email, Real-time Chat",
+        "agent_capabilities": "Send SMS, Email, Real-time Chat, Bulk delivery",
         "tool_implementations": """
-async def send_communication(recipient: str, channel: str, message_content: str, subject: Optional[str] = None) -> Dict[str, str]:
-    \"\"\"Simulates sending a message via a communication channel.\"\"\"
-    print(f"Simulating sending message via {channel} to {recipient}: '{message_content}' (Subject: {subject})")
-    # In a real agent, this would integrate with Twilio, SendGrid, etc.
-    return {"status": "success", "message": f"Message sent via {channel} to {recipient}."}
+async def send_communication(recipient: str, channel: str, message_content: Optional[str] = None, subject: Optional[str] = None,
+                             template_id: Optional[str] = None, template_context: Optional[Dict[str, Any]] = None,
+                             idempotency_key: Optional[str] = None, template_source: Optional[str] = None) -> Dict[str, str]:
+    \"\"\"
+    Sends a message to one recipient through the rate-limited delivery engine (see delivery.py).
+    The body is message_content, a precompiled template or an inline template_source (see
+    message_templates.py); repeats within the dedup window are suppressed.
+    \"\"\"
+    # Providers are simulated by StubProvider; real ones (Twilio, SendGrid, etc.) plug into DELIVERY.
+    outcome = (await DELIVERY.deliver([recipient], message_content, channel, subject, template_id, template_context, idempotency_key, template_source))["results"][0]
+    return {"status": outcome["status"], "message": outcome.get("message") or outcome.get("error", "")}
+
+async def send_bulk_communication(recipients: List[Any], message_content: Optional[str] = None, channel: str = "email", subject: Optional[str] = None,
+                                  template_id: Optional[str] = None, template_context: Optional[Dict[str, Any]] = None,
+                                  idempotency_key: Optional[str] = None, template_source: Optional[str] = None) -> Dict[str, Any]:
+    \"\"\"
+    Sends one message to many recipients in a single tool call. Recipients are grouped
+    by channel and throttled per provider; per-recipient status comes back in one result.
+    \"\"\"
+    logger.info("Delivering message", extra={"channel": channel, "recipients": len(recipients), "subject": subject})
+    return await DELIVERY.deliver(recipients, message_content, channel, subject, template_id, template_context, idempotency_key, template_source)
 """,
         "tool_dispatch_logic": """
 if tool_call_payload.tool_name == "send_communication":
@@ -26,7 +43,21 @@ if tool_call_payload.tool_name == "send_communication":
     channel = tool_call_payload.tool_arguments.get("channel")
     message_content = tool_call_payload.tool_arguments.get("message_content")
     subject = tool_call_payload.tool_arguments.get("subject")
-    result = await send_communication(recipient, channel, message_content, subject)
+    template_id = tool_call_payload.tool_arguments.get("template_id")
+    template_context = tool_call_payload.tool_arguments.get("template_context")
+    idempotency_key = tool_call_payload.tool_arguments.get("idempotency_key")
+    template_source = tool_call_payload.tool_arguments.get("template_source")
+    result = await send_communication(recipient, channel, message_content, subject, template_id, template_context, idempotency_key, template_source)
+elif tool_call_payload.tool_name == "send_bulk_communication":
+    recipients = tool_call_payload.tool_arguments.get("recipients", [])
+    message_content = tool_call_payload.tool_arguments.get("message_content")
+    channel = tool_call_payload.tool_arguments.get("channel", "email")
+    subject = tool_call_payload.tool_arguments.get("subject")
+    template_id = tool_call_payload.tool_arguments.get("template_id")
+    template_context = tool_call_payload.tool_arguments.get("template_context")
+    idempotency_key = tool_call_payload.tool_arguments.get("idempotency_key")
+    template_source = tool_call_payload.tool_arguments.get("template_source")
+    result = await send_bulk_communication(recipients, message_content, channel, subject, template_id, template_context, idempotency_key, template_source)
 else:
     result = {"error": f"Unknown tool: {tool_call_payload.tool_name}"}
 """
@@ -36,13 +67,15 @@ else:
         "agent_id": "gpt-agent_ops_execution-001",
         "agent_name": "Operations Execution Agent Prime",
         "agent_type": "ops_execution",
-        "agent_capabilities": "Execute safe shell commands, list files",
+        "agent_capabilities": "Execute safe shell commands, list files, batch jobs",
         "tool_implementations": """
-async def execute_shell_command(command: str, args: List[str]) -> Dict[str, str]:
+async def execute_shell_command(command: str, args: List[str], on_output=None) -> Dict[str, Any]:
     \"\"\"
     Executes a constrained shell command.
     WARNING: This is highly insecure if not carefully controlled.
     For demonstration, we whitelist simple commands.
+    Runs through the bounded executor (see executor.py): concurrency, wall-clock, CPU
+    and output-size limits apply, and output is passed to `on_output` as it is produced.
     \"\"\"
     WHILELISTED_COMMANDS = ["ls", "echo", "cat", "pwd", "date"]
     if command not in WHILELISTED_COMMANDS:
@@ -50,22 +83,43 @@ async def execute_shell_command(command: str, args: List[str]) -> Dict[str, str]
 
     full_command = [command] + args
     try:
-        process = await asyncio.create_subprocess_exec(
-            *full_command,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True
-        )
-        stdout, stderr = await process.communicate()
-
-        if process.returncode == 0:
-            return {"stdout": stdout.strip(), "stderr": stderr.strip(), "success": True}
-        else:
-            return {"stdout": stdout.strip(), "stderr": stderr.strip(), "success": False, "return_code": process.returncode}
+        return await EXECUTOR.run(full_command, on_output=on_output)
     except FileNotFoundError:
         return {"error": f"Command '{command}' not found. Check if it's installed and in PATH."}
     except Exception as e:
         return {"error": f"An unexpected error occurred during command execution: {e}"}
+
+async def execute_batch(commands: List[Dict[str, Any]], max_parallel: Optional[int] = None, make_on_output=None) -> Dict[str, Any]:
+    \"\"\"
+    Runs several whitelisted commands as one job (see batch.py). Each entry is
+    {"id", "command", "args", "depends_on"}; independent commands run in parallel, at
+    most max_parallel at a time, and dependents of a failed command are skipped.
+    `make_on_output(step_id)` optionally returns a streaming callback per command.
+    \"\"\"
+    async def run_step(step: Dict[str, Any]) -> Dict[str, Any]:
+        args = step.get("args", [])
+        if isinstance(args, str): # Handle single string arg
+            args = [args]
+        on_output = make_on_output(str(step.get("id"))) if make_on_output else None
+        return await execute_shell_command(step.get("command"), args, on_output=on_output)
+
+    steps = [{"id": index, **step} for index, step in enumerate(commands)]
+    logger.info("Executing batch", extra={"steps": len(steps)})
+    return await run_batch(steps, run_step, max_parallel or EXECUTOR.max_concurrency)
+
+def make_output_streamer(redis_conn: redis.Redis, request_id: Optional[str], step_id: Optional[str] = None):
+    \"\"\"Returns an on_output callback that publishes output chunks to the orchestrator inbox.\"\"\"
+    sequence = [0]
+
+    async def publish_chunk(stream_name: str, data: str):
+        payload = {"request_id": request_id, "stream": stream_name, "seq": sequence[0], "data": data}
+        if step_id is not None:
+            payload["step_id"] = step_id
+        chunk_message = RedisMessage(sender_id=AGENT_ID, message_type="stream", payload=payload)
+        sequence[0] += 1
+        await redis_conn.publish(PUBSUB_CHANNEL_ORCHESTRATOR_INBOX, encode_bus_message(chunk_message))
+
+    return publish_chunk
 """,
         "tool_dispatch_logic": """
 if tool_call_payload.tool_name == "execute_shell_command":
@@ -73,7 +127,12 @@ if tool_call_payload.tool_name == "execute_shell_command":
     args = tool_call_payload.tool_arguments.get("args", [])
     if isinstance(args, str): # Handle single string arg
         args = [args]
-    result = await execute_shell_command(command, args)
+    result = await execute_shell_command(command, args, on_output=make_output_streamer(redis_conn, msg.payload.get("request_id")))
+elif tool_call_payload.tool_name == "execute_batch":
+    commands = tool_call_payload.tool_arguments.get("commands", [])
+    max_parallel = tool_call_payload.tool_arguments.get("max_parallel")
+    request_id = msg.payload.get("request_id")
+    result = await execute_batch(commands, max_parallel, make_on_output=lambda step_id: make_output_streamer(redis_conn, request_id, step_id))
 else:
     result = {"error": f"Unknown tool: {tool_call_payload.tool_name}"}
 """
@@ -87,7 +146,7 @@ else:
         "tool_implementations": """
 async def perform_research(query: str, source: str = "web_mock") -> Dict[str, str]:
     \"\"\"Performs a simulated research lookup.\"\"\"
-    print(f"Performing research for query: '{query}' from source: '{source}'")
+    logger.info("Performing research", extra={"query": query, "source": source})
     if source == "web_mock":
         if "AI-driven services" in query.lower():
             return {"result": "AI-driven services are rapidly expanding, particularly in logistics and automation. Increased demand is projected over the next 5 years.", "source": "simulated_web_search"}
@@ -108,12 +167,20 @@ async def perform_research(query: str, source: str = "web_mock") -> Dict[str, st
             return {"error": "Internal document 'report_q2_2025.txt' not found.", "source": "internal_document_error"}
     else:
         return {"error": f"Unknown research source: {source}", "source": "invalid_source"}
+
+async def process_file(file_id: int, file_path: str, file_name: Optional[str] = None, metadata: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    \"\"\"Simulated ingestion of an uploaded file; Nexus sends this on upload and reprocess.\"\"\"
+    logger.info("Processing file", extra={"file_id": file_id, "file_path": file_path})
+    return {"file_id": file_id, "file_name": file_name, "status": "processed", "source": "simulated_ingestion"}
 """,
         "tool_dispatch_logic": """
 if tool_call_payload.tool_name == "perform_research":
     query = tool_call_payload.tool_arguments.get("query")
     source = tool_call_payload.tool_arguments.get("source", "web_mock")
     result = await perform_research(query, source)
+elif tool_call_payload.tool_name == "process_file":
+    arguments = tool_call_payload.tool_arguments
+    result = await process_file(arguments.get("file_id"), arguments.get("file_path"), arguments.get("file_name"), arguments.get("metadata"))
 else:
     result = {"error": f"Unknown tool: {tool_call_payload.tool_name}"}
 """
@@ -126,21 +193,20 @@ else:
         "agent_capabilities": "Task planning, request analysis",
         "tool_implementations": """
 async def plan_task(request: str) -> Dict[str, Any]:
-    \"\"\"Simulates planning a task based on a high-level request.\"\"\"
-    print(f"Strategy Agent received request to plan: '{request}'")
-    if "research topic X and email client Y" in request.lower():
-        plan = [
-            {"tool_name": "perform_research", "tool_arguments": {"query": "topic X", "source": "internal_docs"}},
-            {"tool_name": "send_communication", "tool_arguments": {"recipient": "client Y", "channel": "email", "message_content": "Research results for topic X: [research_result_placeholder]"}}
-        ]
-        return {"plan": plan, "description": "Planned research and email task."}
-    elif "list all agents" in request.lower():
-        plan = [
-            {"tool_name": "get_agent_status", "tool_arguments": {"agent_id": "all"}}
-        ]
-        return {"plan": plan, "description": "Planned to list all agents."}
-    else:
-        return {"plan": [], "description": f"No specific plan defined for: '{request}'. Needs manual review."}
+    \"\"\"
+    Plans a task from a high-level request. Recurring requests are answered from a
+    persisted plan template (see plan_templates.py); everything else goes through
+    the rule-indexed planner (see planner.py) and successful plans become templates.
+    \"\"\"
+    logger.info("Received planning request", extra={"request": request})
+    templated = await PLAN_TEMPLATES.lookup(request)
+    if templated is not None:
+        logger.info("Instantiated plan template", extra={"template_signature": templated["template_signature"]})
+        return templated
+    result = PLANNER.plan(request)
+    logger.info("Planned request", extra={"request": request, "planning_latency_ms": result["planning_latency_ms"], "cache_hit": result["cache_hit"]})
+    PLAN_TEMPLATES.remember(request, result)
+    return result
 """,
         "tool_dispatch_logic": """
 if tool_call_payload.tool_name == "plan_task":
@@ -164,6 +230,15 @@ dockerfile_template = env.get_template("Dockerfile.j2")
 requirements_template = env.get_template("requirements.txt.j2")
 agent_app_template = env.get_template("agent_app.py.j2")
 
+# Modules shared by Nexus and every agent; each agent image gets its own copy.
+SHARED_MODULES = [
+    os.path.join("gpt-nexus", "app", "agent_load.py"),
+    os.path.join("gpt-nexus", "app", "async_logging.py"),
+    os.path.join("gpt-nexus", "app", "bus_codec.py"),
+    os.path.join("gpt-nexus", "app", "claim_check.py"),
+    os.path.join("gpt-nexus", "app", "tracing.py"),
+]
+
 # --- Agent Generation Logic ---
 def generate_agent_files():
     for agent_data in AGENTS_CONFIG:
@@ -204,6 +279,11 @@ Top Shelf Service LLC is well-positioned to capitalize on this with its Nexus sy
             f.write(agent_app_content)
         print(f"Generated agent_app.py for {agent_data['agent_id_prefix']}")
 
+        # Copy shared modules
+        for module_path in SHARED_MODULES:
+            shutil.copyfile(os.path.join(script_dir, module_path), os.path.join(agent_dir, os.path.basename(module_path)))
+        print(f"Copied shared modules for {agent_data['agent_id_prefix']}")
+
 # --- Main Execution ---
 if __name__ == "__main__":
     # Ensure Jinja2 is installed
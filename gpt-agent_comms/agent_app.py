@@ -1,20 +1,25 @@
 # gpt-agent_comms/agent_app.py
 import asyncio
-import httpx
 import redis.asyncio as redis
 import os
-import json
-from datetime import datetime
-from pydantic import BaseModel, Field
-from typing import Dict, Any, List, Optional
+import logging
+import time
+from pydantic import BaseModel, Field, ValidationError
+from typing import Dict, Any, List, Optional, Set
+from agent_load import LoadTracker # Copied from gpt-nexus/app by generate_agents.py
+from async_logging import configure_logging, shutdown_logging # Copied from gpt-nexus/app by generate_agents.py
+from bus_codec import DEFAULT_CODEC, decode_message, frame_codec, get_codec, supported_codecs # Copied from gpt-nexus/app by generate_agents.py
+from claim_check import ClaimCheckStore # Copied from gpt-nexus/app by generate_agents.py
+from tracing import Tracer, build_exporters # Copied from gpt-nexus/app by generate_agents.py
+from delivery import DeliveryEngine, IdempotencyStore # Batched, rate-limited delivery, lives next to this file
 
 # --- Agent Configuration ---
-AGENT_ID = "gpt-agent_comms-001"
+AGENT_ID = os.getenv("AGENT_ID", "gpt-agent_comms-001") # Replicas started by the Nexus autoscaler get their own id
 AGENT_NAME = "Communication Agent Prime"
 AGENT_TYPE = "comms"
-AGENT_CAPABILITIES = "Send SMS, Email, Real-time Chat"
+AGENT_CAPABILITIES = "Send SMS, Email, Real-time Chat, Bulk delivery"
 
-NEXUS_ORCHESTRATOR_URL = "http://gpt-nexus:8000"
+NEXUS_ORCHESTRATOR_URL = os.getenv("NEXUS_ORCHESTRATOR_URL", "http://gpt-nexus:8000")
 HEARTBEAT_INTERVAL_SECONDS = 10
 
 REDIS_HOST = os.getenv("REDIS_HOST", "redis")
@@ -22,6 +27,26 @@ REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
 
 PUBSUB_CHANNEL_ORCHESTRATOR_INBOX = "orchestrator_inbox"
 PUBSUB_CHANNEL_AGENT_COMMANDS = f"agent_commands:{AGENT_ID}"
+# While no replica of the type reports load, Nexus queues commands on this list instead.
+# BRPOP hands each command to exactly one replica; a pub/sub channel would reach them all.
+AGENT_TYPE_COMMAND_QUEUE = "agent_queue:gpt-agent_comms"
+# Commands this replica takes from the type's queue before some of them finish; the rest stay queued for other replicas.
+COMMAND_QUEUE_PREFETCH = int(os.getenv("COMMAND_QUEUE_PREFETCH", 16))
+
+# Records go through a queue to a writer thread; see async_logging.py for LOG_* settings.
+logger = logging.getLogger("agent")
+
+# Plain JSON until Nexus answers a heartbeat with the negotiated codec.
+BUS_CODEC = get_codec(DEFAULT_CODEC)
+# Large values in results go to the claim-check store; the bus carries references.
+CLAIMS = ClaimCheckStore(redis.Redis(host=REDIS_HOST, port=REDIS_PORT))
+# Spans for each command; finished spans also travel back to Nexus with the reply.
+TRACER = Tracer(AGENT_ID, build_exporters())
+# Load reported with each heartbeat (in-flight commands, tool latency, errors, RSS, CPU).
+LOAD = LoadTracker()
+
+# Dedup keys live in Redis so every comms replica shares the same window.
+DELIVERY = DeliveryEngine(idempotency=IdempotencyStore(redis.Redis(host=REDIS_HOST, port=REDIS_PORT)))
 
 # --- Pydantic Models (Copied for consistency) ---
 class AgentRegistration(BaseModel):
@@ -34,122 +59,241 @@ class RedisMessage(BaseModel):
     sender_id: str
     message_type: str
     payload: Dict[str, Any]
+    sent_at: float = Field(default_factory=time.time) # Lets Nexus measure inbox lag
+    traceparent: Optional[str] = None # Trace context, see tracing.py
+    spans: Optional[List[Dict[str, Any]]] = None # Spans this agent recorded for the command, sent with the reply
 
 class ToolCallPayload(BaseModel):
     tool_name: str
     tool_arguments: Dict[str, Any]
 
+def encode_bus_message(message: RedisMessage) -> bytes:
+    return BUS_CODEC.encode(message.model_dump(mode="json"))
+
 # --- Agent Specific Tool Implementations ---
 
 
-async def send_communication(recipient: str, channel: str, message_content: str, subject: Optional[str] = None) -> Dict[str, str]:
-    """Simulates sending a message via a communication channel."""
-    print(f"Simulating sending message via {channel} to {recipient}: '{message_content}' (Subject: {subject})")
-    # In a real agent, this would integrate with Twilio, SendGrid, etc.
-    return {"status": "success", "message": f"Message sent via {channel} to {recipient}."}
+async def send_communication(recipient: str, channel: str, message_content: Optional[str] = None, subject: Optional[str] = None,
+                             template_id: Optional[str] = None, template_context: Optional[Dict[str, Any]] = None,
+                             idempotency_key: Optional[str] = None, template_source: Optional[str] = None) -> Dict[str, str]:
+    """
+    Sends a message to one recipient through the rate-limited delivery engine (see delivery.py).
+    The body is message_content, a precompiled template or an inline template_source (see
+    message_templates.py); repeats within the dedup window are suppressed.
+    """
+    # Providers are simulated by StubProvider; real ones (Twilio, SendGrid, etc.) plug into DELIVERY.
+    outcome = (await DELIVERY.deliver([recipient], message_content, channel, subject, template_id, template_context, idempotency_key, template_source))["results"][0]
+    return {"status": outcome["status"], "message": outcome.get("message") or outcome.get("error", "")}
+
+async def send_bulk_communication(recipients: List[Any], message_content: Optional[str] = None, channel: str = "email", subject: Optional[str] = None,
+                                  template_id: Optional[str] = None, template_context: Optional[Dict[str, Any]] = None,
+                                  idempotency_key: Optional[str] = None, template_source: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Sends one message to many recipients in a single tool call. Recipients are grouped
+    by channel and throttled per provider; per-recipient status comes back in one result.
+    """
+    logger.info("Delivering message", extra={"channel": channel, "recipients": len(recipients), "subject": subject})
+    return await DELIVERY.deliver(recipients, message_content, channel, subject, template_id, template_context, idempotency_key, template_source)
 
 
 # --- Generic Agent Functions ---
 
+# httpx is only needed for the HTTP calls to Nexus, so it is imported on first use
+# rather than adding to the module's import time.
 async def register_agent():
+    import httpx
     async with httpx.AsyncClient() as client:
         registration_data = AgentRegistration(
             agent_id=AGENT_ID, agent_name=AGENT_NAME, agent_type=AGENT_TYPE, capabilities=AGENT_CAPABILITIES
         ).model_dump_json()
         try:
-            print(f"Attempting to register agent {AGENT_ID}...")
+            logger.info("Attempting to register agent")
             response = await client.post(f"{NEXUS_ORCHESTRATOR_URL}/agents/register", content=registration_data, headers={"Content-Type": "application/json"}, timeout=5.0)
             response.raise_for_status()
-            print(f"Agent {AGENT_ID} registered successfully.")
-        except Exception as e: print(f"Failed to register agent {AGENT_ID}: {e}")
+            logger.info("Agent registered successfully")
+        except Exception as e: logger.warning("Failed to register agent", extra={"error": str(e)})
 
 async def send_heartbeat():
+    global BUS_CODEC
+    import httpx
     async with httpx.AsyncClient() as client:
-        heartbeat_data = {"agent_id": AGENT_ID}
+        heartbeat_data = {"agent_id": AGENT_ID, "codecs": supported_codecs(), "load": LOAD.snapshot()}
         try:
-            response = await client.post(f"{NEXUS_ORCHESTRATOR_URL}/agents/heartbeat", json=heartbeat_data, timeout=5.0)
+            response = await client.post(f"{NEXUS_ORCHESTRATOR_URL}/agent/heartbeat", json=heartbeat_data, timeout=5.0)
             response.raise_for_status()
-        except Exception as e: print(f"Failed to send heartbeat for {AGENT_ID}: {e}")
+            codec_name = response.json().get("codec", DEFAULT_CODEC)
+            if codec_name != BUS_CODEC.name:
+                BUS_CODEC = get_codec(codec_name)
+                logger.info("Switched bus codec", extra={"codec": codec_name})
+        except Exception as e: logger.warning("Failed to send heartbeat", extra={"error": str(e)})
 
 async def heartbeat_task():
     while True:
         await send_heartbeat()
         await asyncio.sleep(HEARTBEAT_INTERVAL_SECONDS)
 
+async def handle_message(redis_conn: redis.Redis, source: str, data: bytes):
+    received_at = time.time()
+    logger.info(
+        "Received Redis message",
+        extra={"channel": source, "codec": frame_codec(data), "bytes": len(data), "sample_key": "bus_message"},
+    )
+
+    try:
+        envelope = decode_message(data)
+        msg = RedisMessage.model_validate(envelope)
+        if msg.message_type == "tool_command":
+            logger.info(
+                "Received tool command",
+                extra={"sender_id": msg.sender_id, "tool_name": msg.payload.get("tool_name"), "request_id": msg.payload.get("request_id")},
+            )
+            # One span per command, continuing the trace Nexus put in the envelope
+            with TRACER.span("agent.command", parent=msg.traceparent, start=received_at,
+                             attributes={"tool_name": msg.payload.get("tool_name")}) as command_span:
+                if isinstance(envelope.get("sent_at"), (int, float)):
+                    TRACER.record("agent.queue_wait", envelope["sent_at"], received_at)
+                load_started = LOAD.start()
+                try:
+                    tool_call_payload = ToolCallPayload.model_validate(await CLAIMS.resolve(msg.payload))
+                    TRACER.record("agent.deserialize", received_at, time.time())
+                    result = {}
+                    with TRACER.span("agent.tool", attributes={"tool_name": tool_call_payload.tool_name}):
+                        # --- Tool Dispatch Logic (Generated) ---
+                        
+                        if tool_call_payload.tool_name == "send_communication":
+                            recipient = tool_call_payload.tool_arguments.get("recipient")
+                            channel = tool_call_payload.tool_arguments.get("channel")
+                            message_content = tool_call_payload.tool_arguments.get("message_content")
+                            subject = tool_call_payload.tool_arguments.get("subject")
+                            template_id = tool_call_payload.tool_arguments.get("template_id")
+                            template_context = tool_call_payload.tool_arguments.get("template_context")
+                            idempotency_key = tool_call_payload.tool_arguments.get("idempotency_key")
+                            template_source = tool_call_payload.tool_arguments.get("template_source")
+                            result = await send_communication(recipient, channel, message_content, subject, template_id, template_context, idempotency_key, template_source)
+                        elif tool_call_payload.tool_name == "send_bulk_communication":
+                            recipients = tool_call_payload.tool_arguments.get("recipients", [])
+                            message_content = tool_call_payload.tool_arguments.get("message_content")
+                            channel = tool_call_payload.tool_arguments.get("channel", "email")
+                            subject = tool_call_payload.tool_arguments.get("subject")
+                            template_id = tool_call_payload.tool_arguments.get("template_id")
+                            template_context = tool_call_payload.tool_arguments.get("template_context")
+                            idempotency_key = tool_call_payload.tool_arguments.get("idempotency_key")
+                            template_source = tool_call_payload.tool_arguments.get("template_source")
+                            result = await send_bulk_communication(recipients, message_content, channel, subject, template_id, template_context, idempotency_key, template_source)
+                        else:
+                            result = {"error": f"Unknown tool: {tool_call_payload.tool_name}"}
+
+                        # --- End Tool Dispatch Logic ---
+
+                    with TRACER.span("agent.publish"):
+                        # Echo the request_id so Nexus can hand the result to every coalesced waiter
+                        if "request_id" in msg.payload:
+                            result = {**result, "request_id": msg.payload["request_id"]}
+                        result = await CLAIMS.offload(result)
+                        response_message = RedisMessage(
+                            sender_id=AGENT_ID, message_type="result", payload=result,
+                            traceparent=command_span.traceparent, spans=TRACER.spans_for_reply(command_span),
+                        )
+                        await redis_conn.publish(PUBSUB_CHANNEL_ORCHESTRATOR_INBOX, encode_bus_message(response_message))
+                    # Tools report some failures (unknown tool, failed command) as an "error" in the result
+                    LOAD.finish(load_started, error=bool(result.get("error")))
+                    logger.info("Sent result back to Nexus", extra={"request_id": msg.payload.get("request_id")})
+
+                except Exception as tool_error:
+                    error_msg = f"Error processing tool command in agent: {tool_error}"
+                    logger.exception(error_msg)
+                    LOAD.finish(load_started, error=True)
+                    command_span.status = "error"
+                    # Nexus retries failed commands with backoff; a command that does not validate
+                    # fails the same way every time, so it goes straight to the dead-letter queue.
+                    error_response = RedisMessage(
+                        sender_id=AGENT_ID, message_type="error",
+                        payload={
+                            "error": error_msg, "request_id": msg.payload.get("request_id"),
+                            "error_type": type(tool_error).__name__, "retryable": not isinstance(tool_error, ValidationError),
+                        },
+                        traceparent=command_span.traceparent, spans=TRACER.spans_for_reply(command_span),
+                    )
+                    await redis_conn.publish(PUBSUB_CHANNEL_ORCHESTRATOR_INBOX, encode_bus_message(error_response))
+
+        else:
+            logger.warning("Received unhandled message type", extra={"message_type": msg.message_type})
+
+    except Exception as parse_error:
+        logger.error("Error parsing Redis message", extra={"error": str(parse_error), "raw": repr(data[:200])})
+
+# Each command runs in a task of its own, so a slow tool does not hold up the next message.
+# Parallel work is bounded by the tools themselves (e.g. the ops executor's semaphore).
+COMMAND_TASKS: Set[asyncio.Task] = set()
+
+def spawn_command(redis_conn: redis.Redis, source: str, data: bytes) -> asyncio.Task:
+    task = asyncio.create_task(handle_message(redis_conn, source, data))
+    COMMAND_TASKS.add(task)
+    task.add_done_callback(COMMAND_TASKS.discard)
+    return task
+
+async def cancel_commands():
+    tasks = list(COMMAND_TASKS)
+    for task in tasks: task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
 async def redis_listener(redis_conn: redis.Redis):
+    """Commands sent to this replica's own channel."""
     pubsub = redis_conn.pubsub()
     await pubsub.subscribe(PUBSUB_CHANNEL_AGENT_COMMANDS)
-    print(f"Agent {AGENT_ID} subscribed to Redis channel: {PUBSUB_CHANNEL_AGENT_COMMANDS}")
+    logger.info("Subscribed to Redis channel", extra={"channel": PUBSUB_CHANNEL_AGENT_COMMANDS})
 
     try:
         while True:
             message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
             if message:
-                channel = message['channel'].decode('utf-8')
-                data = message['data'].decode('utf-8')
-                print(f"Agent {AGENT_ID} received Redis message on channel '{channel}': {data}")
-
-                try:
-                    msg = RedisMessage.model_validate_json(data)
-                    if msg.message_type == "tool_command":
-                        print(f"Agent {AGENT_ID} received tool command from {msg.sender_id}: {msg.payload}")
-                        try:
-                            tool_call_payload = ToolCallPayload.model_validate(msg.payload)
-                            result = {}
-                            # --- Tool Dispatch Logic (Generated) ---
-                            
-if tool_call_payload.tool_name == "send_communication":
-    recipient = tool_call_payload.tool_arguments.get("recipient")
-    channel = tool_call_payload.tool_arguments.get("channel")
-    message_content = tool_call_payload.tool_arguments.get("message_content")
-    subject = tool_call_payload.tool_arguments.get("subject")
-    result = await send_communication(recipient, channel, message_content, subject)
-else:
-    result = {"error": f"Unknown tool: {tool_call_payload.tool_name}"}
-
-                            # --- End Tool Dispatch Logic ---
-
-                            response_message = RedisMessage(
-                                sender_id=AGENT_ID, message_type="result", payload=result
-                            )
-                            await redis_conn.publish(PUBSUB_CHANNEL_ORCHESTRATOR_INBOX, response_message.model_dump_json())
-                            print(f"Agent {AGENT_ID} sent result back to Nexus.")
-
-                        except Exception as tool_error:
-                            error_msg = f"Error processing tool command in agent: {tool_error}"
-                            print(error_msg)
-                            error_response = RedisMessage(sender_id=AGENT_ID, message_type="error", payload={"error": error_msg})
-                            await redis_conn.publish(PUBSUB_CHANNEL_ORCHESTRATOR_INBOX, error_response.model_dump_json())
-
-                    else:
-                        print(f"Agent {AGENT_ID} received unhandled message type: {msg.message_type}")
-
-                except Exception as parse_error:
-                    print(f"Error parsing Redis message in agent: {parse_error}. Raw data: {data}")
-
+                spawn_command(redis_conn, message['channel'].decode('utf-8'), message['data'])
             await asyncio.sleep(0.01)
-    except asyncio.CancelledError: print(f"Agent {AGENT_ID} Redis listener task cancelled.")
-    except Exception as e: print(f"Agent {AGENT_ID} Redis listener error: {e}")
+    except asyncio.CancelledError: logger.info("Redis listener task cancelled")
+    except Exception: logger.exception("Redis listener error")
     finally:
         if pubsub: await pubsub.unsubscribe(PUBSUB_CHANNEL_AGENT_COMMANDS)
 
+async def command_queue_listener(redis_conn: redis.Redis):
+    """Commands queued for the agent type; every replica competes for them and each is taken once."""
+    logger.info("Taking commands from the agent type's queue", extra={"queue": AGENT_TYPE_COMMAND_QUEUE})
+    slots = asyncio.Semaphore(COMMAND_QUEUE_PREFETCH)
+    try:
+        while True:
+            await slots.acquire()
+            item = await redis_conn.brpop(AGENT_TYPE_COMMAND_QUEUE, timeout=1)
+            if not item:
+                slots.release()
+                continue
+            spawn_command(redis_conn, AGENT_TYPE_COMMAND_QUEUE, item[1]).add_done_callback(lambda _: slots.release())
+    except asyncio.CancelledError: logger.info("Command queue listener task cancelled")
+    except Exception: logger.exception("Command queue listener error")
+
 async def main():
-    print(f"Starting {AGENT_NAME} ({AGENT_ID})...")
-    redis_conn = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
-    try: await redis_conn.ping(); print("Agent connected to Redis successfully!")
-    except Exception as e: print(f"Agent could not connect to Redis: {e}. Exiting."); return
+    configure_logging(AGENT_ID)
+    logger.info("Starting agent", extra={"agent_name": AGENT_NAME})
+    # No decode_responses: bus frames may be binary (see bus_codec.py).
+    redis_conn = redis.Redis(host=REDIS_HOST, port=REDIS_PORT)
+    try: await redis_conn.ping(); logger.info("Connected to Redis")
+    except Exception as e: logger.error("Could not connect to Redis, exiting", extra={"error": str(e)}); shutdown_logging(); return
 
     await register_agent()
-    heartbeat_task_obj = asyncio.create_task(heartbeat_task())
-    redis_listener_task_obj = asyncio.create_task(redis_listener(redis_conn))
+    tasks = [
+        asyncio.create_task(heartbeat_task()),
+        asyncio.create_task(redis_listener(redis_conn)),
+        asyncio.create_task(command_queue_listener(redis_conn)),
+    ]
 
-    try: await asyncio.gather(heartbeat_task_obj, redis_listener_task_obj)
-    except asyncio.CancelledError: print(f"Agent {AGENT_ID} main task cancelled.")
+    try: await asyncio.gather(*tasks)
+    except asyncio.CancelledError: logger.info("Main task cancelled")
     finally:
-        heartbeat_task_obj.cancel(); redis_listener_task_obj.cancel()
-        await asyncio.gather(heartbeat_task_obj, redis_listener_task_obj, return_exceptions=True)
-        if redis_conn: await redis_conn.close(); print("Agent Redis connection closed.")
-        print(f"Agent {AGENT_ID} shutting down.")
+        for task in tasks: task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await cancel_commands()
+        if redis_conn: await redis_conn.close(); logger.info("Redis connection closed")
+        logger.info("Agent shutting down")
+        TRACER.close()
+        shutdown_logging()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
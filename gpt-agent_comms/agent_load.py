@@ -0,0 +1,185 @@
+# gpt-nexus/app/agent_load.py
+"""
+Agent load reporting: measured in the agent, kept per agent in Nexus.
+
+In the agent, a `LoadTracker` is told when each tool command starts and
+finishes. `snapshot()` goes into every heartbeat:
+
+- in_flight and queue_depth. Each command runs in its own task, so
+  in_flight counts every command the agent has started, and queue_depth is
+  the part of it waiting behind a concurrency limit (e.g. ops commands
+  waiting on the executor's semaphore), reported by an optional callable.
+- tool latency p50/p99 and error rate over the last LOAD_LATENCY_WINDOW
+  commands, plus cumulative completed/error totals, so Nexus can also derive
+  rates.
+- last_success_at, and resident memory and CPU use of the process. RSS comes
+  from /proc/self/statm where available, otherwise peak RSS from getrusage.
+  CPU percent is process CPU time over wall time since the previous snapshot.
+
+Everything is counters and one bounded deque. The only sort happens once per
+heartbeat, on at most LOAD_LATENCY_WINDOW values.
+
+In Nexus, `LoadHistory` keeps each agent's snapshots in a time-bucketed ring
+buffer: LOAD_HISTORY_BUCKETS slots of LOAD_BUCKET_SECONDS each, with the latest
+snapshot kept per slot. Memory per agent is fixed, and reading a window never
+scans more than the ring. Agents that stop reporting are ignored after
+LOAD_STALE_SECONDS, and forgotten by prune() once their whole ring has aged
+out.
+
+This module only uses the standard library. generate_agents.py copies it into
+each agent.
+"""
+import os
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+LOAD_LATENCY_WINDOW = int(os.getenv("LOAD_LATENCY_WINDOW", 1024))
+LOAD_BUCKET_SECONDS = int(os.getenv("LOAD_BUCKET_SECONDS", 10))
+LOAD_HISTORY_BUCKETS = int(os.getenv("LOAD_HISTORY_BUCKETS", 360))  # one hour of 10s buckets
+LOAD_STALE_SECONDS = float(os.getenv("LOAD_STALE_SECONDS", 120))
+
+try:
+    _PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+except (AttributeError, ValueError, OSError):
+    _PAGE_SIZE = 4096
+
+
+def _rss_bytes() -> Optional[int]:
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        pass
+    if resource is None:
+        return None
+    # Peak, not current, RSS; kilobytes on Linux, bytes on macOS.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _cpu_seconds() -> float:
+    times = os.times()
+    return times.user + times.system
+
+
+def _percentile(ordered: List[float], fraction: float) -> float:
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class LoadTracker:
+    def __init__(self, queue_depth: Optional[Callable[[], int]] = None, window: int = LOAD_LATENCY_WINDOW):
+        self.queue_depth = queue_depth
+        self.in_flight = 0
+        self.completed_total = 0
+        self.errors_total = 0
+        self.last_success_at: Optional[float] = None
+        # (latency seconds, failed) for the most recent commands
+        self._recent: Deque[Tuple[float, bool]] = deque(maxlen=window)
+        self._last_cpu = (time.monotonic(), _cpu_seconds())
+
+    def start(self) -> float:
+        """Marks a command as started; pass the returned value to finish()."""
+        self.in_flight += 1
+        return time.perf_counter()
+
+    def finish(self, started: float, error: bool = False) -> None:
+        self.in_flight -= 1
+        self.completed_total += 1
+        self._recent.append((time.perf_counter() - started, error))
+        if error:
+            self.errors_total += 1
+        else:
+            self.last_success_at = time.time()
+
+    def _cpu_percent(self) -> float:
+        now, cpu = time.monotonic(), _cpu_seconds()
+        last_wall, last_cpu = self._last_cpu
+        self._last_cpu = (now, cpu)
+        elapsed = now - last_wall
+        return round((cpu - last_cpu) / elapsed * 100, 1) if elapsed > 0 else 0.0
+
+    def snapshot(self) -> Dict[str, Any]:
+        recent = list(self._recent)
+        latencies = sorted(latency for latency, _ in recent)
+        return {
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth() if self.queue_depth is not None else 0,
+            "latency_p50_ms": round(_percentile(latencies, 0.5) * 1000, 3) if latencies else None,
+            "latency_p99_ms": round(_percentile(latencies, 0.99) * 1000, 3) if latencies else None,
+            "error_rate": round(sum(failed for _, failed in recent) / len(recent), 4) if recent else 0.0,
+            "completed_total": self.completed_total,
+            "errors_total": self.errors_total,
+            "last_success_at": self.last_success_at,
+            "rss_bytes": _rss_bytes(),
+            "cpu_percent": self._cpu_percent(),
+        }
+
+
+class _Ring:
+    __slots__ = ("slots", "last_seen", "latest")
+
+    def __init__(self, buckets: int):
+        # bucket number (time // bucket_seconds) and the snapshot kept for it
+        self.slots: List[Optional[Tuple[int, Dict[str, Any]]]] = [None] * buckets
+        self.last_seen = 0.0
+        self.latest: Optional[Dict[str, Any]] = None
+
+
+class LoadHistory:
+    def __init__(self, bucket_seconds: int = LOAD_BUCKET_SECONDS, buckets: int = LOAD_HISTORY_BUCKETS,
+                 stale_seconds: float = LOAD_STALE_SECONDS):
+        self.bucket_seconds = bucket_seconds
+        self.buckets = buckets
+        self.stale_seconds = stale_seconds
+        self._rings: Dict[str, _Ring] = {}
+
+    def record(self, agent_id: str, load: Dict[str, Any], now: Optional[float] = None) -> None:
+        now = time.time() if now is None else now
+        ring = self._rings.get(agent_id)
+        if ring is None:
+            ring = self._rings[agent_id] = _Ring(self.buckets)
+        bucket = int(now // self.bucket_seconds)
+        snapshot = {**load, "at": now}
+        ring.slots[bucket % self.buckets] = (bucket, snapshot)
+        ring.last_seen = now
+        ring.latest = snapshot
+
+    def history(self, agent_id: str, window_seconds: Optional[float] = None, now: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Snapshots for `agent_id` within the window (the whole ring by default), oldest first."""
+        ring = self._rings.get(agent_id)
+        if ring is None:
+            return []
+        now = time.time() if now is None else now
+        newest = int(now // self.bucket_seconds)
+        span = self.buckets if window_seconds is None else min(self.buckets, int(window_seconds // self.bucket_seconds) + 1)
+        oldest = newest - span + 1
+        entries = [slot for slot in ring.slots if slot is not None and oldest <= slot[0] <= newest]
+        return [snapshot for _, snapshot in sorted(entries, key=lambda slot: slot[0])]
+
+    def latest(self, agent_id: str, now: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """The most recent snapshot, or None if the agent is unknown or stale."""
+        ring = self._rings.get(agent_id)
+        now = time.time() if now is None else now
+        if ring is None or now - ring.last_seen > self.stale_seconds:
+            return None
+        return ring.latest
+
+    def agents(self, prefix: str = "", now: Optional[float] = None) -> List[str]:
+        """Agents (optionally of one type, by id prefix) that reported within LOAD_STALE_SECONDS."""
+        now = time.time() if now is None else now
+        return [agent_id for agent_id, ring in self._rings.items()
+                if agent_id.startswith(prefix) and now - ring.last_seen <= self.stale_seconds]
+
+    def prune(self, now: Optional[float] = None) -> int:
+        """Forgets agents that have not reported for a full ring. Returns how many were dropped."""
+        now = time.time() if now is None else now
+        horizon = self.bucket_seconds * self.buckets
+        stale = [agent_id for agent_id, ring in self._rings.items() if now - ring.last_seen > horizon]
+        for agent_id in stale:
+            del self._rings[agent_id]
+        return len(stale)
@@ -0,0 +1,266 @@
+# gpt-agent_comms/delivery.py
+"""
+Batched, rate-limited outbound delivery for the Communication Agent.
+
+A delivery request carries a list of recipients. Recipients are grouped by
+channel and each group is sent through that channel's provider, throttled by a
+per-provider token bucket and capped by a per-provider concurrency limit. The
+per-recipient outcomes are aggregated into a single result.
+
+Message bodies can come from precompiled templates (see message_templates.py),
+and an idempotency store suppresses duplicate sends within a time window, so a
+retried plan does not message the same recipient twice.
+
+Real providers (SendGrid, Twilio, ...) plug in by subclassing `Provider`. The
+default `StubProvider` only logs, which keeps local runs and tests offline.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Union
+
+from message_templates import MessageRenderer
+
+COMMS_DEDUP_WINDOW_SECONDS = int(os.getenv("COMMS_DEDUP_WINDOW_SECONDS", 600))
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Async token bucket: `rate` tokens per second, bursts of up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class IdempotencyStore:
+    """
+    Remembers idempotency keys for `window_seconds`. Uses Redis (SET NX EX) when a
+    client is given, so every agent replica shares the same window; otherwise keys
+    are kept in process memory.
+    """
+
+    def __init__(self, redis=None, window_seconds: int = COMMS_DEDUP_WINDOW_SECONDS, namespace: str = "comms:idempotency"):
+        self.redis = redis
+        self.window_seconds = window_seconds
+        self.namespace = namespace
+        self._local: Dict[str, float] = {}
+
+    async def claim(self, key: str) -> bool:
+        """Returns True if `key` was not seen within the window (and claims it)."""
+        if self.redis is not None:
+            try:
+                return bool(await self.redis.set(f"{self.namespace}:{key}", "1", nx=True, ex=self.window_seconds))
+            except Exception as e:
+                logger.warning("Idempotency store unavailable, falling back to local window", extra={"error": str(e)})
+        now = time.monotonic()
+        if len(self._local) > 10000:
+            self._local = {k: expiry for k, expiry in self._local.items() if expiry > now}
+        expiry = self._local.get(key)
+        if expiry is not None and expiry > now:
+            return False
+        self._local[key] = now + self.window_seconds
+        return True
+
+    async def release(self, key: str) -> None:
+        """Forgets `key`, e.g. after a failed send, so a retry is allowed through."""
+        self._local.pop(key, None)
+        if self.redis is not None:
+            try:
+                await self.redis.delete(f"{self.namespace}:{key}")
+            except Exception as e:
+                logger.warning("Failed to release idempotency key", extra={"key": key, "error": str(e)})
+
+
+def make_idempotency_key(channel: str, recipient: str, message_content: str, subject: Optional[str]) -> str:
+    return hashlib.sha256(f"{channel}|{recipient}|{subject or ''}|{message_content}".encode("utf-8")).hexdigest()
+
+
+class Provider(ABC):
+    name = "base"
+
+    @abstractmethod
+    async def send(self, recipient: str, message_content: str, subject: Optional[str] = None) -> Dict[str, Any]:
+        """Sends one message; returns at least {"status": "success"} on success."""
+
+
+class StubProvider(Provider):
+    """Local provider that only logs. `latency_seconds` simulates a remote API call."""
+
+    def __init__(self, name: str, latency_seconds: float = 0.0):
+        self.name = name
+        self.latency_seconds = latency_seconds
+        self.sent: List[Dict[str, Any]] = []
+
+    async def send(self, recipient: str, message_content: str, subject: Optional[str] = None) -> Dict[str, Any]:
+        if self.latency_seconds:
+            await asyncio.sleep(self.latency_seconds)
+        logger.info("Simulating send", extra={"provider": self.name, "recipient": recipient, "subject": subject, "content": message_content})
+        self.sent.append({"recipient": recipient, "message_content": message_content, "subject": subject})
+        return {"status": "success", "message": f"Message sent via {self.name} to {recipient}."}
+
+
+# Per-channel limits: sends per second (token bucket rate) and concurrent in-flight sends.
+DEFAULT_PROVIDER_LIMITS: Dict[str, Dict[str, float]] = {
+    "email": {"rate_per_second": float(os.getenv("COMMS_EMAIL_RATE_PER_SECOND", 50)), "concurrency": int(os.getenv("COMMS_EMAIL_CONCURRENCY", 10))},
+    "sms": {"rate_per_second": float(os.getenv("COMMS_SMS_RATE_PER_SECOND", 10)), "concurrency": int(os.getenv("COMMS_SMS_CONCURRENCY", 5))},
+    "chat": {"rate_per_second": float(os.getenv("COMMS_CHAT_RATE_PER_SECOND", 20)), "concurrency": int(os.getenv("COMMS_CHAT_CONCURRENCY", 5))},
+}
+FALLBACK_PROVIDER_LIMITS = {"rate_per_second": 10.0, "concurrency": 5}
+
+
+class DeliveryEngine:
+    def __init__(
+        self,
+        providers: Optional[Dict[str, Provider]] = None,
+        limits: Optional[Dict[str, Dict[str, float]]] = None,
+        renderer: Optional[MessageRenderer] = None,
+        idempotency: Optional[IdempotencyStore] = None,
+    ):
+        self.providers: Dict[str, Provider] = providers if providers is not None else {}
+        self.limits = limits if limits is not None else DEFAULT_PROVIDER_LIMITS
+        self.renderer = renderer if renderer is not None else MessageRenderer()
+        self.idempotency = idempotency if idempotency is not None else IdempotencyStore()
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    def _provider_for(self, channel: str) -> Provider:
+        provider = self.providers.get(channel)
+        if provider is None:
+            provider = self.providers[channel] = StubProvider(channel)
+        return provider
+
+    def _throttle_for(self, channel: str):
+        if channel not in self._buckets:
+            limits = self.limits.get(channel, FALLBACK_PROVIDER_LIMITS)
+            self._buckets[channel] = TokenBucket(limits["rate_per_second"])
+            self._semaphores[channel] = asyncio.Semaphore(int(limits["concurrency"]))
+        return self._buckets[channel], self._semaphores[channel]
+
+    async def _send_one(
+        self, channel: str, recipient: str, message_content: str, subject: Optional[str], idempotency_key: Optional[str]
+    ) -> Dict[str, Any]:
+        outcome = {"recipient": recipient, "channel": channel}
+        key = idempotency_key or make_idempotency_key(channel, recipient, message_content, subject)
+        if not await self.idempotency.claim(key):
+            outcome.update({"status": "duplicate", "message": "Suppressed duplicate send within the dedup window."})
+            return outcome
+
+        bucket, semaphore = self._throttle_for(channel)
+        try:
+            await bucket.acquire()
+            async with semaphore:
+                sent = await self._provider_for(channel).send(recipient, message_content, subject)
+            outcome.update(sent)
+        except Exception as e:
+            outcome.update({"status": "failed", "error": str(e)})
+        if outcome.get("status") != "success":
+            await self.idempotency.release(key)
+        return outcome
+
+    async def _deliver_entry(
+        self,
+        channel: str,
+        entry: Dict[str, Any],
+        message_content: Optional[str],
+        subject: Optional[str],
+        template_id: Optional[str],
+        template_context: Dict[str, Any],
+        idempotency_key: Optional[str],
+        template_source: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        recipient = entry["recipient"]
+        context = {**template_context, **entry.get("template_context", {})}
+        try:
+            if "message_content" in entry:
+                body = entry["message_content"]
+            elif entry.get("template_id", template_id):
+                body = self.renderer.render(entry.get("template_id", template_id), context)
+            elif entry.get("template_source", template_source):
+                body = self.renderer.render_inline(entry.get("template_source", template_source), context)
+            elif message_content is not None:
+                body = message_content
+            else:
+                raise ValueError("One of message_content, template_id or template_source is required.")
+        except Exception as e:
+            return {"recipient": recipient, "channel": channel, "status": "failed", "error": f"Could not build message: {e}"}
+
+        key = entry.get("idempotency_key") or (f"{idempotency_key}:{channel}:{recipient}" if idempotency_key else None)
+        return await self._send_one(channel, recipient, body, entry.get("subject", subject), key)
+
+    async def deliver(
+        self,
+        recipients: List[Union[str, Dict[str, Any]]],
+        message_content: Optional[str] = None,
+        channel: str = "email",
+        subject: Optional[str] = None,
+        template_id: Optional[str] = None,
+        template_context: Optional[Dict[str, Any]] = None,
+        idempotency_key: Optional[str] = None,
+        template_source: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """
+        Sends a message to every recipient. A recipient is either an address (sent on
+        `channel`) or a dict with "recipient" and optionally "channel", "subject",
+        "message_content", "template_id", "template_source", "template_context" and
+        "idempotency_key" overrides. The body is `message_content`, or `template_id` or
+        an ad-hoc Jinja2 `template_source` rendered with `template_context`.
+        `idempotency_key` is combined with each recipient; without one, the key is
+        derived from the channel, recipient, subject and body.
+        """
+        template_context = template_context or {}
+        by_channel: Dict[str, List[Dict[str, Any]]] = {}
+        for entry in recipients:
+            if isinstance(entry, str):
+                entry = {"recipient": entry}
+            by_channel.setdefault(entry.get("channel") or channel, []).append(entry)
+
+        started = time.perf_counter()
+        groups = await asyncio.gather(*(
+            asyncio.gather(*(
+                self._deliver_entry(
+                    group_channel, entry, message_content, subject, template_id, template_context, idempotency_key, template_source
+                )
+                for entry in entries
+            ))
+            for group_channel, entries in by_channel.items()
+        ))
+        results = [outcome for group in groups for outcome in group]
+
+        sent = sum(1 for outcome in results if outcome.get("status") == "success")
+        duplicates = sum(1 for outcome in results if outcome.get("status") == "duplicate")
+        failed = len(results) - sent - duplicates
+        if failed == 0:
+            status = "success"
+        elif sent + duplicates == 0:
+            status = "failed"
+        else:
+            status = "partial"
+        return {
+            "status": status,
+            "total": len(results),
+            "sent": sent,
+            "duplicates": duplicates,
+            "failed": failed,
+            "channels": {group_channel: len(entries) for group_channel, entries in by_channel.items()},
+            "duration_ms": round((time.perf_counter() - started) * 1000, 3),
+            "results": results,
+        }
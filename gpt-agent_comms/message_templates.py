@@ -0,0 +1,58 @@
+# gpt-agent_comms/message_templates.py
+"""
+Precompiled message templates for the Communication Agent.
+
+Templates are Jinja2 sources registered under a template ID and compiled once;
+rendering a message is then a dictionary lookup plus a render call. Ad-hoc
+template sources (sent inline with a tool call) are compiled once as well and
+kept in a bounded LRU cache keyed by their source text.
+
+Inline sources come from tool arguments, so they are untrusted. They are
+compiled in Jinja2's immutable sandbox, which refuses access to private
+attributes (`__globals__`, `__class__`, ...) and to methods that modify data.
+"""
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from jinja2 import Environment, StrictUndefined, Template
+from jinja2.sandbox import ImmutableSandboxedEnvironment
+
+INLINE_TEMPLATE_CACHE_SIZE = 256
+
+BUILTIN_TEMPLATES: Dict[str, str] = {
+    "research_results": "Research results for {{ topic }}: {{ research_result }}",
+    "task_completed": "Task '{{ task_name }}' completed with status: {{ status }}.",
+    "file_processed": "Your file '{{ file_name }}' has been processed ({{ processing_status }}).",
+}
+
+
+class MessageRenderer:
+    def __init__(self, templates: Optional[Dict[str, str]] = None, inline_cache_size: int = INLINE_TEMPLATE_CACHE_SIZE):
+        # Messages are plain text (SMS, e-mail bodies), so no HTML autoescaping.
+        self._env = Environment(autoescape=False, undefined=StrictUndefined)
+        self._inline_env = ImmutableSandboxedEnvironment(autoescape=False, undefined=StrictUndefined)
+        self._compiled: Dict[str, Template] = {}
+        self._inline: "OrderedDict[str, Template]" = OrderedDict()
+        self.inline_cache_size = inline_cache_size
+        for template_id, source in (BUILTIN_TEMPLATES if templates is None else templates).items():
+            self.register(template_id, source)
+
+    def register(self, template_id: str, source: str) -> None:
+        self._compiled[template_id] = self._env.from_string(source)
+
+    def render(self, template_id: str, context: Optional[Dict[str, Any]] = None) -> str:
+        template = self._compiled.get(template_id)
+        if template is None:
+            raise KeyError(f"Unknown message template: {template_id}")
+        return template.render(context or {})
+
+    def render_inline(self, source: str, context: Optional[Dict[str, Any]] = None) -> str:
+        """Renders an untrusted template source in the sandbox; unsafe access raises jinja2's SecurityError."""
+        template = self._inline.get(source)
+        if template is None:
+            template = self._inline[source] = self._inline_env.from_string(source)
+            if len(self._inline) > self.inline_cache_size:
+                self._inline.popitem(last=False)
+        else:
+            self._inline.move_to_end(source)
+        return template.render(context or {})
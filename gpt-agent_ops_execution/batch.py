@@ -0,0 +1,97 @@
+# gpt-agent_ops_execution/batch.py
+"""
+Dependency-aware batch execution for the Operations Execution Agent.
+
+A batch is a list of steps, each {"id": ..., "command": ..., "args": [...],
+"depends_on": [ids]}. Steps whose dependencies have all succeeded start right
+away and run in parallel, at most `max_parallel` at a time. A step whose
+dependency failed (or was skipped) is skipped. The whole batch produces one
+aggregated result, so a housekeeping job is one message round trip.
+"""
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+StepRunner = Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]
+
+
+def _step_succeeded(result: Dict[str, Any]) -> bool:
+    return "error" not in result and result.get("success", False)
+
+
+def validate_batch(steps: List[Dict[str, Any]]) -> Optional[str]:
+    """Returns an error message if step ids are duplicated, dependencies are unknown or cyclic."""
+    ids = [str(step.get("id", index)) for index, step in enumerate(steps)]
+    if len(set(ids)) != len(ids):
+        return "Batch step ids must be unique."
+    known = set(ids)
+    dependencies = {}
+    for step_id, step in zip(ids, steps):
+        deps = [str(dep) for dep in step.get("depends_on", [])]
+        unknown = [dep for dep in deps if dep not in known]
+        if unknown:
+            return f"Step '{step_id}' depends on unknown steps: {unknown}"
+        dependencies[step_id] = deps
+
+    # Kahn's algorithm: if not every step can be ordered, there is a cycle.
+    remaining = {step_id: len(deps) for step_id, deps in dependencies.items()}
+    dependents: Dict[str, List[str]] = {step_id: [] for step_id in ids}
+    for step_id, deps in dependencies.items():
+        for dep in deps:
+            dependents[dep].append(step_id)
+    ready = [step_id for step_id, count in remaining.items() if count == 0]
+    ordered = 0
+    while ready:
+        step_id = ready.pop()
+        ordered += 1
+        for dependent in dependents[step_id]:
+            remaining[dependent] -= 1
+            if remaining[dependent] == 0:
+                ready.append(dependent)
+    if ordered != len(ids):
+        return "Batch dependencies contain a cycle."
+    return None
+
+
+async def run_batch(steps: List[Dict[str, Any]], run_step: StepRunner, max_parallel: int) -> Dict[str, Any]:
+    """Runs `steps` through `run_step` respecting `depends_on`; returns one aggregated result."""
+    error = validate_batch(steps)
+    if error:
+        return {"error": error}
+
+    started = time.perf_counter()
+    ids = [str(step.get("id", index)) for index, step in enumerate(steps)]
+    semaphore = asyncio.Semaphore(max(1, max_parallel))
+    loop = asyncio.get_running_loop()
+    done: Dict[str, asyncio.Future] = {step_id: loop.create_future() for step_id in ids}
+    results: Dict[str, Dict[str, Any]] = {}
+
+    async def execute(step_id: str, step: Dict[str, Any]) -> None:
+        deps = [str(dep) for dep in step.get("depends_on", [])]
+        succeeded = [await done[dep] for dep in deps]
+        if not all(succeeded):
+            failed_deps = [dep for dep, ok in zip(deps, succeeded) if not ok]
+            results[step_id] = {"status": "skipped", "reason": f"Dependencies did not succeed: {failed_deps}"}
+            done[step_id].set_result(False)
+            return
+        async with semaphore:
+            try:
+                result = await run_step(step)
+            except Exception as e:
+                result = {"error": f"An unexpected error occurred during batch step: {e}"}
+        ok = _step_succeeded(result)
+        results[step_id] = {"status": "succeeded" if ok else "failed", **result}
+        done[step_id].set_result(ok)
+
+    await asyncio.gather(*(execute(step_id, step) for step_id, step in zip(ids, steps)))
+
+    statuses = [results[step_id]["status"] for step_id in ids]
+    return {
+        "success": all(status == "succeeded" for status in statuses),
+        "total": len(ids),
+        "succeeded": statuses.count("succeeded"),
+        "failed": statuses.count("failed"),
+        "skipped": statuses.count("skipped"),
+        "duration_ms": round((time.perf_counter() - started) * 1000, 3),
+        "results": [{"id": step_id, **results[step_id]} for step_id in ids],
+    }
@@ -0,0 +1,181 @@
+# gpt-agent_ops_execution/executor.py
+"""
+Bounded, streaming subprocess execution for the Operations Execution Agent.
+
+- At most `max_concurrency` commands run at once; the rest queue on a semaphore,
+  so a burst of hundreds of calls cannot exhaust processes or file descriptors.
+- stdout/stderr are read incrementally and handed to an `on_output` callback in
+  line-aligned chunks as they are produced, instead of being buffered until exit.
+- Retained output is capped per stream (`max_output_bytes`); anything beyond the
+  cap is drained and dropped so the child never blocks on a full pipe.
+- Each command gets a wall-clock timeout (the process is killed when it expires)
+  and an RLIMIT_CPU limit in seconds of CPU time.
+- Read-only commands (ls, cat, pwd, date, echo) are answered in-process when the
+  arguments allow it (see native_commands.py); everything else is a subprocess.
+"""
+import asyncio
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from native_commands import run_native
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+OPS_MAX_CONCURRENCY = int(os.getenv("OPS_MAX_CONCURRENCY", 16))
+OPS_TIMEOUT_SECONDS = float(os.getenv("OPS_TIMEOUT_SECONDS", 30))
+OPS_CPU_LIMIT_SECONDS = int(os.getenv("OPS_CPU_LIMIT_SECONDS", 10))
+OPS_MAX_OUTPUT_BYTES = int(os.getenv("OPS_MAX_OUTPUT_BYTES", 1024 * 1024))
+OPS_STREAM_CHUNK_BYTES = int(os.getenv("OPS_STREAM_CHUNK_BYTES", 8192))
+OPS_NATIVE_COMMANDS = os.getenv("OPS_NATIVE_COMMANDS", "1") == "1"
+
+# Receives (stream_name, text) for each line-aligned chunk of output.
+OutputCallback = Callable[[str, str], Awaitable[None]]
+
+
+class _StreamCollector:
+    def __init__(self, name: str, max_bytes: int, on_output: Optional[OutputCallback]):
+        self.name = name
+        self.max_bytes = max_bytes
+        self.on_output = on_output
+        self.chunks: List[bytes] = []
+        self.size = 0
+        self.truncated = False
+
+    async def consume(self, stream: asyncio.StreamReader, chunk_bytes: int) -> None:
+        pending = b""
+        while True:
+            data = await stream.read(chunk_bytes)
+            if not data:
+                break
+            if self.truncated:
+                continue  # keep draining so the child does not block on a full pipe
+            room = self.max_bytes - self.size
+            if len(data) > room:
+                data = data[:room]
+                self.truncated = True
+            self.chunks.append(data)
+            self.size += len(data)
+            if self.on_output is None:
+                continue
+            # Emit only complete lines; carry the partial last line into the next read.
+            pending += data
+            cut = pending.rfind(b"\n")
+            if cut != -1:
+                await self.on_output(self.name, pending[:cut + 1].decode("utf-8", errors="replace"))
+                pending = pending[cut + 1:]
+        if pending and self.on_output is not None:
+            await self.on_output(self.name, pending.decode("utf-8", errors="replace"))
+
+    def text(self) -> str:
+        return b"".join(self.chunks).decode("utf-8", errors="replace")
+
+
+class CommandExecutor:
+    def __init__(
+        self,
+        max_concurrency: int = OPS_MAX_CONCURRENCY,
+        timeout_seconds: float = OPS_TIMEOUT_SECONDS,
+        cpu_limit_seconds: int = OPS_CPU_LIMIT_SECONDS,
+        max_output_bytes: int = OPS_MAX_OUTPUT_BYTES,
+        chunk_bytes: int = OPS_STREAM_CHUNK_BYTES,
+        native_commands: bool = OPS_NATIVE_COMMANDS,
+    ):
+        self.max_concurrency = max_concurrency
+        self.timeout_seconds = timeout_seconds
+        self.cpu_limit_seconds = cpu_limit_seconds
+        self.max_output_bytes = max_output_bytes
+        self.chunk_bytes = chunk_bytes
+        self.native_commands = native_commands
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.in_flight = 0
+        self.queued = 0 # Calls waiting for a free slot; reported as the agent's queue depth
+        self.stats = {"executed": 0, "native": 0, "timed_out": 0, "truncated": 0}
+
+    def _limit_cpu(self, pid: int) -> None:
+        # prlimit() applies the limit after spawn, which keeps the fast vfork/posix_spawn
+        # path that a preexec_fn would disable. The window before it applies is negligible.
+        if resource is None or not hasattr(resource, "prlimit") or self.cpu_limit_seconds <= 0:
+            return
+        try:
+            resource.prlimit(pid, resource.RLIMIT_CPU, (self.cpu_limit_seconds, self.cpu_limit_seconds + 1))
+        except (OSError, ValueError):
+            pass  # the process may already have exited
+
+    async def run(
+        self,
+        argv: List[str],
+        on_output: Optional[OutputCallback] = None,
+        timeout_seconds: Optional[float] = None,
+        cwd: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """
+        Runs `argv` (no shell) and returns stdout, stderr, success and return_code, plus
+        `truncated`, `timed_out` and `duration_ms`. Raises FileNotFoundError if the
+        executable does not exist.
+        """
+        if self.native_commands:
+            result = await run_native(argv, cwd, self.max_output_bytes, on_output)
+            if result is not None:
+                self.stats["native"] += 1
+                self.stats["truncated"] += int(result["truncated"])
+                return result
+
+        timeout = self.timeout_seconds if timeout_seconds is None else timeout_seconds
+        # Acquired by hand rather than with `async with` so callers waiting for a slot can be counted.
+        self.queued += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.queued -= 1
+        try:
+            self.in_flight += 1
+            started = time.perf_counter()
+            try:
+                process = await asyncio.create_subprocess_exec(
+                    *argv,
+                    stdin=asyncio.subprocess.DEVNULL,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.PIPE,
+                    cwd=cwd,
+                )
+                self._limit_cpu(process.pid)
+                stdout = _StreamCollector("stdout", self.max_output_bytes, on_output)
+                stderr = _StreamCollector("stderr", self.max_output_bytes, on_output)
+                timed_out = False
+                readers = asyncio.gather(
+                    stdout.consume(process.stdout, self.chunk_bytes),
+                    stderr.consume(process.stderr, self.chunk_bytes),
+                    process.wait(),
+                )
+                try:
+                    await asyncio.wait_for(readers, timeout)
+                except asyncio.TimeoutError:
+                    timed_out = True
+                    if process.returncode is None:
+                        process.kill()
+                    await process.wait()
+            finally:
+                self.in_flight -= 1
+        finally:
+            self._semaphore.release()
+
+        truncated = stdout.truncated or stderr.truncated
+        self.stats["executed"] += 1
+        self.stats["timed_out"] += int(timed_out)
+        self.stats["truncated"] += int(truncated)
+        result: Dict[str, Any] = {
+            "stdout": stdout.text().strip(),
+            "stderr": stderr.text().strip(),
+            "success": process.returncode == 0 and not timed_out,
+            "return_code": process.returncode,
+            "truncated": truncated,
+            "timed_out": timed_out,
+            "duration_ms": round((time.perf_counter() - started) * 1000, 3),
+        }
+        if timed_out:
+            result["stderr"] = (result["stderr"] + f"\nCommand timed out after {timeout}s and was killed.").strip()
+        return result
@@ -0,0 +1,194 @@
+# gpt-agent_ops_execution/native_commands.py
+"""
+In-process implementations of the read-only whitelisted commands.
+
+`ls`, `cat`, `pwd`, `date` and `echo` are cheap to answer without forking a
+process. Each native implementation reproduces the GNU coreutils output (to a
+pipe, in the C locale) for the argument forms it supports, and returns None for
+anything else so the caller falls back to a real subprocess. Supported forms:
+
+- echo [-n] WORDS...
+- pwd
+- date, date +FORMAT (common strftime directives only)
+- cat FILE...
+- ls [PATH...]
+
+File reads go through a single preallocated buffer (readinto, no intermediate
+copies) and stop at the output cap, mirroring the subprocess path's truncation.
+"""
+import asyncio
+import os
+import re
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+NATIVE_COMMANDS = ("echo", "pwd", "date", "cat", "ls")
+
+# Operands that GNU tools print without quoting in error messages and headers.
+_SAFE_OPERAND = re.compile(r"^[A-Za-z0-9_./+@:,=-]+$")
+_C_LOCALES = {"", "C", "POSIX", "C.UTF-8", "C.utf8"}
+_DATE_FORMAT = re.compile(r"^\+(?:[^%]|%[aAbBdeHIjmMpSyYZzTFDR%])*$")
+
+# (stdout bytes, stderr text, return code, truncated)
+NativeOutcome = Tuple[bytes, str, int, bool]
+
+
+def _locale_is_c(category: str) -> bool:
+    value = os.environ.get("LC_ALL") or os.environ.get(category) or os.environ.get("LANG") or ""
+    return value in _C_LOCALES
+
+
+def _resolve(path: str, cwd: Optional[str]) -> str:
+    return path if cwd is None or os.path.isabs(path) else os.path.join(cwd, path)
+
+
+def _echo(args: List[str]) -> Optional[NativeOutcome]:
+    if args in (["--help"], ["--version"]):
+        return None
+    newline = True
+    if args and args[0] == "-n":
+        newline, args = False, args[1:]
+    # Any other leading option (-e, -E, -ne, ...) changes escape handling; use the real echo.
+    if args and re.match(r"^-[neE]+$", args[0]):
+        return None
+    text = " ".join(args) + ("\n" if newline else "")
+    return text.encode("utf-8", errors="surrogateescape"), "", 0, False
+
+
+def _pwd(args: List[str], cwd: Optional[str]) -> Optional[NativeOutcome]:
+    if args:
+        return None
+    return ((os.path.realpath(cwd) if cwd else os.getcwd()) + "\n").encode("utf-8", errors="surrogateescape"), "", 0, False
+
+
+def _date(args: List[str]) -> Optional[NativeOutcome]:
+    if not _locale_is_c("LC_TIME"):
+        return None
+    if not args:
+        fmt = "%a %b %e %H:%M:%S %Z %Y"
+    elif len(args) == 1 and _DATE_FORMAT.match(args[0]):
+        fmt = args[0][1:]
+    else:
+        return None
+    return (time.strftime(fmt) + "\n").encode("utf-8"), "", 0, False
+
+
+def _cat(args: List[str], cwd: Optional[str], max_bytes: int) -> Optional[NativeOutcome]:
+    if not args or any(not _SAFE_OPERAND.match(arg) or arg.startswith("-") for arg in args):
+        return None
+    buffer = bytearray()
+    size, truncated, code = 0, False, 0
+    errors: List[str] = []
+    for arg in args:
+        try:
+            with open(_resolve(arg, cwd), "rb", buffering=0) as handle:
+                # Size the shared buffer from fstat (+1 to see EOF without growing); files
+                # that report no size (e.g. /proc) grow it as they are read.
+                expected = os.fstat(handle.fileno()).st_size
+                while size < max_bytes:
+                    if size == len(buffer) or len(buffer) < min(max_bytes, size + expected + 1):
+                        buffer.extend(bytes(min(max_bytes, max(size + expected + 1, 2 * len(buffer), 4096)) - len(buffer)))
+                    with memoryview(buffer)[size:] as free:
+                        read = handle.readinto(free)
+                    if not read:
+                        break
+                    size += read
+                else:
+                    truncated = truncated or bool(handle.read(1))
+        except OSError as e:
+            errors.append(f"cat: {arg}: {os.strerror(e.errno)}")
+            code = 1
+    return bytes(memoryview(buffer)[:size]), "\n".join(errors), code, truncated
+
+
+def _list_directory(path: str) -> List[str]:
+    with os.scandir(path) as entries:
+        names = [entry.name for entry in entries if not entry.name.startswith(".")]
+    return sorted(names, key=os.fsencode)
+
+
+def _ls(args: List[str], cwd: Optional[str], max_bytes: int) -> Optional[NativeOutcome]:
+    # Without options only; sort order must match the C locale's byte order.
+    if any(not _SAFE_OPERAND.match(arg) or arg.startswith("-") for arg in args) or not _locale_is_c("LC_COLLATE"):
+        return None
+    operands = args or ["."]
+    errors: List[str] = []
+    code = 0
+    files: List[str] = []
+    directories: List[str] = []
+    for operand in operands:
+        resolved = _resolve(operand, cwd)
+        if os.path.isdir(resolved):
+            directories.append(operand)
+        elif os.path.lexists(resolved):
+            files.append(operand)
+        else:
+            errors.append(f"ls: cannot access '{operand}': No such file or directory")
+            code = 2
+
+    blocks: List[str] = []
+    if files:
+        blocks.append("".join(name + "\n" for name in sorted(files, key=os.fsencode)))
+    show_headers = len(operands) > 1
+    for directory in sorted(directories, key=os.fsencode):
+        try:
+            names = _list_directory(_resolve(directory, cwd))
+        except OSError as e:
+            errors.append(f"ls: cannot open directory '{directory}': {os.strerror(e.errno)}")
+            code = 2
+            continue
+        listing = "".join(name + "\n" for name in names)
+        blocks.append(f"{directory}:\n{listing}" if show_headers else listing)
+
+    output = "\n".join(blocks).encode("utf-8", errors="surrogateescape")
+    truncated = len(output) > max_bytes
+    return output[:max_bytes], "\n".join(errors), code, truncated
+
+
+def _run_native(command: str, args: List[str], cwd: Optional[str], max_bytes: int) -> Optional[NativeOutcome]:
+    if command == "echo":
+        return _echo(args)
+    if command == "pwd":
+        return _pwd(args, cwd)
+    if command == "date":
+        return _date(args)
+    if command == "cat":
+        return _cat(args, cwd, max_bytes)
+    if command == "ls":
+        return _ls(args, cwd, max_bytes)
+    return None
+
+
+async def run_native(argv: List[str], cwd: Optional[str], max_bytes: int, on_output=None) -> Optional[Dict[str, Any]]:
+    """
+    Runs `argv` in-process if it is a supported form. Returns a result shaped like
+    CommandExecutor.run(), or None if the command must go to a subprocess.
+    """
+    command, args = argv[0], list(argv[1:])
+    if command not in NATIVE_COMMANDS:
+        return None
+    started = time.perf_counter()
+    if command in ("cat", "ls"):
+        # Filesystem work runs off the event loop.
+        outcome = await asyncio.to_thread(_run_native, command, args, cwd, max_bytes)
+    else:
+        outcome = _run_native(command, args, cwd, max_bytes)
+    if outcome is None:
+        return None
+
+    stdout_bytes, stderr, code, truncated = outcome
+    stdout = stdout_bytes.decode("utf-8", errors="replace")
+    if on_output is not None:
+        if stdout:
+            await on_output("stdout", stdout)
+        if stderr:
+            await on_output("stderr", stderr + "\n")
+    return {
+        "stdout": stdout.strip(),
+        "stderr": stderr.strip(),
+        "success": code == 0,
+        "return_code": code,
+        "truncated": truncated,
+        "timed_out": False,
+        "duration_ms": round((time.perf_counter() - started) * 1000, 3),
+    }
@@ -0,0 +1,203 @@
+# gpt-nexus/app/async_logging.py
+"""
+Non-blocking structured logging for Nexus and the agents.
+
+`configure_logging()` routes the root logger through a bounded in-memory queue.
+On the calling side, a log call only checks the level, applies sampling and
+does a put_nowait(). Formatting and the stdout/file writes happen on a
+background QueueListener thread, so a slow terminal or disk never stalls the
+event loop. When the queue is full, records are dropped and counted rather
+than blocking.
+
+Settings mirror the `logging` section of agent_config.yaml:
+
+- LOG_LEVEL: minimum level, "INFO" by default.
+- LOG_JSON: "1" (the default) writes one JSON object per line; "0" writes
+  plain text for local runs.
+- LOG_FILE: also append to this file. Unset by default, so only stdout is
+  written.
+- LOG_SAMPLE_RATES: keep rates for high-frequency events, e.g.
+  "heartbeat=0.1,bus_message=0.05". A call opts in with
+  `extra={"sample_key": "heartbeat"}`. Sampling is deterministic, keeping one
+  record in every round(1 / rate), and each kept record carries "sampled": N
+  so counts can be scaled back up. Warnings and errors are never sampled.
+- LOG_QUEUE_SIZE: records buffered before new ones are dropped.
+
+Any other `extra` fields become top-level keys of the JSON record.
+
+This module only uses the standard library. generate_agents.py copies it into
+each agent.
+"""
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, WatchedFileHandler
+from typing import Dict, Optional
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_JSON = os.getenv("LOG_JSON", "1") == "1"
+LOG_FILE = os.getenv("LOG_FILE") or None
+LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", "heartbeat=0.1,bus_message=0.1")
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10000))
+
+# Attributes every LogRecord has; anything else on a record came from `extra`.
+_RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "sample_key"}
+
+
+def _extra_fields(record: logging.LogRecord) -> Dict[str, object]:
+    return {key: value for key, value in record.__dict__.items() if key not in _RECORD_ATTRIBUTES}
+
+
+def parse_sample_rates(spec: str) -> Dict[str, int]:
+    """Parses "key=rate,..." into {key: keep one in N}. A rate of 0 drops every record with that key."""
+    every = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        key, _, rate = item.partition("=")
+        try:
+            rate = float(rate)
+        except ValueError:
+            raise ValueError(f"Invalid LOG_SAMPLE_RATES entry: {item!r}")
+        every[key.strip()] = max(1, round(1 / rate)) if rate > 0 else 0  # 0: drop all
+    return every
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps one in every N records that share a sample_key. Runs on the calling thread."""
+
+    def __init__(self, sample_every: Dict[str, int]):
+        super().__init__()
+        self.sample_every = sample_every
+        self._seen: Dict[str, int] = {}
+        self.sampled_out = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        key = getattr(record, "sample_key", None)
+        if key is None or record.levelno >= logging.WARNING or key not in self.sample_every:
+            return True
+        every = self.sample_every[key]
+        seen = self._seen.get(key, 0)
+        self._seen[key] = seen + 1
+        if every == 0 or seen % every:
+            self.sampled_out += 1
+            return False
+        record.sampled = every
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def __init__(self, service: str):
+        super().__init__()
+        self.service = service
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "service": self.service,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update(_extra_fields(record))
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Human-readable lines for local runs; `extra` fields are appended as key=value."""
+
+    def __init__(self, service: str):
+        super().__init__(f"%(asctime)s %(levelname)s {service} %(name)s: %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = _extra_fields(record)
+        if not fields:
+            return line
+        head, newline, traceback = line.partition("\n")
+        return head + " " + " ".join(f"{key}={value!r}" for key, value in fields.items()) + newline + traceback
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """A QueueHandler that never blocks the caller: a full queue drops the record."""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Resolve the message now (args may change after the call returns), but leave
+        # formatting and exception rendering to the listener thread.
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_state_lock = threading.Lock()
+_listener: Optional[QueueListener] = None
+_queue_handler: Optional[NonBlockingQueueHandler] = None
+_sampling_filter: Optional[SamplingFilter] = None
+
+
+def configure_logging(
+    service: str,
+    level: str = LOG_LEVEL,
+    json_output: bool = LOG_JSON,
+    log_file: Optional[str] = LOG_FILE,
+    sample_rates: str = LOG_SAMPLE_RATES,
+    queue_size: int = LOG_QUEUE_SIZE,
+) -> None:
+    """Installs the queue handler on the root logger and starts the writer thread. Idempotent."""
+    global _listener, _queue_handler, _sampling_filter
+    with _state_lock:
+        if _listener is not None:
+            return
+        formatter = JsonFormatter(service) if json_output else TextFormatter(service)
+        handlers = [logging.StreamHandler(sys.stdout)]
+        if log_file:
+            os.makedirs(os.path.dirname(log_file) or ".", exist_ok=True)
+            handlers.append(WatchedFileHandler(log_file))  # reopens the file after logrotate moves it
+        for handler in handlers:
+            handler.setFormatter(formatter)
+
+        log_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        _queue_handler = NonBlockingQueueHandler(log_queue)
+        _sampling_filter = SamplingFilter(parse_sample_rates(sample_rates))
+        _queue_handler.addFilter(_sampling_filter)
+
+        root = logging.getLogger()
+        for existing in list(root.handlers):
+            root.removeHandler(existing)
+        root.addHandler(_queue_handler)
+        root.setLevel(level)
+
+        _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+        _listener.start()
+
+
+def shutdown_logging() -> None:
+    """Flushes queued records and stops the writer thread."""
+    global _listener
+    with _state_lock:
+        if _listener is None:
+            return
+        _listener.stop()  # drains the queue before returning
+        _listener = None
+
+
+def logging_stats() -> Dict[str, int]:
+    return {
+        "dropped": _queue_handler.dropped if _queue_handler else 0,
+        "sampled_out": _sampling_filter.sampled_out if _sampling_filter else 0,
+        "queued": _queue_handler.queue.qsize() if _queue_handler else 0,
+    }
@@ -0,0 +1,215 @@
+# gpt-agent_strategy/plan_templates.py
+"""
+Persisted, parameterized plan templates for the Strategy Agent.
+
+A request like "research topic X and email client Y" is split into a signature
+("research topic {p0} and email client {p1}") and parameters (["X", "Y"]). A
+successful plan is stored with those parameter values replaced by the same
+slots. A later request with the same signature ("... topic Z and email client W")
+is answered by filling the slots instead of re-planning.
+
+Templates are indexed in memory by signature and persisted to the
+`plan_templates` table (see gpt-nexus/app/models.py and the Alembic migrations).
+Persistence is optional: without DATABASE_URL the store is in-memory only.
+"""
+import asyncio
+import json
+import logging
+import os
+import re
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+DATABASE_URL = os.getenv("DATABASE_URL")
+
+logger = logging.getLogger(__name__)
+
+# Parameters are quoted strings, e-mail addresses, numbers and runs of
+# capitalized words that do not start the request.
+_PARAM_PATTERN = re.compile(
+    r'"[^"]+"'
+    r"|'[^']+'"
+    r"|[\w.+-]+@[\w-]+(?:\.[\w-]+)+"
+    r"|\b\d+(?:\.\d+)?\b"
+    r"|(?<!^)\b[A-Z][\w-]*(?:\s+[A-Z][\w-]*)*\b"
+)
+_SLOT_PATTERN = re.compile(r"\{p(\d+)\}")
+
+
+def extract_parameters(request: str) -> Tuple[str, List[str]]:
+    """Returns (signature, parameters) for a request."""
+    text = " ".join(request.split())
+    params: List[str] = []
+
+    def to_slot(match: "re.Match[str]") -> str:
+        params.append(match.group(0).strip("\"'"))
+        return "{p%d}" % (len(params) - 1)
+
+    signature = _PARAM_PATTERN.sub(to_slot, text)
+    # Only the literal text is case-insensitive; slots keep their exact form.
+    return signature.lower(), params
+
+
+def _map_strings(value: Any, fn) -> Any:
+    if isinstance(value, str):
+        return fn(value)
+    if isinstance(value, list):
+        return [_map_strings(item, fn) for item in value]
+    if isinstance(value, dict):
+        return {key: _map_strings(item, fn) for key, item in value.items()}
+    return value
+
+
+def templatize(plan: List[Dict[str, Any]], params: List[str]) -> List[Dict[str, Any]]:
+    """Replaces whole-word occurrences of each parameter value in the plan with its slot."""
+    # Longest values first so "Acme Corp" wins over "Acme".
+    ordered = sorted(enumerate(params), key=lambda item: len(item[1]), reverse=True)
+    patterns = [(re.compile(r"(?<!\w)" + re.escape(value) + r"(?!\w)"), "{p%d}" % index) for index, value in ordered]
+
+    def replace(text: str) -> str:
+        for pattern, slot in patterns:
+            text = pattern.sub(slot, text)
+        return text
+
+    return _map_strings(plan, replace)
+
+
+def instantiate(plan: List[Dict[str, Any]], params: List[str]) -> List[Dict[str, Any]]:
+    """Fills the slots of a templatized plan with the given parameter values."""
+    def fill(text: str) -> str:
+        return _SLOT_PATTERN.sub(lambda m: params[int(m.group(1))] if int(m.group(1)) < len(params) else m.group(0), text)
+
+    return _map_strings(plan, fill)
+
+
+class PlanTemplateStore:
+    def __init__(self, database_url: Optional[str] = DATABASE_URL):
+        self.database_url = database_url
+        self._templates: Dict[str, Dict[str, Any]] = {}
+        self._engine = None
+        self._table = None
+        self._loaded = False
+        self._load_lock = asyncio.Lock()
+        self._pending: Set[asyncio.Task] = set()
+        self.stats = {"hits": 0, "misses": 0, "saved": 0}
+
+    def _ensure_engine(self) -> bool:
+        if self._engine is not None:
+            return True
+        if not self.database_url:
+            return False
+        try:
+            from sqlalchemy import Column, DateTime, Integer, JSON, MetaData, String, Table, Text
+            from sqlalchemy.ext.asyncio import create_async_engine
+            from sqlalchemy.sql import func
+        except ImportError:
+            logger.warning("SQLAlchemy is not installed; plan templates will not be persisted.")
+            self.database_url = None
+            return False
+
+        # Mirrors PlanTemplate in gpt-nexus/app/models.py (copied for consistency).
+        self._table = Table(
+            "plan_templates", MetaData(),
+            Column("id", Integer, primary_key=True),
+            Column("signature", String(512), unique=True, nullable=False),
+            Column("plan_json", JSON, nullable=False),
+            Column("description", Text),
+            Column("rule", String(150)),
+            Column("hit_count", Integer, nullable=False, default=0),
+            Column("created_at", DateTime(timezone=True), server_default=func.now()),
+            Column("last_used_at", DateTime(timezone=True), server_default=func.now()),
+        )
+        self._engine = create_async_engine(self.database_url, pool_size=2, max_overflow=2, pool_pre_ping=True)
+        return True
+
+    async def load(self) -> None:
+        """Loads all persisted templates into the in-memory index (once)."""
+        if self._loaded:
+            return
+        async with self._load_lock:
+            if self._loaded:
+                return
+            if self._ensure_engine():
+                try:
+                    async with self._engine.connect() as conn:
+                        rows = await conn.execute(self._table.select())
+                        for row in rows.mappings():
+                            plan = row["plan_json"]
+                            self._templates[row["signature"]] = {
+                                "plan": json.loads(plan) if isinstance(plan, str) else plan,
+                                "description": row["description"],
+                                "rule": row["rule"],
+                            }
+                    logger.info("Loaded plan templates from the database", extra={"templates": len(self._templates)})
+                except Exception as e:
+                    logger.warning("Failed to load plan templates", extra={"error": str(e)})
+            self._loaded = True
+
+    async def lookup(self, request: str) -> Optional[Dict[str, Any]]:
+        """Returns an instantiated plan for `request` if a matching template exists."""
+        await self.load()
+        signature, params = extract_parameters(request)
+        template = self._templates.get(signature)
+        if template is None:
+            self.stats["misses"] += 1
+            return None
+        self.stats["hits"] += 1
+        self._persist_in_background(self._record_hit(signature))
+        return {
+            "plan": instantiate(template["plan"], params),
+            "description": template["description"],
+            "rule": template["rule"],
+            "template_signature": signature,
+        }
+
+    def remember(self, request: str, result: Dict[str, Any]) -> None:
+        """Stores a successful (non-empty) plan as a template for similar requests."""
+        if not result.get("plan"):
+            return
+        signature, params = extract_parameters(request)
+        if signature in self._templates:
+            return
+        template = {
+            "plan": templatize(result["plan"], params),
+            "description": result.get("description"),
+            "rule": result.get("rule"),
+        }
+        self._templates[signature] = template
+        self.stats["saved"] += 1
+        self._persist_in_background(self._save(signature, template))
+
+    def _persist_in_background(self, coro) -> None:
+        # Planning never waits on the database; writes happen off the hot path.
+        if not self._ensure_engine():
+            coro.close()
+            return
+        task = asyncio.create_task(coro)
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def _save(self, signature: str, template: Dict[str, Any]) -> None:
+        from sqlalchemy.dialects.postgresql import insert
+        statement = insert(self._table).values(
+            signature=signature,
+            plan_json=template["plan"],
+            description=template["description"],
+            rule=template["rule"],
+            hit_count=0,
+        ).on_conflict_do_nothing(index_elements=["signature"])
+        try:
+            async with self._engine.begin() as conn:
+                await conn.execute(statement)
+        except Exception as e:
+            logger.warning("Failed to persist plan template", extra={"signature": signature, "error": str(e)})
+
+    async def _record_hit(self, signature: str) -> None:
+        from sqlalchemy import func
+        statement = (
+            self._table.update()
+            .where(self._table.c.signature == signature)
+            .values(hit_count=self._table.c.hit_count + 1, last_used_at=func.now())
+        )
+        try:
+            async with self._engine.begin() as conn:
+                await conn.execute(statement)
+        except Exception as e:
+            logger.warning("Failed to record plan template hit", extra={"signature": signature, "error": str(e)})
@@ -0,0 +1,156 @@
+# gpt-agent_strategy/planner.py
+"""
+Rule-indexed planning engine for the Strategy Agent.
+
+Planning rules are keyword phrases mapped to plan steps. All phrases are compiled
+into a single Aho-Corasick automaton, so matching a request costs one pass over
+the request text no matter how many rules exist. When several rules match, the
+one declared first wins (same semantics as the old if/elif chain). Match results
+are cached by normalized request with LRU eviction.
+"""
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+PLAN_CACHE_SIZE = 1024
+
+
+@dataclass(frozen=True)
+class PlanRule:
+    name: str
+    phrases: Tuple[str, ...]
+    plan: Tuple[Dict[str, Any], ...]
+    description: str
+
+
+# Rules are checked in declaration order; the first matching rule wins.
+DEFAULT_RULES: List[PlanRule] = [
+    PlanRule(
+        name="research_and_email",
+        phrases=("research topic X and email client Y",),
+        plan=(
+            {"tool_name": "perform_research", "tool_arguments": {"query": "topic X", "source": "internal_docs"}},
+            {"tool_name": "send_communication", "tool_arguments": {"recipient": "client Y", "channel": "email", "message_content": "Research results for topic X: [research_result_placeholder]"}},
+        ),
+        description="Planned research and email task.",
+    ),
+    PlanRule(
+        name="list_agents",
+        phrases=("list all agents",),
+        plan=(
+            {"tool_name": "get_agent_status", "tool_arguments": {"agent_id": "all"}},
+        ),
+        description="Planned to list all agents.",
+    ),
+]
+
+
+def normalize_request(request: str) -> str:
+    return " ".join(request.lower().split())
+
+
+class AhoCorasick:
+    """Multi-pattern substring matcher. Patterns are matched case-sensitively on normalized text."""
+
+    def __init__(self, patterns: List[Tuple[str, int]]):
+        # Trie stored as parallel lists indexed by node id; node 0 is the root.
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        # Lowest rule index that ends at (or via fail links, below) each node; -1 if none.
+        self._best: List[int] = [-1]
+
+        for pattern, rule_index in patterns:
+            node = 0
+            for char in pattern:
+                nxt = self._goto[node].get(char)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[node][char] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._best.append(-1)
+                node = nxt
+            if self._best[node] == -1 or rule_index < self._best[node]:
+                self._best[node] = rule_index
+
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fallback = self._fail[node]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[child] = self._goto[fallback].get(char, 0)
+                inherited = self._best[self._fail[child]]
+                if inherited != -1 and (self._best[child] == -1 or inherited < self._best[child]):
+                    self._best[child] = inherited
+
+    def first_match(self, text: str) -> int:
+        """Returns the lowest rule index whose pattern occurs in `text`, or -1."""
+        goto, fail, best = self._goto, self._fail, self._best
+        node, found = 0, -1
+        for char in text:
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            hit = best[node]
+            if hit != -1 and (found == -1 or hit < found):
+                found = hit
+                if found == 0:
+                    break
+        return found
+
+
+@dataclass
+class PlannerStats:
+    requests: int = 0
+    cache_hits: int = 0
+    total_latency_ms: float = 0.0
+    last_latency_ms: float = 0.0
+
+
+class PlannerEngine:
+    def __init__(self, rules: Optional[List[PlanRule]] = None, cache_size: int = PLAN_CACHE_SIZE):
+        self.rules = list(DEFAULT_RULES if rules is None else rules)
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, int]" = OrderedDict()
+        self._matcher = AhoCorasick(
+            [(normalize_request(phrase), index) for index, rule in enumerate(self.rules) for phrase in rule.phrases]
+        )
+        self.stats = PlannerStats()
+
+    def _plan_for(self, request: str, index: int) -> Dict[str, Any]:
+        if index == -1:
+            return {"plan": [], "description": f"No specific plan defined for: '{request}'. Needs manual review."}
+        rule = self.rules[index]
+        return {"plan": list(rule.plan), "description": rule.description, "rule": rule.name}
+
+    def plan(self, request: str) -> Dict[str, Any]:
+        """
+        Returns the plan for `request` plus `planning_latency_ms` and `cache_hit`.
+        Plan steps are shared between calls and must be treated as read-only.
+        """
+        started = time.perf_counter()
+        normalized = normalize_request(request)
+        # The cache maps a normalized request to the index of its matching rule (-1: no match).
+        index = self._cache.get(normalized)
+        cache_hit = index is not None
+        if cache_hit:
+            self._cache.move_to_end(normalized)
+        else:
+            index = self._matcher.first_match(normalized)
+            self._cache[normalized] = index
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        result = self._plan_for(request, index)
+
+        latency_ms = (time.perf_counter() - started) * 1000
+        self.stats.requests += 1
+        self.stats.cache_hits += int(cache_hit)
+        self.stats.total_latency_ms += latency_ms
+        self.stats.last_latency_ms = latency_ms
+        result["planning_latency_ms"] = round(latency_ms, 3)
+        result["cache_hit"] = cache_hit
+        return result
@@ -0,0 +1,277 @@
+# gpt-nexus/app/tracing.py
+"""
+Lightweight distributed tracing for the Nexus -> Redis -> agent -> inbox path.
+
+Trace context travels in the bus message envelope as a W3C-style "traceparent"
+string ("00-<trace id>-<parent span id>-<flags>"), together with "sent_at" (the
+sender's wall clock), so each hop can record how long the message sat in Redis.
+A span is one timed step with a name, a parent and attributes:
+
+- Nexus: nexus.query, nexus.publish, nexus.inbox.queue_wait, nexus.inbox.handle.
+- Agents: agent.command (the local root), agent.queue_wait,
+  agent.deserialize, agent.tool, agent.publish.
+
+Finished spans go to local exporters; nothing external is needed:
+
+- "memory": a bounded ring buffer, queryable in-process. Nexus serves it at
+  /admin/traces.
+- "file": JSON lines appended to TRACE_FILE by a writer thread, so the caller
+  never blocks on disk. benchmarks/trace_report.py summarises such files.
+
+An agent also sends the spans it finished for a command back to Nexus with the
+result, so one Nexus buffer holds the whole trace, agent hops included.
+
+Settings: TRACE_EXPORTERS ("memory" by default; comma-separated, or "off"),
+TRACE_FILE, TRACE_BUFFER_SIZE, and TRACE_SAMPLE_RATE. Sampling is decided
+once, at the root of a trace, and carried in the traceparent flags, so a trace
+is either recorded at every hop or at none. Wall-clock timestamps are used so
+spans from different hosts line up; cross-host gaps include any clock skew.
+
+This module only uses the standard library. generate_agents.py copies it into
+each agent.
+"""
+import json
+import logging
+import os
+import queue
+import random
+import statistics
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from logging.handlers import QueueListener
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Optional, Tuple
+
+TRACE_EXPORTERS = os.getenv("TRACE_EXPORTERS", "memory")
+TRACE_FILE = os.getenv("TRACE_FILE", "traces.jsonl")
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", 5000))
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", 1.0))
+
+_current_span: "ContextVar[Optional[Span]]" = ContextVar("current_span", default=None)
+
+
+def _new_id(bits: int) -> str:
+    return f"{random.getrandbits(bits):0{bits // 4}x}"
+
+
+def parse_traceparent(traceparent: Optional[str]) -> Optional[Tuple[str, str, bool]]:
+    """Returns (trace_id, parent_span_id, sampled), or None if absent or malformed."""
+    if not isinstance(traceparent, str):
+        return None
+    parts = traceparent.split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        sampled = bool(int(parts[3], 16) & 0x01)
+    except ValueError:
+        return None
+    return parts[1], parts[2], sampled
+
+
+class Span:
+    __slots__ = ("name", "service", "trace_id", "span_id", "parent_id", "sampled", "start", "end",
+                 "attributes", "status", "local_root", "finished_children")
+
+    def __init__(self, name: str, service: str, trace_id: str, parent_id: Optional[str], sampled: bool,
+                 start: Optional[float] = None, attributes: Optional[Dict[str, Any]] = None,
+                 local_root: Optional["Span"] = None):
+        self.name = name
+        self.service = service
+        self.trace_id = trace_id
+        self.span_id = _new_id(64)
+        self.parent_id = parent_id
+        self.sampled = sampled
+        self.start = time.time() if start is None else start
+        self.end: Optional[float] = None
+        self.attributes = dict(attributes or {})
+        self.status = "ok"
+        self.local_root = local_root or self
+        # Finished spans under this local root, so they can be shipped with a reply.
+        self.finished_children: List[Dict[str, Any]] = []
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    def set(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def to_dict(self, end: Optional[float] = None) -> Dict[str, Any]:
+        end = self.end if end is None else end
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "service": self.service,
+            "start": self.start,
+            "duration_ms": round(((end or time.time()) - self.start) * 1000, 3),
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+class InMemoryExporter:
+    """Keeps the most recent `max_spans` finished spans."""
+
+    def __init__(self, max_spans: int = TRACE_BUFFER_SIZE):
+        self._spans: Deque[Dict[str, Any]] = deque(maxlen=max_spans)
+
+    def export(self, span: Dict[str, Any]) -> None:
+        self._spans.append(span)  # deque.append is atomic; no lock needed
+
+    def spans(self, trace_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        spans = list(self._spans)
+        if trace_id is not None:
+            spans = [span for span in spans if span["trace_id"] == trace_id]
+        return sorted(spans, key=lambda span: span["start"])
+
+
+class FileExporter:
+    """Appends spans as JSON lines. Writes happen on a QueueListener thread."""
+
+    def __init__(self, path: str = TRACE_FILE, queue_size: int = 10000):
+        handler = logging.FileHandler(path)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._listener = QueueListener(self._queue, handler)
+        self._listener.start()
+        self.dropped = 0
+
+    def export(self, span: Dict[str, Any]) -> None:
+        record = logging.LogRecord("tracing", logging.INFO, "", 0, json.dumps(span, default=str), None, None)
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self) -> None:
+        self._listener.stop()
+
+
+class Tracer:
+    def __init__(self, service: str, exporters: Iterable = (), sample_rate: float = TRACE_SAMPLE_RATE):
+        self.service = service
+        self.exporters = list(exporters)
+        self.sample_rate = sample_rate
+        self.memory = next((exporter for exporter in self.exporters if isinstance(exporter, InMemoryExporter)), None)
+
+    def start_span(self, name: str, parent: Optional[str] = None, start: Optional[float] = None,
+                   attributes: Optional[Dict[str, Any]] = None) -> Span:
+        """
+        Starts a span. Its parent is, in order: the `parent` traceparent (a remote
+        caller), else the current span in this context, else none (a new trace).
+        """
+        remote = parse_traceparent(parent)
+        current = _current_span.get()
+        if remote is not None:
+            trace_id, parent_id, sampled = remote
+            return Span(name, self.service, trace_id, parent_id, sampled, start, attributes)
+        if current is not None:
+            return Span(name, self.service, current.trace_id, current.span_id, current.sampled, start, attributes,
+                        local_root=current.local_root)
+        sampled = self.sample_rate >= 1.0 or random.random() < self.sample_rate
+        return Span(name, self.service, _new_id(128), None, sampled, start, attributes)
+
+    def finish(self, span: Span, end: Optional[float] = None) -> None:
+        span.end = time.time() if end is None else end
+        if not span.sampled:
+            return
+        finished = span.to_dict()
+        if span.local_root is not span:
+            span.local_root.finished_children.append(finished)
+        for exporter in self.exporters:
+            exporter.export(finished)
+
+    @contextmanager
+    def span(self, name: str, parent: Optional[str] = None, start: Optional[float] = None,
+             attributes: Optional[Dict[str, Any]] = None) -> Iterator[Span]:
+        """Times the block as a span and makes it the current span for nested spans."""
+        span = self.start_span(name, parent, start, attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.status = "error"
+            span.set("error", repr(e))
+            raise
+        finally:
+            _current_span.reset(token)
+            self.finish(span)
+
+    def record(self, name: str, start: float, end: float, parent: Optional[str] = None,
+               attributes: Optional[Dict[str, Any]] = None) -> Span:
+        """Records a span that already happened, e.g. time a message waited in Redis."""
+        span = self.start_span(name, parent, start, attributes)
+        self.finish(span, end)
+        return span
+
+    def spans_for_reply(self, root: Span) -> List[Dict[str, Any]]:
+        """The spans finished under `root` so far, plus `root` itself as of now, for shipping upstream."""
+        if not root.sampled:
+            return []
+        return root.finished_children + [root.to_dict(end=time.time())]
+
+    def close(self) -> None:
+        for exporter in self.exporters:
+            if hasattr(exporter, "close"):
+                exporter.close()
+
+    def ingest(self, spans: Any) -> None:
+        """Exports spans shipped by another process (see spans_for_reply)."""
+        if not isinstance(spans, list):
+            return
+        for span in spans:
+            if isinstance(span, dict) and "trace_id" in span:
+                for exporter in self.exporters:
+                    exporter.export(span)
+
+
+def build_exporters(spec: str = TRACE_EXPORTERS) -> List[Any]:
+    exporters = []
+    for name in filter(None, (part.strip() for part in spec.split(","))):
+        if name == "memory":
+            exporters.append(InMemoryExporter())
+        elif name == "file":
+            exporters.append(FileExporter())
+        elif name != "off":
+            raise ValueError(f"Unknown trace exporter: {name}")
+    return exporters
+
+
+def summarize(spans: Iterable[Dict[str, Any]], slowest: int = 10) -> Dict[str, Any]:
+    """Latency by span name (count, p50, p99, max) and the slowest traces end to end."""
+    by_name: Dict[str, List[float]] = {}
+    traces: Dict[str, List[Dict[str, Any]]] = {}
+    for span in spans:
+        by_name.setdefault(span["name"], []).append(span["duration_ms"])
+        traces.setdefault(span["trace_id"], []).append(span)
+
+    def percentile(values: List[float], fraction: float) -> float:
+        return values[min(len(values) - 1, int(len(values) * fraction))]
+
+    names = {}
+    for name, durations in by_name.items():
+        durations.sort()
+        names[name] = {
+            "count": len(durations),
+            "p50_ms": round(statistics.median(durations), 3),
+            "p99_ms": round(percentile(durations, 0.99), 3),
+            "max_ms": round(durations[-1], 3),
+            "total_ms": round(sum(durations), 3),
+        }
+
+    def trace_extent(trace_spans: List[Dict[str, Any]]) -> float:
+        started = min(span["start"] for span in trace_spans)
+        ended = max(span["start"] + span["duration_ms"] / 1000 for span in trace_spans)
+        return (ended - started) * 1000
+
+    ranked = sorted(traces.items(), key=lambda item: trace_extent(item[1]), reverse=True)[:slowest]
+    return {
+        "spans": dict(sorted(names.items(), key=lambda item: item[1]["total_ms"], reverse=True)),
+        "slowest_traces": [
+            {"trace_id": trace_id, "duration_ms": round(trace_extent(trace_spans), 3), "spans": len(trace_spans)}
+            for trace_id, trace_spans in ranked
+        ],
+    }
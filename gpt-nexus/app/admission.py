@@ -0,0 +1,172 @@
+# gpt-nexus/app/admission.py
+"""
+Admission control for endpoints that hand work to agents (/query, /ingest).
+
+Every accepted request holds a ticket until the agent answers it. That is
+until the inbox sees a result or error with the command's request_id, or
+ADMISSION_TICKET_TTL_SECONDS passes without a reply. A request is refused up
+front with 429 and a Retry-After when any of these hold:
+
+- the user already holds ADMISSION_USER_MAX_INFLIGHT tickets;
+- this worker holds ADMISSION_MAX_INFLIGHT tickets in total. That bounds the
+  commands queued in the dispatch scheduler and the ones it piles onto Redis;
+- the target agent type has ADMISSION_MAX_BACKLOG unanswered commands (see
+  CommandBacklog in app/autoscaler.py). This is how agents that are down or
+  falling behind show up;
+- recent inbox lag, the time replies sat on the bus before Nexus read them,
+  is above ADMISSION_MAX_INBOX_LAG_SECONDS. Lag samples older than
+  ADMISSION_LAG_STALE_SECONDS are ignored.
+
+Only requests that add agent work are admitted. A /query that joins an
+identical query already in flight (single-flight, see app/singleflight.py) is
+never refused and holds no ticket.
+
+Admins get a priority lane. They have no per-user cap, and the global limits
+apply to them only at ADMISSION_ADMIN_HEADROOM times the normal value, so
+admin work still goes through when regular traffic is being shed.
+
+Retry-After grows with how far over the limit the worker is. It starts at
+ADMISSION_RETRY_AFTER_SECONDS, is capped at ADMISSION_MAX_RETRY_AFTER_SECONDS,
+and follows the inbox lag itself when lag is the cause. Refusing early is what
+keeps tail latency bounded under overload: excess requests cost one dict lookup
+instead of waiting in a queue.
+
+All state is per worker process, like the command backlog.
+"""
+import math
+import os
+import time
+from typing import Any, Dict, Optional, Tuple
+from uuid import uuid4
+
+ADMISSION_MAX_INFLIGHT = int(os.getenv("ADMISSION_MAX_INFLIGHT", 500))
+ADMISSION_USER_MAX_INFLIGHT = int(os.getenv("ADMISSION_USER_MAX_INFLIGHT", 20))
+ADMISSION_MAX_BACKLOG = int(os.getenv("ADMISSION_MAX_BACKLOG", 200))  # unanswered commands per agent type
+ADMISSION_MAX_INBOX_LAG_SECONDS = float(os.getenv("ADMISSION_MAX_INBOX_LAG_SECONDS", 10))
+ADMISSION_LAG_STALE_SECONDS = float(os.getenv("ADMISSION_LAG_STALE_SECONDS", 30))
+ADMISSION_ADMIN_HEADROOM = float(os.getenv("ADMISSION_ADMIN_HEADROOM", 1.5))
+ADMISSION_RETRY_AFTER_SECONDS = int(os.getenv("ADMISSION_RETRY_AFTER_SECONDS", 1))
+ADMISSION_MAX_RETRY_AFTER_SECONDS = int(os.getenv("ADMISSION_MAX_RETRY_AFTER_SECONDS", 30))
+ADMISSION_TICKET_TTL_SECONDS = float(os.getenv("ADMISSION_TICKET_TTL_SECONDS", 60))
+
+
+class AdmissionRejected(Exception):
+    """The request would overload Nexus or the agents; the client should retry after `retry_after` seconds."""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        max_inflight: int = ADMISSION_MAX_INFLIGHT,
+        user_max_inflight: int = ADMISSION_USER_MAX_INFLIGHT,
+        max_backlog: int = ADMISSION_MAX_BACKLOG,
+        max_inbox_lag_seconds: float = ADMISSION_MAX_INBOX_LAG_SECONDS,
+        admin_headroom: float = ADMISSION_ADMIN_HEADROOM,
+        ticket_ttl_seconds: float = ADMISSION_TICKET_TTL_SECONDS,
+    ):
+        self.max_inflight = max_inflight
+        self.user_max_inflight = user_max_inflight
+        self.max_backlog = max_backlog
+        self.max_inbox_lag_seconds = max_inbox_lag_seconds
+        self.admin_headroom = admin_headroom
+        self.ticket_ttl_seconds = ticket_ttl_seconds
+        # ticket (or, once bound, request_id) -> (user, is_admin, held since); insertion order is age order
+        self._tickets: Dict[str, Tuple[Any, bool, float]] = {}
+        self._per_user: Dict[Any, int] = {}
+        self._admin_inflight = 0
+        self._lag: Optional[Tuple[float, float]] = None  # (smoothed seconds, observed at)
+        self.admitted_total = 0
+        self.rejected_total: Dict[str, int] = {}
+
+    def observe_inbox_lag(self, seconds: float, now: Optional[float] = None) -> None:
+        """Feeds one inbox lag sample into an exponentially weighted average."""
+        now = time.monotonic() if now is None else now
+        previous = self._lag[0] if self._lag is not None else seconds
+        self._lag = (previous + 0.2 * (seconds - previous), now)
+
+    def inbox_lag(self, now: Optional[float] = None) -> Optional[float]:
+        now = time.monotonic() if now is None else now
+        if self._lag is None or now - self._lag[1] > ADMISSION_LAG_STALE_SECONDS:
+            return None
+        return self._lag[0]
+
+    def admit(self, user: Any, is_admin: bool, backlog: int, now: Optional[float] = None) -> str:
+        """Returns a ticket for the request, or raises AdmissionRejected."""
+        now = time.monotonic() if now is None else now
+        self._expire(now)
+        headroom = self.admin_headroom if is_admin else 1.0
+        user_inflight = self._per_user.get(user, 0)
+        lag = self.inbox_lag(now)
+
+        if not is_admin and user_inflight >= self.user_max_inflight:
+            self._reject("user_inflight", user_inflight / self.user_max_inflight)
+        if len(self._tickets) >= self.max_inflight * headroom:
+            self._reject("inflight", len(self._tickets) / (self.max_inflight * headroom))
+        if backlog >= self.max_backlog * headroom:
+            self._reject("backlog", backlog / (self.max_backlog * headroom))
+        if lag is not None and lag > self.max_inbox_lag_seconds * headroom:
+            self._reject("inbox_lag", lag / (self.max_inbox_lag_seconds * headroom), retry_after=lag)
+
+        ticket = uuid4().hex
+        self._tickets[ticket] = (user, is_admin, now)
+        self._per_user[user] = user_inflight + 1
+        self._admin_inflight += is_admin
+        self.admitted_total += 1
+        return ticket
+
+    def bind(self, ticket: str, request_id: str, now: Optional[float] = None) -> None:
+        """Keys the ticket by the dispatched command's request_id, so the agent's reply releases it."""
+        held = self._tickets.pop(ticket, None)
+        if held is None:
+            return
+        if request_id in self._tickets:  # already held, e.g. a retried dispatch
+            self._release(held)
+            return
+        self._tickets[request_id] = (held[0], held[1], time.monotonic() if now is None else now)
+
+    def release(self, key: str) -> None:
+        """Releases a ticket by ticket id or bound request_id. Unknown keys are ignored."""
+        held = self._tickets.pop(key, None)
+        if held is not None:
+            self._release(held)
+
+    def stats(self, now: Optional[float] = None) -> Dict[str, Any]:
+        self._expire(time.monotonic() if now is None else now)
+        return {
+            "inflight": len(self._tickets),
+            "admin_inflight": self._admin_inflight,
+            "users_inflight": len(self._per_user),
+            "inbox_lag_seconds": self.inbox_lag(now),
+            "admitted_total": self.admitted_total,
+            "rejected_total": dict(self.rejected_total),
+        }
+
+    def _reject(self, reason: str, overload: float, retry_after: Optional[float] = None) -> None:
+        self.rejected_total[reason] = self.rejected_total.get(reason, 0) + 1
+        if retry_after is None:
+            retry_after = ADMISSION_RETRY_AFTER_SECONDS * overload
+        retry_after = min(ADMISSION_MAX_RETRY_AFTER_SECONDS, max(ADMISSION_RETRY_AFTER_SECONDS, math.ceil(retry_after)))
+        raise AdmissionRejected(reason, retry_after)
+
+    def _release(self, held: Tuple[Any, bool, float]) -> None:
+        user, is_admin, _ = held
+        remaining = self._per_user.get(user, 0) - 1
+        if remaining > 0:
+            self._per_user[user] = remaining
+        else:
+            self._per_user.pop(user, None)
+        self._admin_inflight -= is_admin
+
+    def _expire(self, now: float) -> None:
+        horizon = now - self.ticket_ttl_seconds
+        while self._tickets:
+            key, held = next(iter(self._tickets.items()))
+            if held[2] > horizon:
+                break
+            del self._tickets[key]
+            self._release(held)
@@ -0,0 +1,373 @@
+# gpt-nexus/app/autoscaler.py
+"""
+Replica autoscaling for agent types, driven by backlog and latency.
+
+Signals, per agent type (e.g. "gpt-agent_research"):
+
+- backlog: commands Nexus dispatched to the type and has not yet seen a reply
+  for (`CommandBacklog`). Replies are matched by request_id. Entries expire
+  after AUTOSCALE_BACKLOG_TTL_SECONDS, so lost replies do not pin the backlog.
+  Commands still held by the dispatch scheduler (app/dispatch.py) count as
+  well, since they are waiting for this type. Work the agents themselves
+  report as in flight or queued (heartbeat load, see app/agent_load.py) is
+  used instead when it is larger.
+- utilization: the dispatch rate since the previous evaluation times the
+  replicas' median tool latency (Little's law). This is the number of replicas
+  kept busy. It keeps capacity in place while commands still arrive at the
+  burst rate, even though the backlog has drained.
+- latency: the worst p99 tool latency reported by the type's live replicas.
+
+Each evaluation computes a load ratio and uses the highest of three:
+backlog against AUTOSCALE_TARGET_BACKLOG per replica, utilization against
+AUTOSCALE_TARGET_UTILIZATION, and p99 against AUTOSCALE_TARGET_P99_MS.
+Hysteresis keeps the replica count from flapping:
+
+- Within the tolerance band around 1.0 (AUTOSCALE_TOLERANCE), nothing changes.
+- Scaling up is immediate, except during AUTOSCALE_UP_COOLDOWN_SECONDS after
+  the previous change. Each step at most doubles the count.
+- Scaling down uses the highest recommendation over the last
+  AUTOSCALE_DOWN_STABILIZATION_SECONDS, so a short lull does not remove
+  replicas that the next burst needs.
+
+The result is clamped to [AUTOSCALE_MIN_REPLICAS, AUTOSCALE_MAX_REPLICAS] and
+handed to an actuator:
+
+- "log" (the default) only logs the desired count, for dry runs or an
+  external scaler that reads /admin/autoscaler.
+- "local" starts and stops extra `agent_app.py` processes from the agent
+  directories next to gpt-nexus, each with its own AGENT_ID. They register
+  with the Nexus at AUTOSCALE_LOCAL_NEXUS_URL. This is for local testing. In
+  Docker, scale with the orchestrator instead.
+
+An actuator provides `replicas(agent_type)`, `async scale(agent_type, replicas)`
+and `async close()`.
+
+Commands reach an agent through its own channel. `CommandBacklog.route()` sends
+each command to the live replica with the fewest outstanding commands, so added
+replicas share the work. With no live replica, the command goes to the type's
+shared queue, where one replica takes it. Run the controller in one Nexus process only
+(AUTOSCALE_ENABLED=1). Each worker tracks its own backlog.
+"""
+import asyncio
+import logging
+import math
+import os
+import sys
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Callable, Deque, Dict, Iterable, List, Optional, Tuple
+
+from app.agent_load import LoadHistory
+
+AUTOSCALE_ENABLED = os.getenv("AUTOSCALE_ENABLED", "0") == "1"
+AUTOSCALE_ACTUATOR = os.getenv("AUTOSCALE_ACTUATOR", "log")
+AUTOSCALE_AGENT_TYPES = os.getenv(
+    "AUTOSCALE_AGENT_TYPES", "gpt-agent_comms,gpt-agent_ops_execution,gpt-agent_research,gpt-agent_strategy"
+)
+AUTOSCALE_INTERVAL_SECONDS = float(os.getenv("AUTOSCALE_INTERVAL_SECONDS", 15))
+AUTOSCALE_MIN_REPLICAS = int(os.getenv("AUTOSCALE_MIN_REPLICAS", 1))
+AUTOSCALE_MAX_REPLICAS = int(os.getenv("AUTOSCALE_MAX_REPLICAS", 4))
+AUTOSCALE_TARGET_BACKLOG = float(os.getenv("AUTOSCALE_TARGET_BACKLOG", 4))  # outstanding commands per replica
+AUTOSCALE_TARGET_UTILIZATION = float(os.getenv("AUTOSCALE_TARGET_UTILIZATION", 0.7))
+AUTOSCALE_TARGET_P99_MS = float(os.getenv("AUTOSCALE_TARGET_P99_MS", 5000))
+AUTOSCALE_TOLERANCE = float(os.getenv("AUTOSCALE_TOLERANCE", 0.1))
+AUTOSCALE_UP_COOLDOWN_SECONDS = float(os.getenv("AUTOSCALE_UP_COOLDOWN_SECONDS", 30))
+AUTOSCALE_DOWN_STABILIZATION_SECONDS = float(os.getenv("AUTOSCALE_DOWN_STABILIZATION_SECONDS", 300))
+AUTOSCALE_BACKLOG_TTL_SECONDS = float(os.getenv("AUTOSCALE_BACKLOG_TTL_SECONDS", 300))
+AUTOSCALE_LOCAL_NEXUS_URL = os.getenv("AUTOSCALE_LOCAL_NEXUS_URL", "http://localhost:8000")  # passed to "local" replicas
+
+logger = logging.getLogger("nexus.autoscaler")
+
+
+class CommandBacklog:
+    """Commands dispatched to each agent (type or replica id) that have not been answered yet."""
+
+    def __init__(self, ttl_seconds: float = AUTOSCALE_BACKLOG_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        # request_id -> (target, dispatched at); insertion order is dispatch order
+        self._outstanding: Dict[str, Tuple[str, float]] = {}
+        self._by_target: Dict[str, int] = {}
+        self._dispatched_total: Dict[str, int] = {}
+
+    def dispatched(self, target: str, request_id: str, now: Optional[float] = None) -> None:
+        now = time.monotonic() if now is None else now
+        self._expire(now)
+        if request_id in self._outstanding:
+            return
+        self._outstanding[request_id] = (target, now)
+        self._dispatched_total[target] = self._dispatched_total.get(target, 0) + 1
+        self._by_target[target] = self._by_target.get(target, 0) + 1
+
+    def completed(self, request_id: str) -> None:
+        entry = self._outstanding.pop(request_id, None)
+        if entry is not None:
+            self._decrement(entry[0])
+
+    def depth(self, prefix: str = "", now: Optional[float] = None) -> int:
+        """Outstanding commands for every target starting with `prefix` (an agent type covers its replicas)."""
+        self._expire(time.monotonic() if now is None else now)
+        return sum(count for target, count in self._by_target.items() if target.startswith(prefix))
+
+    def dispatched_total(self, prefix: str = "") -> int:
+        """Commands ever dispatched to targets starting with `prefix`; the autoscaler derives rates from it."""
+        return sum(count for target, count in self._dispatched_total.items() if target.startswith(prefix))
+
+    def targets(self) -> Dict[str, int]:
+        return dict(self._by_target)
+
+    def route(self, agent_type: str, replicas: Iterable[str]) -> str:
+        """The replica with the fewest outstanding commands, or the type itself when none is live."""
+        candidates = sorted(replicas)
+        if not candidates:
+            return agent_type
+        return min(candidates, key=lambda replica: self._by_target.get(replica, 0))
+
+    def _decrement(self, target: str) -> None:
+        remaining = self._by_target[target] - 1
+        if remaining:
+            self._by_target[target] = remaining
+        else:
+            del self._by_target[target]
+
+    def _expire(self, now: float) -> None:
+        horizon = now - self.ttl_seconds
+        while self._outstanding:
+            request_id, (target, dispatched_at) = next(iter(self._outstanding.items()))
+            if dispatched_at > horizon:
+                break
+            del self._outstanding[request_id]
+            self._decrement(target)
+
+
+@dataclass
+class ScalingPolicy:
+    min_replicas: int = AUTOSCALE_MIN_REPLICAS
+    max_replicas: int = AUTOSCALE_MAX_REPLICAS
+    target_backlog: float = AUTOSCALE_TARGET_BACKLOG
+    target_utilization: float = AUTOSCALE_TARGET_UTILIZATION
+    target_p99_ms: float = AUTOSCALE_TARGET_P99_MS
+    tolerance: float = AUTOSCALE_TOLERANCE
+    up_cooldown_seconds: float = AUTOSCALE_UP_COOLDOWN_SECONDS
+    down_stabilization_seconds: float = AUTOSCALE_DOWN_STABILIZATION_SECONDS
+
+    def recommend(self, current: int, backlog: float, busy: float, p99_ms: Optional[float]) -> Tuple[int, float]:
+        """(replica count for this load, load ratio), before cooldown and stabilization."""
+        current = max(current, 1)
+        ratio = max(backlog / (self.target_backlog * current), busy / (self.target_utilization * current))
+        if p99_ms is not None:
+            ratio = max(ratio, p99_ms / self.target_p99_ms)
+        if abs(ratio - 1.0) <= self.tolerance:
+            desired = current
+        else:
+            desired = min(math.ceil(current * ratio), current * 2)
+        return max(self.min_replicas, min(self.max_replicas, desired)), ratio
+
+
+@dataclass
+class ScalingDecision:
+    agent_type: str
+    current: int
+    desired: int
+    backlog: int
+    busy: float
+    p99_ms: Optional[float]
+    ratio: float
+    reason: str
+    at: float
+
+
+class LogActuator:
+    """Records desired counts without acting on them."""
+
+    def __init__(self):
+        self._replicas: Dict[str, int] = {}
+
+    def replicas(self, agent_type: str) -> int:
+        return self._replicas.get(agent_type, 1)
+
+    async def scale(self, agent_type: str, replicas: int) -> None:
+        logger.info("Desired replicas changed", extra={"agent_type": agent_type, "replicas": replicas})
+        self._replicas[agent_type] = replicas
+
+    async def close(self) -> None:
+        pass
+
+
+class LocalProcessActuator:
+    """
+    Runs each agent type's replicas as local `agent_app.py` processes, named
+    <type>-local-001, <type>-local-002, ... The "local" part keeps them apart from
+    the statically configured agent, whose default AGENT_ID is <type>-001.
+    """
+
+    def __init__(
+        self,
+        project_root: str,
+        python: str = sys.executable,
+        stop_timeout_seconds: float = 10.0,
+        nexus_url: str = AUTOSCALE_LOCAL_NEXUS_URL,
+    ):
+        self.project_root = project_root
+        self.python = python
+        self.nexus_url = nexus_url
+        self.stop_timeout_seconds = stop_timeout_seconds
+        self._processes: Dict[str, Dict[str, asyncio.subprocess.Process]] = {}
+
+    def _running(self, agent_type: str) -> Dict[str, asyncio.subprocess.Process]:
+        processes = self._processes.setdefault(agent_type, {})
+        for agent_id in [agent_id for agent_id, process in processes.items() if process.returncode is not None]:
+            logger.warning("Agent replica exited", extra={"agent_id": agent_id, "returncode": processes[agent_id].returncode})
+            del processes[agent_id]
+        return processes
+
+    def replicas(self, agent_type: str) -> int:
+        return len(self._running(agent_type))
+
+    async def scale(self, agent_type: str, replicas: int) -> None:
+        processes = self._running(agent_type)
+        index = 1
+        while len(processes) < replicas:
+            agent_id = f"{agent_type}-local-{index:03d}"
+            index += 1
+            if agent_id in processes:
+                continue
+            processes[agent_id] = await asyncio.create_subprocess_exec(
+                self.python, "agent_app.py",
+                cwd=os.path.join(self.project_root, agent_type),
+                env={**os.environ, "AGENT_ID": agent_id, "NEXUS_ORCHESTRATOR_URL": self.nexus_url},
+            )
+            logger.info("Started agent replica", extra={"agent_id": agent_id, "pid": processes[agent_id].pid})
+        # Newest replicas are stopped first, so <type>-local-001 stays up the longest.
+        for agent_id in sorted(processes, reverse=True)[:max(0, len(processes) - replicas)]:
+            await self._stop(agent_id, processes.pop(agent_id))
+
+    async def _stop(self, agent_id: str, process: asyncio.subprocess.Process) -> None:
+        if process.returncode is None:
+            process.terminate()
+            try:
+                await asyncio.wait_for(process.wait(), self.stop_timeout_seconds)
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+        logger.info("Stopped agent replica", extra={"agent_id": agent_id, "returncode": process.returncode})
+
+    async def close(self) -> None:
+        for processes in self._processes.values():
+            for agent_id in list(processes):
+                await self._stop(agent_id, processes.pop(agent_id))
+
+
+def build_actuator(name: str = AUTOSCALE_ACTUATOR, project_root: Optional[str] = None) -> Any:
+    if name == "log":
+        return LogActuator()
+    if name == "local":
+        return LocalProcessActuator(project_root or os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+    raise ValueError(f"Unknown autoscaler actuator: {name}")
+
+
+class Autoscaler:
+    def __init__(
+        self,
+        load: LoadHistory,
+        backlog: CommandBacklog,
+        actuator: Any,
+        agent_types: Iterable[str] = tuple(filter(None, (part.strip() for part in AUTOSCALE_AGENT_TYPES.split(",")))),
+        policy: Optional[ScalingPolicy] = None,
+        interval_seconds: float = AUTOSCALE_INTERVAL_SECONDS,
+        pending: Optional[Callable[[str], int]] = None,
+    ):
+        self.load = load
+        self.backlog = backlog
+        self.actuator = actuator
+        self.agent_types = list(agent_types)
+        self.policy = policy or ScalingPolicy()
+        self.interval_seconds = interval_seconds
+        self.pending = pending  # agent type -> commands queued in Nexus and not dispatched yet
+        self.decisions: Dict[str, ScalingDecision] = {}
+        self._last_change: Dict[str, float] = {}
+        # (at, recommended replicas) per type, for scale-down stabilization
+        self._recommendations: Dict[str, Deque[Tuple[float, int]]] = {}
+        # (at, dispatched total) per type at the previous evaluation
+        self._dispatch_marks: Dict[str, Tuple[float, int]] = {}
+
+    def signals(self, agent_type: str, now: Optional[float] = None) -> Tuple[int, float, Optional[float]]:
+        """
+        (backlog, busy replicas, worst p99 latency in ms) for an agent type, from Nexus'
+        backlog and dispatch count and the replicas' heartbeats.
+        """
+        now = time.time() if now is None else now
+        reported, p50s, p99s = 0, [], []
+        for replica in self.load.agents(agent_type, now):
+            snapshot = self.load.latest(replica, now) or {}
+            reported += (snapshot.get("in_flight") or 0) + (snapshot.get("queue_depth") or 0)
+            if snapshot.get("latency_p50_ms") is not None:
+                p50s.append(snapshot["latency_p50_ms"])
+            if snapshot.get("latency_p99_ms") is not None:
+                p99s.append(snapshot["latency_p99_ms"])
+
+        total = self.backlog.dispatched_total(agent_type)
+        marked_at, marked_total = self._dispatch_marks.get(agent_type, (now, total))
+        self._dispatch_marks[agent_type] = (now, total)
+        rate = (total - marked_total) / (now - marked_at) if now > marked_at else 0.0
+        busy = rate * (sum(p50s) / len(p50s) / 1000) if p50s else 0.0
+        backlog = self.backlog.depth(agent_type) + (self.pending(agent_type) if self.pending is not None else 0)
+        return max(backlog, reported), busy, max(p99s) if p99s else None
+
+    def evaluate(self, agent_type: str, now: Optional[float] = None) -> ScalingDecision:
+        """Decides the replica count for one type. Does not act on it."""
+        now = time.time() if now is None else now
+        policy = self.policy
+        current = self.actuator.replicas(agent_type)
+        backlog, busy, p99_ms = self.signals(agent_type, now)
+        recommended, ratio = policy.recommend(current, backlog, busy, p99_ms)
+
+        history = self._recommendations.setdefault(agent_type, deque())
+        history.append((now, recommended))
+        while history and history[0][0] < now - policy.down_stabilization_seconds:
+            history.popleft()
+
+        desired, reason = current, "steady"
+        if current < policy.min_replicas or current > policy.max_replicas:
+            desired, reason = max(policy.min_replicas, min(policy.max_replicas, current)), "bounds"
+        elif recommended > current:
+            if now - self._last_change.get(agent_type, float("-inf")) >= policy.up_cooldown_seconds:
+                desired, reason = recommended, "scale_up"
+            else:
+                reason = "up_cooldown"
+        elif recommended < current:
+            stabilized = max(count for _, count in history)
+            if stabilized < current:
+                desired, reason = stabilized, "scale_down"
+            else:
+                reason = "down_stabilization"
+
+        decision = ScalingDecision(agent_type, current, desired, backlog, round(busy, 3), p99_ms, round(ratio, 3), reason, now)
+        self.decisions[agent_type] = decision
+        return decision
+
+    async def step(self, now: Optional[float] = None) -> List[ScalingDecision]:
+        decisions = []
+        for agent_type in self.agent_types:
+            decision = self.evaluate(agent_type, now)
+            if decision.desired != decision.current:
+                logger.info("Scaling agent type", extra={**vars(decision)})
+                await self.actuator.scale(agent_type, decision.desired)
+                self._last_change[agent_type] = decision.at
+            decisions.append(decision)
+        return decisions
+
+    async def run(self) -> None:
+        while True:
+            try:
+                await self.step()
+            except Exception:
+                logger.exception("Autoscaler step failed")
+            await asyncio.sleep(self.interval_seconds)
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "actuator": type(self.actuator).__name__,
+            "policy": vars(self.policy),
+            "agent_types": {agent_type: vars(decision) for agent_type, decision in self.decisions.items()},
+        }
@@ -0,0 +1,144 @@
+# gpt-nexus/app/bus_codec.py
+"""
+Pluggable serialization for messages on the Redis bus.
+
+A codec is named "<serializer>[+zstd]", where the serializer is "json" or
+"msgpack". With "+zstd", frames above `compress_threshold` bytes are
+compressed; small control messages stay uncompressed.
+
+Frames describe themselves, so any peer can decode any frame its installed
+libraries support:
+
+- a plain JSON frame is the JSON text with no header. This keeps the format
+  compatible with peers that predate codecs.
+- every other frame starts with a 0x00 byte followed by a flags byte. Bit 0
+  means msgpack and bit 1 means zstd.
+
+Each agent lists its codecs in its heartbeat. Nexus answers with the best codec
+both sides support, and both sides encode with that codec from then on.
+
+msgpack and zstandard are optional. A codec whose library is missing is not
+offered.
+
+The agents' bus_codec.py is a copy of this file made by generate_agents.py.
+"""
+import json
+import os
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Union
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+BUS_COMPRESS_THRESHOLD_BYTES = int(os.getenv("BUS_COMPRESS_THRESHOLD_BYTES", 4096))
+BUS_ZSTD_LEVEL = int(os.getenv("BUS_ZSTD_LEVEL", 3))
+# Comma-separated codecs this process offers, best first; unavailable ones are dropped.
+BUS_CODECS = os.getenv("BUS_CODECS", "msgpack+zstd,msgpack,json+zstd,json")
+
+DEFAULT_CODEC = "json"
+
+_FRAME_MARKER = 0x00
+_FLAG_MSGPACK = 0x01
+_FLAG_ZSTD = 0x02
+
+
+def _json_default(value: Any) -> Any:
+    # Same fallback the JSON path has always used for datetimes, UUIDs, etc.
+    return str(value)
+
+
+def _parse(name: str):
+    serializer, _, compression = name.partition("+")
+    if serializer not in ("json", "msgpack") or compression not in ("", "zstd"):
+        raise ValueError(f"Unknown bus codec: {name}")
+    return serializer, compression == "zstd"
+
+
+def is_available(name: str) -> bool:
+    try:
+        serializer, compressed = _parse(name)
+    except ValueError:
+        return False
+    return (serializer != "msgpack" or msgpack is not None) and (not compressed or zstandard is not None)
+
+
+def supported_codecs() -> List[str]:
+    """Codecs this process can encode and decode, in preference order."""
+    return [name for name in (part.strip() for part in BUS_CODECS.split(",")) if name and is_available(name)] or [DEFAULT_CODEC]
+
+
+def negotiate(offered: Optional[List[str]]) -> str:
+    """Returns the first of our codecs that the peer also offered, or plain JSON."""
+    if not offered:
+        return DEFAULT_CODEC
+    offered_set = set(offered)
+    for name in supported_codecs():
+        if name in offered_set:
+            return name
+    return DEFAULT_CODEC
+
+
+class MessageCodec:
+    def __init__(self, name: str = DEFAULT_CODEC, compress_threshold: int = BUS_COMPRESS_THRESHOLD_BYTES, level: int = BUS_ZSTD_LEVEL):
+        if not is_available(name):
+            raise ValueError(f"Bus codec '{name}' is not available in this process.")
+        self.name = name
+        self.serializer, self.compressed = _parse(name)
+        self.compress_threshold = compress_threshold
+        self._compressor = zstandard.ZstdCompressor(level=level) if self.compressed else None
+
+    def encode(self, message: Dict[str, Any]) -> bytes:
+        if self.serializer == "msgpack":
+            body = msgpack.packb(message, default=_json_default, use_bin_type=True)
+            flags = _FLAG_MSGPACK
+        else:
+            body = json.dumps(message, default=_json_default, separators=(",", ":")).encode("utf-8")
+            flags = 0
+        if self._compressor is not None and len(body) > self.compress_threshold:
+            body = self._compressor.compress(body)
+            flags |= _FLAG_ZSTD
+        if flags == 0:
+            return body
+        return bytes((_FRAME_MARKER, flags)) + body
+
+
+@lru_cache(maxsize=None)
+def get_codec(name: str = DEFAULT_CODEC) -> MessageCodec:
+    return MessageCodec(name)
+
+
+_decompressor = zstandard.ZstdDecompressor() if zstandard is not None else None
+
+
+def frame_codec(data: Union[bytes, str]) -> str:
+    """Names the codec a frame was encoded with (compression reflects this frame only)."""
+    if isinstance(data, str) or not data or data[0] != _FRAME_MARKER:
+        return DEFAULT_CODEC
+    flags = data[1]
+    return ("msgpack" if flags & _FLAG_MSGPACK else "json") + ("+zstd" if flags & _FLAG_ZSTD else "")
+
+
+def decode_message(data: Union[bytes, str]) -> Dict[str, Any]:
+    """Decodes a frame produced by any codec (or a legacy JSON text message)."""
+    if isinstance(data, str):
+        return json.loads(data)
+    if not data or data[0] != _FRAME_MARKER:
+        return json.loads(data)
+    flags = data[1]
+    body = memoryview(data)[2:]
+    if flags & _FLAG_ZSTD:
+        if _decompressor is None:
+            raise ValueError("Received a zstd-compressed bus message but zstandard is not installed.")
+        body = _decompressor.decompress(body)
+    if flags & _FLAG_MSGPACK:
+        if msgpack is None:
+            raise ValueError("Received a msgpack bus message but msgpack is not installed.")
+        return msgpack.unpackb(body, raw=False)
+    return json.loads(bytes(body))
@@ -0,0 +1,204 @@
+# gpt-nexus/app/claim_check.py
+"""
+Claim-check offloading for large values in bus messages.
+
+Pub/sub delivers every message to every subscriber's buffer, so a multi-MB
+document inside a result costs Redis memory and slows the bus for the small
+control messages. Before publishing, `offload()` moves every string or bytes
+value larger than `threshold_bytes` into a blob store. The value in the message
+is replaced by a small reference:
+
+    {"$claim": {"key": <sha256>, "store": "redis", "size": 1048576, "encoding": "utf-8"}}
+
+Consumers fetch a blob only when they need it. `get()` returns the whole value,
+`stream()` yields it in chunks, and `resolve()` puts every reference in a
+payload back inline.
+
+Blobs are content-addressed (the key is the SHA-256 of the value), so the same
+document offloaded twice is stored once. They expire after `ttl_seconds`. Two
+backends are available:
+
+- "redis": a key with EX. This is the default.
+- "file": a directory that every service mounts, with expiry based on mtime.
+
+The agents' claim_check.py is a copy of this file made by generate_agents.py.
+"""
+import asyncio
+import hashlib
+import os
+import re
+import time
+from typing import Any, AsyncIterator, Dict, Set, Union
+
+CLAIM_CHECK_THRESHOLD_BYTES = int(os.getenv("CLAIM_CHECK_THRESHOLD_BYTES", 64 * 1024))
+CLAIM_CHECK_TTL_SECONDS = int(os.getenv("CLAIM_CHECK_TTL_SECONDS", 3600))
+CLAIM_CHECK_STORE = os.getenv("CLAIM_CHECK_STORE", "redis")
+CLAIM_CHECK_DIR = os.getenv("CLAIM_CHECK_DIR", "/data/claims")
+CLAIM_CHECK_CHUNK_BYTES = 64 * 1024
+
+CLAIM_MARKER = "$claim"
+_KEY_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+
+def is_claim(value: Any) -> bool:
+    return isinstance(value, dict) and len(value) == 1 and isinstance(value.get(CLAIM_MARKER), dict)
+
+
+def claim_keys(value: Any) -> Set[str]:
+    """The keys of every claim reference inside `value`."""
+    if is_claim(value):
+        return {value[CLAIM_MARKER].get("key")}
+    if isinstance(value, dict):
+        return set().union(*(claim_keys(item) for item in value.values()))
+    if isinstance(value, list):
+        return set().union(*(claim_keys(item) for item in value))
+    return set()
+
+
+class ClaimCheckStore:
+    def __init__(
+        self,
+        redis=None,
+        backend: str = CLAIM_CHECK_STORE,
+        directory: str = CLAIM_CHECK_DIR,
+        threshold_bytes: int = CLAIM_CHECK_THRESHOLD_BYTES,
+        ttl_seconds: int = CLAIM_CHECK_TTL_SECONDS,
+        namespace: str = "claimcheck",
+    ):
+        if backend not in ("redis", "file"):
+            raise ValueError(f"Unknown claim-check store: {backend}")
+        if backend == "redis" and redis is None:
+            raise ValueError("The redis claim-check store needs a Redis client.")
+        self.redis = redis
+        self.backend = backend
+        self.directory = directory
+        self.threshold_bytes = threshold_bytes
+        self.ttl_seconds = ttl_seconds
+        self.namespace = namespace
+        self._last_sweep = 0.0
+        self.stats = {"offloaded": 0, "offloaded_bytes": 0, "fetched": 0}
+
+    def _redis_key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    def _path(self, key: str) -> str:
+        if not _KEY_PATTERN.match(key):
+            raise KeyError(f"Invalid claim key: {key}")
+        return os.path.join(self.directory, key)
+
+    # --- File backend (blocking, run in a thread) ---
+
+    def _write_file(self, key: str, data: bytes) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(key)
+        if os.path.exists(path):
+            os.utime(path)  # same content already stored; just extend its lifetime
+            return
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "wb") as handle:
+            handle.write(data)
+        os.replace(temporary, path)  # readers never see a partial blob
+
+    def _file_is_live(self, path: str) -> bool:
+        try:
+            return time.time() - os.path.getmtime(path) < self.ttl_seconds
+        except OSError:
+            return False
+
+    def _sweep_files(self) -> None:
+        cutoff = time.time() - self.ttl_seconds
+        try:
+            with os.scandir(self.directory) as entries:
+                for entry in entries:
+                    if _KEY_PATTERN.match(entry.name) and entry.stat().st_mtime < cutoff:
+                        try:
+                            os.remove(entry.path)
+                        except OSError:
+                            pass
+        except OSError:
+            pass
+
+    # --- Public API ---
+
+    async def put(self, data: Union[str, bytes]) -> Dict[str, Any]:
+        """Stores `data` and returns its claim reference."""
+        encoding = "utf-8" if isinstance(data, str) else None
+        raw = data.encode("utf-8") if isinstance(data, str) else data
+        key = hashlib.sha256(raw).hexdigest()
+        if self.backend == "redis":
+            await self.redis.set(self._redis_key(key), raw, ex=self.ttl_seconds)
+        else:
+            await asyncio.to_thread(self._write_file, key, raw)
+            now = time.monotonic()
+            if now - self._last_sweep > min(60, self.ttl_seconds):
+                self._last_sweep = now
+                await asyncio.to_thread(self._sweep_files)
+        self.stats["offloaded"] += 1
+        self.stats["offloaded_bytes"] += len(raw)
+        return {CLAIM_MARKER: {"key": key, "store": self.backend, "size": len(raw), "encoding": encoding}}
+
+    async def stream(self, key: str, chunk_bytes: int = CLAIM_CHECK_CHUNK_BYTES) -> AsyncIterator[bytes]:
+        """Yields the blob stored under `key` in chunks. Raises KeyError if it is missing or expired."""
+        self.stats["fetched"] += 1
+        if self.backend == "redis":
+            redis_key = self._redis_key(key)
+            size = await self.redis.strlen(redis_key)
+            if not size:
+                raise KeyError(f"Claim {key} not found or expired.")
+            for offset in range(0, size, chunk_bytes):
+                yield await self.redis.getrange(redis_key, offset, offset + chunk_bytes - 1)
+            return
+        path = self._path(key)
+        if not await asyncio.to_thread(self._file_is_live, path):
+            raise KeyError(f"Claim {key} not found or expired.")
+        handle = await asyncio.to_thread(open, path, "rb")
+        try:
+            while True:
+                chunk = await asyncio.to_thread(handle.read, chunk_bytes)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            handle.close()
+
+    async def get(self, reference: Dict[str, Any]) -> Union[str, bytes]:
+        """Fetches the value behind a claim reference, decoded as it was stored."""
+        claim = reference[CLAIM_MARKER]
+        if self.backend == "redis":
+            self.stats["fetched"] += 1
+            raw = await self.redis.get(self._redis_key(claim["key"]))
+            if raw is None:
+                raise KeyError(f"Claim {claim['key']} not found or expired.")
+        else:
+            raw = b"".join([chunk async for chunk in self.stream(claim["key"])])
+        if isinstance(raw, str):  # a client with decode_responses=True
+            return raw if claim.get("encoding") else raw.encode("utf-8")
+        return raw.decode(claim["encoding"]) if claim.get("encoding") else raw
+
+    async def offload(self, value: Any) -> Any:
+        """Returns `value` with every large string/bytes inside it replaced by a claim reference."""
+        if isinstance(value, dict):
+            if is_claim(value):
+                return value
+            return {key: await self.offload(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [await self.offload(item) for item in value]
+        if isinstance(value, str):
+            # Cheap bounds first: a character encodes to between 1 and 4 bytes.
+            if len(value) > self.threshold_bytes or (
+                len(value) * 4 > self.threshold_bytes and len(value.encode("utf-8")) > self.threshold_bytes
+            ):
+                return await self.put(value)
+        elif isinstance(value, bytes) and len(value) > self.threshold_bytes:
+            return await self.put(value)
+        return value
+
+    async def resolve(self, value: Any) -> Any:
+        """Returns `value` with every claim reference inside it replaced by the stored data."""
+        if isinstance(value, dict):
+            if is_claim(value):
+                return await self.get(value)
+            return {key: await self.resolve(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [await self.resolve(item) for item in value]
+        return value
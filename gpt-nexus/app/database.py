@@ -0,0 +1,220 @@
+# gpt-nexus/app/database.py
+"""
+Async database access for Nexus: one pooled asyncpg engine per process and a
+session-per-request dependency.
+
+Pool and cache settings come from the environment:
+
+- DB_POOL_SIZE / DB_MAX_OVERFLOW: persistent connections and extra burst
+  connections.
+- DB_POOL_TIMEOUT: seconds a request may wait for a connection before failing.
+- DB_POOL_RECYCLE_SECONDS: connections older than this are replaced, which
+  keeps them ahead of server and proxy idle timeouts.
+- DB_POOL_PRE_PING: checks a connection is alive when it is checked out.
+- DB_STATEMENT_CACHE_SIZE: asyncpg's prepared statements per connection. Set it
+  to 0 behind PgBouncer in transaction mode.
+- DB_QUERY_CACHE_SIZE: SQLAlchemy's compiled SQL cache.
+
+Sessions do not expire objects on commit. Attributes already loaded stay
+readable after a commit, with no extra SELECT, so handlers only refresh what the
+database actually changed. Pool checkouts and the time spent waiting for a
+connection are counted; `get_pool_stats()` reports them. Every SQL statement's
+execution time goes to the nexus_db_query_seconds histogram (see metrics.py),
+labelled by statement type.
+
+At startup, `prepare_database()` by default only checks that the database is at
+the Alembic revision this code expects. That is a single query, so cold starts
+do not pay for create_all()'s per-table checks. DB_SCHEMA_MODE=create restores
+create_all() for throwaway local databases, and DB_SCHEMA_MODE=off skips the
+check.
+"""
+import os
+import threading
+import time
+from typing import Any, AsyncIterator, Dict
+
+from sqlalchemy import event, text
+from sqlalchemy.exc import ProgrammingError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from app.metrics import REGISTRY
+from app.models import Base
+
+DATABASE_URL = os.getenv("DATABASE_URL", "postgresql+asyncpg://postgres:postgres@db:5432/nexusdb")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 10))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE_SECONDS = int(os.getenv("DB_POOL_RECYCLE_SECONDS", 1800))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1"
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", 100))
+DB_QUERY_CACHE_SIZE = int(os.getenv("DB_QUERY_CACHE_SIZE", 500))
+DB_ECHO = os.getenv("DB_ECHO", "0") == "1"
+DB_SCHEMA_MODE = os.getenv("DB_SCHEMA_MODE", "check")
+# Head of migrations/versions; bump together with every new migration.
+SCHEMA_REVISION = os.getenv("DB_SCHEMA_REVISION", "0003_command_outbox")
+
+
+class SchemaRevisionError(RuntimeError):
+    """The database is not at the Alembic revision this code was written for."""
+
+
+class PoolStats:
+    """Checkout counters and pool wait times, updated from pool events."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.checkins = 0
+        self.connects = 0
+        self.invalidations = 0
+        self.waits = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def record_wait(self, seconds: float) -> None:
+        with self._lock:
+            self.waits += 1
+            self.wait_seconds_total += seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+
+    def increment(self, counter: str) -> None:
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "checkins": self.checkins,
+                "connects": self.connects,
+                "invalidations": self.invalidations,
+                "wait_seconds_total": round(self.wait_seconds_total, 6),
+                "wait_seconds_max": round(self.wait_seconds_max, 6),
+                "wait_ms_avg": round(self.wait_seconds_total / self.waits * 1000, 3) if self.waits else 0.0,
+            }
+
+
+pool_stats = PoolStats()
+
+DB_QUERY_SECONDS = REGISTRY.histogram(
+    "nexus_db_query_seconds", "Time spent executing SQL statements, by statement type.", ("operation",)
+)
+_QUERY_OPERATIONS = ("SELECT", "INSERT", "UPDATE", "DELETE")
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    # SQLAlchemy has no "checkout started" event, so time the pool's own get.
+    # This includes opening a new connection when the pool grows into overflow.
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            pool_stats.record_wait(time.perf_counter() - started)
+
+
+engine = create_async_engine(
+    DATABASE_URL,
+    echo=DB_ECHO,
+    poolclass=InstrumentedPool,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE_SECONDS,
+    pool_pre_ping=DB_POOL_PRE_PING,
+    query_cache_size=DB_QUERY_CACHE_SIZE,
+    connect_args={"prepared_statement_cache_size": DB_STATEMENT_CACHE_SIZE},
+)
+
+AsyncSessionLocal = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False, autoflush=False)
+
+
+@event.listens_for(engine.sync_engine, "connect")
+def _on_connect(dbapi_connection, connection_record):
+    pool_stats.increment("connects")
+
+
+@event.listens_for(engine.sync_engine, "checkout")
+def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+    pool_stats.increment("checkouts")
+
+
+@event.listens_for(engine.sync_engine, "checkin")
+def _on_checkin(dbapi_connection, connection_record):
+    pool_stats.increment("checkins")
+
+
+@event.listens_for(engine.sync_engine, "invalidate")
+def _on_invalidate(dbapi_connection, connection_record, exception):
+    pool_stats.increment("invalidations")
+
+
+@event.listens_for(engine.sync_engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._query_started = time.perf_counter()
+
+
+@event.listens_for(engine.sync_engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "_query_started", None)
+    if started is None:
+        return
+    operation = statement.lstrip()[:6].upper()
+    DB_QUERY_SECONDS.labels(operation if operation in _QUERY_OPERATIONS else "OTHER").observe(time.perf_counter() - started)
+
+
+async def get_db() -> AsyncIterator[AsyncSession]:
+    """FastAPI dependency: one session per request, rolled back if the handler raises."""
+    async with AsyncSessionLocal() as session:
+        try:
+            yield session
+        except Exception:
+            await session.rollback()
+            raise
+
+
+async def create_db_and_tables() -> None:
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+
+async def check_schema_revision() -> str:
+    """Returns the database's Alembic revision; raises SchemaRevisionError unless it is SCHEMA_REVISION."""
+    try:
+        async with engine.connect() as conn:
+            revision = (await conn.execute(text("SELECT version_num FROM alembic_version"))).scalar_one_or_none()
+    except ProgrammingError:  # no alembic_version table: never migrated
+        revision = None
+    if revision != SCHEMA_REVISION:
+        raise SchemaRevisionError(
+            f"Database schema is at revision {revision or 'none'}, expected {SCHEMA_REVISION}. "
+            "Run 'alembic upgrade head' (or set DB_SCHEMA_MODE=create for a throwaway database)."
+        )
+    return revision
+
+
+async def prepare_database() -> str:
+    """Startup hook: verifies or creates the schema according to DB_SCHEMA_MODE. Returns what it did."""
+    if DB_SCHEMA_MODE == "create":
+        await create_db_and_tables()
+        return "tables checked/created"
+    if DB_SCHEMA_MODE == "off":
+        return "schema check skipped"
+    return f"schema at revision {await check_schema_revision()}"
+
+
+async def dispose_engine() -> None:
+    await engine.dispose()
+
+
+def get_pool_stats() -> Dict[str, Any]:
+    pool = engine.pool
+    return {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        "overflow": pool.overflow(),
+        "max_overflow": DB_MAX_OVERFLOW,
+        **pool_stats.snapshot(),
+    }
@@ -0,0 +1,438 @@
+# gpt-nexus/app/dispatch.py
+"""
+Dispatch scheduling between the API and the bus: priority classes,
+per-tenant weighted fair queueing and deadlines.
+
+Endpoints submit commands here instead of publishing them directly. With
+DISPATCH_WINDOW_PER_REPLICA set, a command is sent only when its agent type has
+room in its dispatch window. The window is DISPATCH_WINDOW_PER_REPLICA
+unanswered commands per live replica, minus what is already outstanding
+(CommandBacklog in app/autoscaler.py). Everything beyond that waits in this
+worker, where the order can still be chosen. If the bus were simply filled, one
+user's 10k-file reprocess would sit ahead of everyone's queries in the agents'
+inboxes.
+
+Room is only freed by agent replies (or by backlog entries expiring), so the
+window is off (0) by default. Turn it on once every agent type in the
+deployment answers its commands on the orchestrator inbox. Without a window,
+commands are sent as soon as the dispatcher runs, still in the order below.
+
+Order, per agent type:
+
+- Priority classes: "interactive" (queries), "ingest" (uploads) and
+  "maintenance" (reprocessing and other bulk work). Classes share the window
+  by stride scheduling with DISPATCH_CLASS_WEIGHTS (16:4:1 by default). A
+  waiting query is sent well ahead of bulk work, but bulk work is never
+  starved outright. A class that was idle starts at the current virtual time,
+  so it builds up no credit while idle.
+- Tenants: within a class each tenant (user) has its own queue, served by
+  deficit round robin. A tenant's share is its weight from
+  DISPATCH_TENANT_WEIGHTS ("user_id=weight,...", default 1; weights must be
+  positive, here and in DISPATCH_CLASS_WEIGHTS). A tenant with
+  10k queued commands gets the same turn as a tenant with one.
+- Deadlines: each command has a deadline, set per class by
+  DISPATCH_DEADLINES ("class=seconds", 0 for none) or per submit. A tenant's
+  queue is ordered earliest deadline first. A command still queued at its
+  deadline is dropped rather than sent, and its `on_expired` callback runs. By
+  then nobody is waiting for a query answer, and sending it would only delay
+  fresh work.
+
+DISPATCH_MAX_QUEUED bounds the queued commands per worker. Beyond it submit()
+raises DispatchQueueFull, which endpoints turn into 429.
+
+A command is sent by its own `send` callable or, if it has none, by the
+scheduler's `send_batch`. `send_batch` gets every such command started in one
+pass, so a single pipelined round trip sends them all. The transactional
+outbox (app/outbox.py) feeds commands in this way.
+
+All state is per worker process, like the command backlog.
+"""
+import asyncio
+import heapq
+import inspect
+import itertools
+import logging
+import os
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+PRIORITY_CLASSES = ("interactive", "ingest", "maintenance")
+
+DISPATCH_CLASS_WEIGHTS = os.getenv("DISPATCH_CLASS_WEIGHTS", "interactive=16,ingest=4,maintenance=1")
+DISPATCH_DEADLINES = os.getenv("DISPATCH_DEADLINES", "interactive=30,ingest=0,maintenance=0")
+DISPATCH_TENANT_WEIGHTS = os.getenv("DISPATCH_TENANT_WEIGHTS", "")
+DISPATCH_WINDOW_PER_REPLICA = int(os.getenv("DISPATCH_WINDOW_PER_REPLICA", 0))  # 0: no window
+DISPATCH_MAX_QUEUED = int(os.getenv("DISPATCH_MAX_QUEUED", 20000))
+DISPATCH_RETRY_AFTER_SECONDS = int(os.getenv("DISPATCH_RETRY_AFTER_SECONDS", 5))
+
+logger = logging.getLogger("nexus.dispatch")
+
+
+def parse_weights(spec: str, setting: str) -> Dict[str, float]:
+    """Parses "name=number,..." into {name: number}."""
+    weights = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, value = item.rpartition("=")
+        try:
+            weights[name.strip()] = float(value)
+        except ValueError:
+            raise ValueError(f"Invalid {setting} entry: {item!r}")
+    return weights
+
+
+def positive_weights(weights: Dict[str, float], setting: str) -> Dict[str, float]:
+    """Rejects weights of 0 or less. Such a tenant would never earn a turn, and pop() would spin forever."""
+    for name, weight in weights.items():
+        if not weight > 0:
+            raise ValueError(f"{setting} weights must be positive, got {name}={weight}")
+    return weights
+
+
+class DispatchQueueFull(Exception):
+    """The worker already holds DISPATCH_MAX_QUEUED commands; retry after `retry_after` seconds."""
+
+    def __init__(self, retry_after: int = DISPATCH_RETRY_AFTER_SECONDS):
+        super().__init__("dispatch queue full")
+        self.retry_after = retry_after
+
+
+class Job:
+    __slots__ = ("agent_type", "priority", "tenant", "send", "on_expired", "deadline", "enqueued_at", "payload")
+
+    def __init__(self, agent_type: str, priority: str, tenant: str, send: Optional[Callable[[], Awaitable[Any]]],
+                 on_expired: Optional[Callable[[], Any]], deadline: float, enqueued_at: float, payload: Any = None):
+        self.agent_type = agent_type
+        self.priority = priority
+        self.tenant = tenant
+        self.send = send
+        self.on_expired = on_expired
+        self.deadline = deadline  # monotonic seconds; inf for none
+        self.enqueued_at = enqueued_at
+        self.payload = payload  # for send_batch, when there is no `send`
+
+
+class TenantQueues:
+    """Deficit round robin over per-tenant queues, each ordered earliest deadline first."""
+
+    def __init__(self, weight_of: Callable[[str], float]):
+        self.weight_of = weight_of
+        self._queues: Dict[str, List[Tuple[float, int, Job]]] = {}
+        self._active: Deque[str] = deque()
+        self._deficit: Dict[str, float] = {}
+        self._sequence = itertools.count()
+        self.size = 0
+
+    def push(self, job: Job) -> None:
+        queue = self._queues.get(job.tenant)
+        if queue is None:
+            queue = self._queues[job.tenant] = []
+            self._active.append(job.tenant)
+            self._deficit[job.tenant] = 0.0
+        heapq.heappush(queue, (job.deadline, next(self._sequence), job))
+        self.size += 1
+
+    def pop(self) -> Optional[Job]:
+        while self._active:
+            tenant = self._active[0]
+            if self._deficit[tenant] < 1:
+                # A new turn: top up the tenant's quantum. Weights below 1 take several turns per command.
+                self._deficit[tenant] += self.weight_of(tenant)
+                if self._deficit[tenant] < 1:
+                    self._active.rotate(-1)
+                    continue
+            queue = self._queues[tenant]
+            job = heapq.heappop(queue)[2]
+            self.size -= 1
+            self._deficit[tenant] -= 1
+            if not queue:
+                self._active.popleft()
+                del self._queues[tenant], self._deficit[tenant]
+            elif self._deficit[tenant] < 1:
+                self._active.rotate(-1)
+            return job
+        return None
+
+    def drop_expired(self, now: float) -> List[Job]:
+        """Removes commands past their deadline. Queues are deadline-ordered, so only their heads are checked."""
+        expired = []
+        for tenant in list(self._queues):
+            queue = self._queues[tenant]
+            while queue and queue[0][0] <= now:
+                expired.append(heapq.heappop(queue)[2])
+            if not queue:
+                self._active.remove(tenant)
+                del self._queues[tenant], self._deficit[tenant]
+        self.size -= len(expired)
+        return expired
+
+    def tenants(self) -> Dict[str, int]:
+        return {tenant: len(queue) for tenant, queue in self._queues.items()}
+
+
+class ClassStats:
+    __slots__ = ("submitted", "dispatched", "expired", "failed", "waits")
+
+    def __init__(self):
+        self.submitted = 0
+        self.dispatched = 0
+        self.expired = 0
+        self.failed = 0
+        self.waits: Deque[float] = deque(maxlen=1024)  # queue wait of recent dispatches, seconds
+
+
+class DispatchScheduler:
+    """
+    Holds commands until their agent type has room, then sends them in priority, fair-share and
+    deadline order.
+
+    `outstanding(agent_type)` returns the type's unanswered commands. `replicas(agent_type)`
+    returns its live replica count. `send_batch(jobs)`, if set, sends the jobs submitted
+    without a `send` of their own. `waits` and `outcomes` are optional metrics: a histogram
+    labelled by class, and a counter labelled by class and outcome.
+    """
+
+    def __init__(
+        self,
+        outstanding: Callable[[str], int],
+        replicas: Callable[[str], int],
+        window_per_replica: int = DISPATCH_WINDOW_PER_REPLICA,
+        class_weights: Optional[Dict[str, float]] = None,
+        deadlines: Optional[Dict[str, float]] = None,
+        tenant_weights: Optional[Dict[str, float]] = None,
+        max_queued: int = DISPATCH_MAX_QUEUED,
+        send_batch: Optional[Callable[[List[Job]], Awaitable[Any]]] = None,
+        waits=None,
+        outcomes=None,
+    ):
+        self.outstanding = outstanding
+        self.replicas = replicas
+        self.window_per_replica = window_per_replica
+        self.class_weights = {
+            **dict.fromkeys(PRIORITY_CLASSES, 1.0),
+            **positive_weights(
+                parse_weights(DISPATCH_CLASS_WEIGHTS, "DISPATCH_CLASS_WEIGHTS") if class_weights is None else class_weights,
+                "DISPATCH_CLASS_WEIGHTS",
+            ),
+        }
+        self.deadlines = {
+            **dict.fromkeys(PRIORITY_CLASSES, 0.0),
+            **(parse_weights(DISPATCH_DEADLINES, "DISPATCH_DEADLINES") if deadlines is None else deadlines),
+        }
+        self.tenant_weights = positive_weights(
+            parse_weights(DISPATCH_TENANT_WEIGHTS, "DISPATCH_TENANT_WEIGHTS") if tenant_weights is None else tenant_weights,
+            "DISPATCH_TENANT_WEIGHTS",
+        )
+        self.max_queued = max_queued
+        self.send_batch = send_batch
+        self.waits = waits
+        self.outcomes = outcomes
+        # agent type -> class -> tenant queues; and the stride scheduler's pass per (type, class)
+        self._lanes: Dict[str, Dict[str, TenantQueues]] = {}
+        self._passes: Dict[str, Dict[str, float]] = {}
+        self._virtual_time: Dict[str, float] = {}
+        self._sending: Dict[str, int] = {}  # commands handed to send() that have not returned yet
+        self._tasks: set = set()
+        self._wakeup = asyncio.Event()
+        self.queued = 0
+        self.stats_by_class = {priority: ClassStats() for priority in PRIORITY_CLASSES}
+
+    def submit(
+        self,
+        agent_type: str,
+        send: Optional[Callable[[], Awaitable[Any]]],
+        priority: str,
+        tenant: Any,
+        deadline_seconds: Optional[float] = None,
+        on_expired: Optional[Callable[[], Any]] = None,
+        now: Optional[float] = None,
+        payload: Any = None,
+    ) -> None:
+        """
+        Queues `send` (a coroutine function that publishes the command) for `agent_type`. With
+        `send` None, the command goes out through send_batch with `payload`. Raises
+        DispatchQueueFull when the worker holds max_queued commands already.
+        """
+        if priority not in self.stats_by_class:
+            raise ValueError(f"Unknown priority class: {priority!r}")
+        if self.queued >= self.max_queued:
+            raise DispatchQueueFull()
+        now = time.monotonic() if now is None else now
+        if deadline_seconds is None:
+            deadline_seconds = self.deadlines.get(priority, 0.0)
+        deadline = now + deadline_seconds if deadline_seconds > 0 else float("inf")
+        lane = self._lanes.setdefault(agent_type, {})
+        queues = lane.get(priority)
+        if queues is None:
+            queues = lane[priority] = TenantQueues(self._tenant_weight)
+        if not queues.size:
+            # An idle class re-enters at the lane's virtual time rather than with banked credit.
+            passes = self._passes.setdefault(agent_type, {})
+            passes[priority] = max(passes.get(priority, 0.0), self._virtual_time.get(agent_type, 0.0))
+        queues.push(Job(agent_type, priority, str(tenant), send, on_expired, deadline, now, payload))
+        self.queued += 1
+        self.stats_by_class[priority].submitted += 1
+        self._wakeup.set()
+
+    def room(self, agent_type: str) -> Optional[int]:
+        """Commands `agent_type` can take now (0 or less when full), or None for no window."""
+        if self.window_per_replica <= 0:
+            return None
+        window = max(1, self.replicas(agent_type)) * self.window_per_replica
+        return window - self.outstanding(agent_type) - self._sending.get(agent_type, 0)
+
+    def pop(self, agent_type: str, now: Optional[float] = None) -> Tuple[Optional[Job], List[Job]]:
+        """The next command to send for `agent_type`, and any commands that expired on the way to it."""
+        now = time.monotonic() if now is None else now
+        lane, passes = self._lanes.get(agent_type), self._passes.get(agent_type)
+        expired = []
+        while lane:
+            priority = min((p for p, queues in lane.items() if queues.size), key=lambda p: (passes[p], PRIORITY_CLASSES.index(p)), default=None)
+            if priority is None:
+                break
+            job = lane[priority].pop()
+            self.queued -= 1
+            self._virtual_time[agent_type] = passes[priority]
+            passes[priority] += 1.0 / max(self.class_weights.get(priority, 1.0), 1e-6)
+            stats = self.stats_by_class[priority]
+            if job.deadline <= now:
+                self._count_expired(job)
+                expired.append(job)
+                continue
+            wait = now - job.enqueued_at
+            stats.dispatched += 1
+            stats.waits.append(wait)
+            if self.waits is not None:
+                self.waits.labels(priority).observe(wait)
+            if self.outcomes is not None:
+                self.outcomes.labels(priority, "dispatched").inc()
+            return job, expired
+        return None, expired
+
+    def expire(self, agent_type: str, now: Optional[float] = None) -> List[Job]:
+        """Drops every queued command for `agent_type` that is past its deadline, whether or not there is room."""
+        now = time.monotonic() if now is None else now
+        expired = [job for queues in self._lanes.get(agent_type, {}).values() for job in queues.drop_expired(now)]
+        self.queued -= len(expired)
+        for job in expired:
+            self._count_expired(job)
+        return expired
+
+    def wake(self) -> None:
+        """Re-checks every window now, e.g. after a reply freed room."""
+        self._wakeup.set()
+
+    async def run(self, poll_seconds: float = 1.0) -> None:
+        """Sends queued commands as windows open. Polls as well, since backlog entries also free room by expiring."""
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                self.dispatch_ready()
+        finally:
+            for task in list(self._tasks):
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def dispatch_ready(self, now: Optional[float] = None) -> int:
+        """Starts sending every command that fits in its window; returns how many were started."""
+        started, batch = 0, []
+        for agent_type in list(self._lanes):
+            for stale in self.expire(agent_type, now):
+                self._spawn(self._expire(stale))
+            room = self.room(agent_type)
+            while room is None or room > 0:
+                job, expired = self.pop(agent_type, now)
+                for stale in expired:
+                    self._spawn(self._expire(stale))
+                if job is None:
+                    break
+                self._sending[agent_type] = self._sending.get(agent_type, 0) + 1
+                if job.send is None:
+                    batch.append(job)
+                else:
+                    self._spawn(self._send(job))
+                started += 1
+                if room is not None:
+                    room -= 1
+        if batch:
+            self._spawn(self._send_batch(batch))
+        return started
+
+    def stats(self) -> Dict[str, Any]:
+        queued: Dict[str, int] = dict.fromkeys(self.stats_by_class, 0)
+        tenants: Dict[str, int] = dict.fromkeys(self.stats_by_class, 0)
+        by_agent = {}
+        for agent_type, lane in self._lanes.items():
+            by_agent[agent_type] = {"queued": sum(queues.size for queues in lane.values()), "room": self.room(agent_type)}
+            for priority, queues in lane.items():
+                queued[priority] += queues.size
+                tenants[priority] += len(queues.tenants())
+        classes = {}
+        for priority, stats in self.stats_by_class.items():
+            waits = sorted(stats.waits)
+            classes[priority] = {
+                "weight": self.class_weights.get(priority), "deadline_seconds": self.deadlines.get(priority) or None,
+                "queued": queued[priority], "tenants_queued": tenants[priority],
+                "submitted_total": stats.submitted, "dispatched_total": stats.dispatched,
+                "expired_total": stats.expired, "failed_total": stats.failed,
+                "wait_p50_seconds": round(waits[len(waits) // 2], 4) if waits else None,
+                "wait_p99_seconds": round(waits[min(len(waits) - 1, int(len(waits) * 0.99))], 4) if waits else None,
+            }
+        return {"queued": self.queued, "classes": classes, "agents": by_agent}
+
+    def _count_expired(self, job: Job) -> None:
+        self.stats_by_class[job.priority].expired += 1
+        if self.outcomes is not None:
+            self.outcomes.labels(job.priority, "expired").inc()
+
+    def _tenant_weight(self, tenant: str) -> float:
+        return self.tenant_weights.get(tenant, 1.0)
+
+    def _spawn(self, coroutine) -> None:
+        task = asyncio.ensure_future(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, job: Job) -> None:
+        try:
+            await job.send()
+        except Exception as e:
+            self.stats_by_class[job.priority].failed += 1
+            if self.outcomes is not None:
+                self.outcomes.labels(job.priority, "failed").inc()
+            logger.error("Dispatch failed", extra={"agent_type": job.agent_type, "priority": job.priority, "error": str(e)})
+        finally:
+            self._sending[job.agent_type] -= 1
+            self._wakeup.set()
+
+    async def _send_batch(self, jobs: List[Job]) -> None:
+        try:
+            await self.send_batch(jobs)
+        except Exception as e:
+            for job in jobs:
+                self.stats_by_class[job.priority].failed += 1
+                if self.outcomes is not None:
+                    self.outcomes.labels(job.priority, "failed").inc()
+            logger.error("Batch dispatch failed", extra={"commands": len(jobs), "error": str(e)})
+        finally:
+            for job in jobs:
+                self._sending[job.agent_type] -= 1
+            self._wakeup.set()
+
+    async def _expire(self, job: Job) -> None:
+        logger.warning("Command expired before dispatch", extra={
+            "agent_type": job.agent_type, "priority": job.priority, "tenant": job.tenant,
+            "waited_seconds": round(time.monotonic() - job.enqueued_at, 3),
+        })
+        if job.on_expired is None:
+            return
+        try:
+            result = job.on_expired()
+            if inspect.isawaitable(result):
+                await result
+        except Exception:
+            logger.exception("on_expired callback failed")
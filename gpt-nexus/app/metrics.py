@@ -0,0 +1,321 @@
+# gpt-nexus/app/metrics.py
+"""
+In-process metrics for Nexus, rendered in the Prometheus text format at /metrics.
+
+Counters and histograms are lock-free on the hot path. Each thread writes to its
+own shard, a plain list of floats. Only that thread ever touches the shard, so an
+increment is a single list-slot update with no lock and no contention. A scrape
+adds the shards together. A lock is only taken the first time a thread touches
+a metric (to register its shard) and when a new label combination is created.
+
+Gauges either hold a value set by the caller or call a function at scrape time
+(registry size, pool state, queue depths), so nothing is computed between
+scrapes.
+
+This module only uses the standard library. `render()` returns the exposition
+text, so metrics can be checked in-process without a Prometheus server.
+"""
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Seconds; suited to HTTP handlers, Redis round trips and SQL statements alike.
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)) + "}"
+
+
+class _ShardedValues:
+    """A fixed-size vector of floats with one shard per writing thread."""
+
+    __slots__ = ("_size", "_local", "_shards")
+
+    def __init__(self, size: int):
+        self._size = size
+        self._local = threading.local()
+        self._shards: List[List[float]] = []
+
+    def shard(self) -> List[float]:
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = [0.0] * self._size
+            self._local.shard = shard
+            self._shards.append(shard)  # list.append is atomic; readers copy the list first
+            return shard
+
+    def totals(self) -> List[float]:
+        totals = [0.0] * self._size
+        for shard in list(self._shards):
+            for index, value in enumerate(shard):
+                totals[index] += value
+        return totals
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._children_lock = threading.Lock()
+
+    def labels(self, *values: str):
+        """Returns the child for a label combination. Cache it when labels are fixed."""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+            with self._children_lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def samples(self) -> Iterator[Tuple[str, str, float]]:
+        """Yields (sample name, label text, value) for the exposition format."""
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {_escape(self.documentation)}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(f"{name}{labels} {_format_value(value)}" for name, labels, value in self.samples())
+        return "\n".join(lines)
+
+
+class _CounterChild:
+    __slots__ = ("_values",)
+
+    def __init__(self):
+        self._values = _ShardedValues(1)
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._values.shard()[0] += amount
+
+    def value(self) -> float:
+        return self._values.totals()[0]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+    def samples(self):
+        for values, child in list(self._children.items()):
+            yield self.name, _format_labels(self.labelnames, values), child.value()
+
+
+class _HistogramChild:
+    __slots__ = ("_buckets", "_values")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self._buckets = buckets
+        # One slot per bucket, one for +Inf, then the running sum.
+        self._values = _ShardedValues(len(buckets) + 2)
+
+    def observe(self, value: float) -> None:
+        shard = self._values.shard()
+        shard[bisect.bisect_left(self._buckets, value)] += 1
+        shard[-1] += value
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+    def snapshot(self) -> Tuple[List[float], float, float]:
+        """Returns (cumulative bucket counts including +Inf, sum, count)."""
+        totals = self._values.totals()
+        cumulative, running = [], 0.0
+        for count in totals[:-1]:
+            running += count
+            cumulative.append(running)
+        return cumulative, totals[-1], running
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+    def samples(self):
+        bounds = [_format_value(bound) for bound in self.buckets] + ["+Inf"]
+        for values, child in list(self._children.items()):
+            cumulative, total, count = child.snapshot()
+            for bound, bucket_count in zip(bounds, cumulative):
+                labels = _format_labels(self.labelnames + ("le",), values + (bound,))
+                yield f"{self.name}_bucket", labels, bucket_count
+            labels = _format_labels(self.labelnames, values)
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, count
+
+
+class _GaugeChild:
+    __slots__ = ("_value",)
+
+    def __init__(self):
+        self._value = 0.0
+
+    def set(self, value: float) -> None:
+        self._value = value  # a single assignment; the last writer wins
+
+    def value(self) -> float:
+        return self._value
+
+
+class Gauge(_Metric):
+    """
+    A value set by the caller, or read from `function` at scrape time. With labels,
+    the function returns a mapping of label-value tuples to values.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), function: Optional[Callable] = None):
+        super().__init__(name, documentation, labelnames)
+        self.function = function
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value: float) -> None:
+        self.labels().set(value)
+
+    def samples(self):
+        if self.function is None:
+            for values, child in list(self._children.items()):
+                yield self.name, _format_labels(self.labelnames, values), child.value()
+            return
+        result = self.function()
+        if not self.labelnames:
+            yield self.name, "", float(result)
+            return
+        for values, value in result.items():
+            yield self.name, _format_labels(self.labelnames, values), float(value)
+
+
+class CallbackCounter(Gauge):
+    """A counter whose value is kept elsewhere (e.g. pool statistics) and read at scrape time."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, function: Callable, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames, function=function)
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric already registered: {metric.name}")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = (), function: Optional[Callable] = None) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames, function))
+
+    def callback_counter(self, name: str, documentation: str, function: Callable, labelnames: Sequence[str] = ()) -> CallbackCounter:
+        return self.register(CallbackCounter(name, documentation, function, labelnames))
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        """The Prometheus text exposition of every registered metric."""
+        blocks = []
+        for metric in list(self._metrics.values()):
+            try:
+                blocks.append(metric.render())
+            except Exception as e:  # a failing callback must not take down the whole scrape
+                blocks.append(f"# {metric.name} unavailable: {_escape(str(e))}")
+        return "\n".join(blocks) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+
+class RequestMetricsMiddleware:
+    """
+    ASGI middleware that records request latency per route template (e.g.
+    /files/{user_id}, never the raw path) and response status. Requests that
+    match no route are grouped under "unmatched" so scanners cannot blow up the
+    label set. Latency runs until the last body chunk is sent, so streamed
+    responses are timed in full.
+    """
+
+    def __init__(self, app, histogram: Histogram, skip_paths: Sequence[str] = ("/metrics",)):
+        self.app = app
+        self.histogram = histogram
+        self.skip_paths = frozenset(skip_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope.get("path") in self.skip_paths:
+            await self.app(scope, receive, send)
+            return
+
+        status_code = [500]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status_code[0] = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            self.histogram.labels(scope.get("method", ""), path, str(status_code[0])).observe(time.perf_counter() - started)
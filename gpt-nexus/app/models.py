@@ -0,0 +1,85 @@
+# gpt-nexus/app/models.py
+from sqlalchemy import Boolean, Column, DateTime, ForeignKey, Index, Integer, JSON, String, Text
+from sqlalchemy.orm import declarative_base, relationship
+from sqlalchemy.sql import func
+
+Base = declarative_base()
+
+
+class User(Base):
+    __tablename__ = "users"
+
+    id = Column(Integer, primary_key=True, index=True)
+    username = Column(String(150), unique=True, index=True, nullable=False)
+    email = Column(String(255), unique=True, index=True, nullable=True)
+    hashed_password = Column(String(255), nullable=False)
+    is_active = Column(Boolean, default=True, nullable=False)
+    is_admin = Column(Boolean, default=False, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now(), nullable=True)
+
+    files = relationship("File", back_populates="owner")
+
+    # Fetch server-generated values (id, created_at, updated_at) with INSERT/UPDATE ... RETURNING
+    # in the same statement, so writes need no refresh() round trip.
+    __mapper_args__ = {"eager_defaults": True}
+
+
+class File(Base):
+    __tablename__ = "files"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), index=True, nullable=False)
+    file_name = Column(String(255), nullable=False)
+    file_path = Column(String(1024), nullable=False)
+    file_size_bytes = Column(Integer, nullable=True)
+    file_type = Column(String(255), nullable=True)
+    processing_status = Column(String(50), default="uploaded", nullable=False)
+    upload_timestamp = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    last_processed_at = Column(DateTime(timezone=True), nullable=True)
+    metadata_json = Column(JSON, nullable=True)
+
+    owner = relationship("User", back_populates="files")
+
+    __mapper_args__ = {"eager_defaults": True}
+
+
+class PlanTemplate(Base):
+    """
+    A successful strategy plan stored with its parameters replaced by slots
+    ({p0}, {p1}, ...). Looked up by the request signature, i.e. the normalized
+    request with the same parameters replaced. Written by gpt-agent_strategy.
+    """
+    __tablename__ = "plan_templates"
+
+    id = Column(Integer, primary_key=True, index=True)
+    signature = Column(String(512), unique=True, index=True, nullable=False)
+    plan_json = Column(JSON, nullable=False)
+    description = Column(Text, nullable=True)
+    rule = Column(String(150), nullable=True)
+    hit_count = Column(Integer, default=0, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    last_used_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+
+class OutboxMessage(Base):
+    """
+    A command for an agent, written in the same transaction as the change that
+    caused it and deleted once it is published (see app/outbox.py). A row whose
+    claimed_until is unset or past is waiting for a relay.
+    """
+    __tablename__ = "command_outbox"
+
+    id = Column(Integer, primary_key=True)
+    request_id = Column(String(64), unique=True, nullable=False)
+    agent_type = Column(String(255), nullable=False)
+    priority = Column(Integer, nullable=False)  # index into PRIORITY_CLASSES in app/dispatch.py; lower goes first
+    tenant = Column(String(150), nullable=False)
+    command = Column(JSON, nullable=False)
+    deadline_at = Column(DateTime(timezone=True), nullable=True)
+    attempts = Column(Integer, default=0, nullable=False)
+    claimed_by = Column(String(64), nullable=True)
+    claimed_until = Column(DateTime(timezone=True), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+    __table_args__ = (Index("ix_command_outbox_claim", "priority", "id"),)
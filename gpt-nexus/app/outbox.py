@@ -0,0 +1,337 @@
+# gpt-nexus/app/outbox.py
+"""
+Transactional outbox for commands to agents.
+
+An endpoint that changes the database and wants an agent to act on it writes
+the command as a `command_outbox` row (models.OutboxMessage) in the same
+transaction. The command exists exactly when the change is committed: a
+rollback drops both, and a worker dying after the commit loses neither. The
+relay then sends what the table holds:
+
+- Claiming: a relay takes up to OUTBOX_BATCH_SIZE unclaimed rows with one
+  conditional UPDATE ... RETURNING. Rows are taken in priority order (queries,
+  then uploads, then maintenance). No tenant contributes more than
+  OUTBOX_CLAIM_PER_TENANT rows per class to one claim, so a user's 10k-file
+  reprocess cannot fill a batch. A claim is a lease of OUTBOX_LEASE_SECONDS.
+  The relay renews it while the command waits, and every worker runs a relay.
+  If a worker dies holding rows, another worker claims them once the lease
+  lapses.
+- Ordering: claimed rows go to the dispatch scheduler (app/dispatch.py). It
+  decides when each command may go to its agent type. A relay holds at most
+  OUTBOX_PREFETCH claimed rows per priority class, so bulk work parked in the
+  scheduler never keeps a query row from being claimed.
+- Publishing: the commands the scheduler releases together are published in
+  one pipelined Redis round trip. Their rows are then deleted with one
+  statement. If the publish fails, the rows are released and claimed again
+  after OUTBOX_RETRY_SECONDS.
+- Deadlines: a row with a deadline_at still unsent at its deadline is deleted
+  without being sent, and `on_expired` runs for it.
+
+Delivery is at least once. A crash between the publish and the delete sends
+those commands again after the lease. Every command carries its request_id,
+which the backlog, admission control and single-flight already treat as an
+idempotency key. Agents can use it the same way.
+
+`notify()` wakes the local relay straight after a commit, so a command does
+not wait for the OUTBOX_POLL_SECONDS poll. The poll picks up rows written by
+other workers and rows whose lease or retry delay has run out.
+"""
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+from uuid import uuid4
+
+from sqlalchemy import delete, func, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.dispatch import PRIORITY_CLASSES, DispatchQueueFull, DispatchScheduler, Job
+from app.models import OutboxMessage
+
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", 200))
+OUTBOX_CLAIM_PER_TENANT = int(os.getenv("OUTBOX_CLAIM_PER_TENANT", 50))
+OUTBOX_PREFETCH = int(os.getenv("OUTBOX_PREFETCH", 1000))  # claimed rows held per priority class
+OUTBOX_LEASE_SECONDS = float(os.getenv("OUTBOX_LEASE_SECONDS", 60))
+OUTBOX_RETRY_SECONDS = float(os.getenv("OUTBOX_RETRY_SECONDS", 5))
+OUTBOX_POLL_SECONDS = float(os.getenv("OUTBOX_POLL_SECONDS", 1))
+
+logger = logging.getLogger("nexus.outbox")
+
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class OutboxRelay:
+    """
+    Moves committed outbox rows through the dispatch scheduler onto the bus.
+
+    `session_factory()` opens a database session. `publish(commands)` sends a list of
+    (agent_type, command, priority, tenant) tuples in one round trip. `on_expired(command)` runs for a command
+    dropped at its deadline. `messages` (a counter labelled by outcome) and `batch_sizes`
+    (a histogram) are optional metrics.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], AsyncSession],
+        dispatcher: DispatchScheduler,
+        publish: Callable[[List[Tuple[str, Dict[str, Any], str, str]]], Awaitable[None]],
+        on_expired: Optional[Callable[[Dict[str, Any]], Awaitable[Any]]] = None,
+        batch_size: int = OUTBOX_BATCH_SIZE,
+        claim_per_tenant: int = OUTBOX_CLAIM_PER_TENANT,
+        prefetch: int = OUTBOX_PREFETCH,
+        lease_seconds: float = OUTBOX_LEASE_SECONDS,
+        retry_seconds: float = OUTBOX_RETRY_SECONDS,
+        messages=None,
+        batch_sizes=None,
+    ):
+        self.session_factory = session_factory
+        self.dispatcher = dispatcher
+        self.publish = publish
+        self.on_expired = on_expired
+        self.batch_size = batch_size
+        self.claim_per_tenant = claim_per_tenant
+        self.prefetch = prefetch
+        self.lease_seconds = lease_seconds
+        self.retry_seconds = retry_seconds
+        self.messages = messages
+        self.batch_sizes = batch_sizes
+        self.relay_id = uuid4().hex
+        self._held: Dict[int, int] = {}  # row id -> priority, for rows claimed and not yet sent or released
+        self._wakeup = asyncio.Event()
+        self._renewed_at = 0.0
+        self._backlogged = False  # the last pass left claimable rows behind
+        self.totals = {"claimed": 0, "published": 0, "expired": 0, "failed": 0, "batches": 0}
+
+    def enqueue(self, session: AsyncSession, agent_type: str, command: Dict[str, Any], priority: str,
+                tenant: Any, deadline_seconds: Optional[float] = None) -> OutboxMessage:
+        """
+        Adds `command` to the session's transaction. The caller commits, then calls notify().
+        The deadline defaults to the dispatcher's deadline for the priority class.
+        """
+        if deadline_seconds is None:
+            deadline_seconds = self.dispatcher.deadlines.get(priority, 0.0)
+        command = {**command, "request_id": command.get("request_id") or str(uuid4())}
+        row = OutboxMessage(
+            request_id=command["request_id"],
+            agent_type=agent_type,
+            priority=PRIORITY_CLASSES.index(priority),
+            tenant=str(tenant),
+            command=command,
+            deadline_at=utcnow() + timedelta(seconds=deadline_seconds) if deadline_seconds > 0 else None,
+            attempts=0,
+        )
+        session.add(row)
+        return row
+
+    async def requeue(self, records: List[Dict[str, Any]]) -> None:
+        """
+        Writes commands back to the outbox in one transaction, e.g. retries due from app/retry.py.
+        Each record has request_id, agent_type, command, priority and tenant. A request_id that
+        still has a row is skipped.
+        """
+        async with self.session_factory() as session:
+            result = await session.execute(
+                select(OutboxMessage.request_id).where(OutboxMessage.request_id.in_([record["request_id"] for record in records]))
+            )
+            present = set(result.scalars().all())
+            for record in records:
+                if record["request_id"] not in present:
+                    command = {**record["command"], "request_id": record["request_id"]}
+                    self.enqueue(session, record["agent_type"], command, record["priority"], record["tenant"])
+            await session.commit()
+        self.notify()
+
+    def notify(self) -> None:
+        """Wakes the relay; call after committing rows."""
+        self._wakeup.set()
+
+    async def run(self, poll_seconds: float = OUTBOX_POLL_SECONDS) -> None:
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                try:
+                    await self.pump()
+                except Exception:
+                    logger.exception("Outbox relay pass failed")
+        finally:
+            await self.release_held()
+
+    async def pump(self) -> int:
+        """Renews leases when due and claims rows up to the prefetch limit. Returns rows claimed."""
+        if self._held and time.monotonic() - self._renewed_at >= self.lease_seconds / 3:
+            await self.renew()
+        held_by_class = [0] * len(PRIORITY_CLASSES)
+        for priority in self._held.values():
+            held_by_class[priority] += 1
+        classes = [priority for priority, held in enumerate(held_by_class) if held < self.prefetch]
+        self._backlogged = len(classes) < len(PRIORITY_CLASSES)
+        if not classes:
+            return 0
+        rows = await self.claim(classes)
+        now = utcnow()
+        for row in rows:
+            self._held[row.id] = row.priority
+            if row.deadline_at is not None and _aware(row.deadline_at) <= now:
+                await self._drop_expired(row.id, row.command)
+                continue
+            remaining = (_aware(row.deadline_at) - now).total_seconds() if row.deadline_at is not None else 0.0
+            try:
+                self.dispatcher.submit(
+                    row.agent_type, None, PRIORITY_CLASSES[row.priority], row.tenant,
+                    deadline_seconds=remaining, payload=(row.id, row.agent_type, row.command),
+                    on_expired=lambda row_id=row.id, command=row.command: self._drop_expired(row_id, command),
+                )
+            except DispatchQueueFull:
+                await self.release([row.id], delay_seconds=self.retry_seconds)
+        if len(rows) == self.batch_size:
+            self._backlogged = True
+            self._wakeup.set()  # there may be more waiting
+        return len(rows)
+
+    async def claim(self, classes: Sequence[int]) -> List[Any]:
+        """Claims up to batch_size claimable rows of the given priorities, highest priority first."""
+        now = utcnow()
+        claimable = or_(OutboxMessage.claimed_until.is_(None), OutboxMessage.claimed_until < now)
+        ranked = (
+            select(
+                OutboxMessage.id,
+                OutboxMessage.priority,
+                func.row_number().over(
+                    partition_by=(OutboxMessage.priority, OutboxMessage.tenant), order_by=OutboxMessage.id
+                ).label("turn"),
+            )
+            .where(claimable, OutboxMessage.priority.in_(list(classes)))
+            .subquery()
+        )
+        picked = (
+            select(ranked.c.id)
+            .where(ranked.c.turn <= self.claim_per_tenant)
+            .order_by(ranked.c.priority, ranked.c.turn, ranked.c.id)
+            .limit(self.batch_size)
+        )
+        # `claimable` is repeated on the UPDATE itself. A row another relay claimed while this
+        # statement waited for its lock is then re-checked and skipped, not claimed twice.
+        statement = (
+            update(OutboxMessage)
+            .where(OutboxMessage.id.in_(picked), claimable)
+            .values(claimed_by=self.relay_id, claimed_until=now + timedelta(seconds=self.lease_seconds),
+                    attempts=OutboxMessage.attempts + 1)
+            .returning(OutboxMessage.id, OutboxMessage.agent_type, OutboxMessage.priority, OutboxMessage.tenant,
+                       OutboxMessage.command, OutboxMessage.deadline_at)
+            .execution_options(synchronize_session=False)
+        )
+        async with self.session_factory() as session:
+            rows = (await session.execute(statement)).all()
+            await session.commit()
+        rows.sort(key=lambda row: (row.priority, row.id))
+        self.totals["claimed"] += len(rows)
+        self._count("claimed", len(rows))
+        return rows
+
+    async def send_batch(self, jobs: List[Job]) -> None:
+        """The dispatcher's send_batch: publishes the jobs' commands in one round trip, then deletes their rows."""
+        row_ids = [job.payload[0] for job in jobs]
+        try:
+            await self.publish([(job.payload[1], job.payload[2], job.priority, job.tenant) for job in jobs])
+        except Exception:
+            self.totals["failed"] += len(jobs)
+            self._count("failed", len(jobs))
+            await self.release(row_ids, delay_seconds=self.retry_seconds)
+            raise
+        self.totals["published"] += len(jobs)
+        self.totals["batches"] += 1
+        self._count("published", len(jobs))
+        if self.batch_sizes is not None:
+            self.batch_sizes.observe(len(jobs))
+        await self._delete(row_ids)
+
+    async def renew(self) -> None:
+        """Extends the lease on every row this relay holds."""
+        self._renewed_at = time.monotonic()
+        async with self.session_factory() as session:
+            await session.execute(
+                update(OutboxMessage)
+                .where(OutboxMessage.id.in_(list(self._held)), OutboxMessage.claimed_by == self.relay_id)
+                .values(claimed_until=utcnow() + timedelta(seconds=self.lease_seconds))
+                .execution_options(synchronize_session=False)
+            )
+            await session.commit()
+
+    async def release(self, row_ids: List[int], delay_seconds: float = 0.0) -> None:
+        """Gives rows back, claimable again after `delay_seconds`."""
+        for row_id in row_ids:
+            self._held.pop(row_id, None)
+        async with self.session_factory() as session:
+            await session.execute(
+                update(OutboxMessage)
+                .where(OutboxMessage.id.in_(row_ids), OutboxMessage.claimed_by == self.relay_id)
+                .values(claimed_by=None, claimed_until=utcnow() + timedelta(seconds=delay_seconds) if delay_seconds > 0 else None)
+                .execution_options(synchronize_session=False)
+            )
+            await session.commit()
+
+    async def release_held(self) -> None:
+        """At shutdown: hands back every held row, so the next relay need not wait out the lease."""
+        if not self._held:
+            return
+        try:
+            await self.release(list(self._held))
+        except Exception:
+            logger.exception("Could not release held outbox rows; they are reclaimed when their lease runs out")
+
+    async def pending(self) -> Dict[str, Any]:
+        """Unsent rows per priority class and the age of the oldest, from the table (all workers)."""
+        async with self.session_factory() as session:
+            result = await session.execute(
+                select(OutboxMessage.priority, func.count(), func.min(OutboxMessage.created_at)).group_by(OutboxMessage.priority)
+            )
+            rows = result.all()
+        now = utcnow()
+        return {
+            PRIORITY_CLASSES[priority]: {
+                "rows": count,
+                "oldest_seconds": round((now - _aware(oldest)).total_seconds(), 3) if oldest is not None else None,
+            }
+            for priority, count, oldest in rows
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        held = dict.fromkeys(PRIORITY_CLASSES, 0)
+        for priority in self._held.values():
+            held[PRIORITY_CLASSES[priority]] += 1
+        return {"relay_id": self.relay_id, "held": held, **{f"{name}_total": value for name, value in self.totals.items()}}
+
+    async def _drop_expired(self, row_id: int, command: Dict[str, Any]) -> None:
+        self.totals["expired"] += 1
+        self._count("expired", 1)
+        await self._delete([row_id])
+        if self.on_expired is not None:
+            await self.on_expired(command)
+
+    async def _delete(self, row_ids: List[int]) -> None:
+        for row_id in row_ids:
+            self._held.pop(row_id, None)
+        async with self.session_factory() as session:
+            await session.execute(
+                delete(OutboxMessage).where(OutboxMessage.id.in_(row_ids)).execution_options(synchronize_session=False)
+            )
+            await session.commit()
+        if self._backlogged:
+            self._wakeup.set()  # room for rows the last claim had to leave behind
+
+    def _count(self, outcome: str, amount: int) -> None:
+        if self.messages is not None and amount:
+            self.messages.labels(outcome).inc(amount)
+
+
+def _aware(value: datetime) -> datetime:
+    # SQLite hands timestamps back without a zone; they were written in UTC.
+    return value if value.tzinfo is not None else value.replace(tzinfo=timezone.utc)
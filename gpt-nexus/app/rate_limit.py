@@ -0,0 +1,281 @@
+# gpt-nexus/app/rate_limit.py
+"""
+Distributed rate limiting for the Nexus API (GCRA, shared through Redis).
+
+Settings mirror the `security` section of agent_config.yaml:
+
+- RATE_LIMIT_PER_MINUTE: requests per minute per client, across all routes.
+  Defaults to 100, like `security.rate_limit_per_minute`. 0 disables limiting.
+- RATE_LIMIT_BURST: requests a client may send back to back. Defaults to the
+  per-minute limit, so a client that sent nothing for a minute may spend the
+  whole minute's allowance at once.
+- RATE_LIMIT_ROUTES: extra, tighter limits per route template, e.g.
+  "/auth/token=10,/query=60". These are checked in addition to the
+  client-wide limit. A route set to 0 has no limit of its own.
+- RATE_LIMIT_EXEMPT: route templates that are never limited. The defaults are
+  the Prometheus scrape and agent heartbeats.
+- RATE_LIMIT_REDIS_TIMEOUT_MS and RATE_LIMIT_FALLBACK_SECONDS: see below.
+
+A client is the user in a valid bearer token, otherwise the peer IP. The
+algorithm is GCRA (generic cell rate algorithm). Each key stores one number,
+the theoretical arrival time (TAT). A request is allowed if advancing the TAT
+by one emission interval (60s / limit) keeps it within the burst tolerance of
+now. This gives sliding-window behaviour with O(1) state per key, and the key
+expires as soon as the client is back to a full allowance.
+
+One EVALSHA of a Lua script checks the client key and the route key (if the
+route has its own limit) together. It uses the Redis server clock, so every
+worker and host agrees on time, and it updates nothing unless every key allows
+the request.
+
+Local fallback: if Redis errors or takes longer than
+RATE_LIMIT_REDIS_TIMEOUT_MS, the same algorithm runs in process and Redis is
+skipped for RATE_LIMIT_FALLBACK_SECONDS. Slow Redis then adds at most one
+timeout per fallback period instead of one per request. Local limits are per
+worker, so during a fallback a client may get up to one allowance per worker.
+
+Limited requests get 429 with Retry-After. Every checked response carries
+X-RateLimit-Limit and X-RateLimit-Remaining.
+"""
+import asyncio
+import json
+import logging
+import math
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from starlette.routing import Match
+
+RATE_LIMIT_PER_MINUTE = int(os.getenv("RATE_LIMIT_PER_MINUTE", 100))
+RATE_LIMIT_BURST = int(os.getenv("RATE_LIMIT_BURST", 0)) or RATE_LIMIT_PER_MINUTE
+RATE_LIMIT_ROUTES = os.getenv("RATE_LIMIT_ROUTES", "")
+RATE_LIMIT_EXEMPT = os.getenv("RATE_LIMIT_EXEMPT", "/metrics,/agent/heartbeat")
+RATE_LIMIT_REDIS_TIMEOUT_MS = float(os.getenv("RATE_LIMIT_REDIS_TIMEOUT_MS", 25))
+RATE_LIMIT_FALLBACK_SECONDS = float(os.getenv("RATE_LIMIT_FALLBACK_SECONDS", 5))
+
+logger = logging.getLogger("nexus.rate_limit")
+
+# KEYS: one per limit. ARGV: emission interval and burst tolerance (ms) for each key, in order.
+# Returns {allowed (0/1), remaining, retry after ms}. Nothing is written unless every key allows.
+_GCRA_SCRIPT = """
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) * 1000 + math.floor(tonumber(clock[2]) / 1000)
+local retry_after = 0
+local remaining = -1
+local tats = {}
+for i, key in ipairs(KEYS) do
+    local emission = tonumber(ARGV[2 * i - 1])
+    local tolerance = tonumber(ARGV[2 * i])
+    local tat = tonumber(redis.call('GET', key) or now)
+    if tat < now then tat = now end
+    local new_tat = tat + emission
+    local wait = new_tat - tolerance - now
+    if wait > 0 then
+        if wait > retry_after then retry_after = wait end
+    else
+        tats[i] = new_tat
+        local left = math.floor((tolerance - (new_tat - now)) / emission)
+        if remaining < 0 or left < remaining then remaining = left end
+    end
+end
+if retry_after > 0 then
+    return {0, 0, retry_after}
+end
+for i, key in ipairs(KEYS) do
+    redis.call('SET', key, tats[i], 'PX', tats[i] - now)
+end
+return {1, remaining, 0}
+"""
+
+
+def parse_route_limits(spec: str) -> Dict[str, int]:
+    """Parses "route=limit,..." into {route template: requests per minute}."""
+    limits = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        route, _, limit = item.rpartition("=")
+        try:
+            limits[route.strip()] = int(limit)
+        except ValueError:
+            raise ValueError(f"Invalid RATE_LIMIT_ROUTES entry: {item!r}")
+    return limits
+
+
+class Limit:
+    """
+    A per-minute limit as GCRA parameters, in whole milliseconds (the script's unit).
+    A limit of 0 or less means unlimited; such a limit is never checked.
+    """
+
+    __slots__ = ("per_minute", "emission_ms", "tolerance_ms")
+
+    def __init__(self, per_minute: int, burst: Optional[int] = None):
+        self.per_minute = per_minute
+        self.emission_ms = max(1, round(60000 / per_minute)) if per_minute > 0 else 0
+        self.tolerance_ms = self.emission_ms * (burst or per_minute) if per_minute > 0 else 0
+
+
+class Decision:
+    __slots__ = ("allowed", "remaining", "retry_after", "limit", "backend")
+
+    def __init__(self, allowed: bool, remaining: int, retry_after: float, limit: int, backend: str):
+        self.allowed = allowed
+        self.remaining = remaining
+        self.retry_after = retry_after  # seconds
+        self.limit = limit
+        self.backend = backend
+
+
+class LocalGCRA:
+    """The same algorithm in process, for when Redis is slow or down. Per worker."""
+
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        self._tats: Dict[str, float] = {}
+
+    def check(self, keys: Sequence[str], limits: Sequence[Limit], now: Optional[float] = None) -> Tuple[bool, int, float]:
+        now = time.monotonic() * 1000 if now is None else now
+        if len(self._tats) >= self.max_keys:
+            self._tats = {key: tat for key, tat in self._tats.items() if tat > now}
+        retry_after, remaining, tats = 0.0, -1, []
+        for key, limit in zip(keys, limits):
+            new_tat = max(self._tats.get(key, now), now) + limit.emission_ms
+            wait = new_tat - limit.tolerance_ms - now
+            if wait > 0:
+                retry_after = max(retry_after, wait)
+                continue
+            tats.append(new_tat)
+            left = int((limit.tolerance_ms - (new_tat - now)) // limit.emission_ms)
+            remaining = left if remaining < 0 else min(remaining, left)
+        if retry_after > 0:
+            return False, 0, retry_after
+        self._tats.update(zip(keys, tats))
+        return True, remaining, 0.0
+
+
+class RateLimiter:
+    def __init__(
+        self,
+        redis: Any = None,
+        per_minute: int = RATE_LIMIT_PER_MINUTE,
+        burst: int = RATE_LIMIT_BURST,
+        route_limits: Optional[Dict[str, int]] = None,
+        namespace: str = "ratelimit",
+        redis_timeout_ms: float = RATE_LIMIT_REDIS_TIMEOUT_MS,
+        fallback_seconds: float = RATE_LIMIT_FALLBACK_SECONDS,
+    ):
+        self.redis = redis
+        self.limit = Limit(per_minute, burst)
+        self.route_limits = {
+            route: Limit(limit)
+            for route, limit in (parse_route_limits(RATE_LIMIT_ROUTES) if route_limits is None else route_limits).items()
+            if limit > 0
+        }
+        self.namespace = namespace
+        self.redis_timeout = redis_timeout_ms / 1000
+        self.fallback_seconds = fallback_seconds
+        self.local = LocalGCRA()
+        self._script = redis.register_script(_GCRA_SCRIPT) if redis is not None else None
+        self._redis_skipped_until = 0.0
+        self.fallbacks_total = 0
+
+    def _limits_for(self, client: str, route: str) -> Tuple[List[str], List[Limit]]:
+        keys, limits = [f"{self.namespace}:{client}"], [self.limit]
+        route_limit = self.route_limits.get(route)
+        if route_limit is not None:
+            keys.append(f"{self.namespace}:{client}:{route}")
+            limits.append(route_limit)
+        return keys, limits
+
+    async def check(self, client: str, route: str) -> Decision:
+        keys, limits = self._limits_for(client, route)
+        tightest = min(limit.per_minute for limit in limits)
+        if self._script is not None and time.monotonic() >= self._redis_skipped_until:
+            args = [value for limit in limits for value in (limit.emission_ms, limit.tolerance_ms)]
+            try:
+                allowed, remaining, retry_after_ms = await asyncio.wait_for(self._script(keys=keys, args=args), self.redis_timeout)
+                return Decision(bool(allowed), int(remaining), int(retry_after_ms) / 1000, tightest, "redis")
+            except Exception as e:  # Includes the timeout; fall back rather than fail the request.
+                self._redis_skipped_until = time.monotonic() + self.fallback_seconds
+                self.fallbacks_total += 1
+                logger.warning("Rate limiter falling back to local limits", extra={"error": repr(e), "for_seconds": self.fallback_seconds})
+        allowed, remaining, retry_after_ms = self.local.check(keys, limits)
+        return Decision(allowed, remaining, retry_after_ms / 1000, tightest, "local")
+
+
+class RateLimitMiddleware:
+    """
+    ASGI middleware that checks every HTTP request against a RateLimiter before routing.
+
+    `get_limiter` returns the limiter, or None before startup. `identify(scope)` returns
+    the client key. The route template is resolved by matching the app's routes, cached
+    per (method, path).
+    """
+
+    def __init__(self, app, get_limiter: Callable[[], Optional[RateLimiter]], identify: Callable[[dict], str],
+                 exempt: str = RATE_LIMIT_EXEMPT, decisions=None, check_seconds=None):
+        self.app = app
+        self.get_limiter = get_limiter
+        self.identify = identify
+        self.exempt = {route.strip() for route in exempt.split(",") if route.strip()}
+        self.decisions = decisions
+        self.check_seconds = check_seconds
+        self._routes: Dict[Tuple[str, str], str] = {}
+
+    def _route_of(self, scope: dict) -> str:
+        cache_key = (scope["method"], scope["path"])
+        route = self._routes.get(cache_key)
+        if route is None:
+            route = "unmatched"
+            for candidate in scope["app"].router.routes:
+                match, _ = candidate.matches(scope)
+                if match == Match.FULL:
+                    route = candidate.path
+                    break
+            if len(self._routes) >= 4096:
+                self._routes.clear()
+            self._routes[cache_key] = route
+        return route
+
+    async def __call__(self, scope, receive, send):
+        limiter = self.get_limiter() if scope["type"] == "http" else None
+        if limiter is None or limiter.limit.per_minute <= 0:
+            await self.app(scope, receive, send)
+            return
+        route = self._route_of(scope)
+        if route in self.exempt:
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        decision = await limiter.check(self.identify(scope), route)
+        if self.check_seconds is not None:
+            self.check_seconds.labels(decision.backend).observe(time.perf_counter() - started)
+        if self.decisions is not None:
+            self.decisions.labels("allowed" if decision.allowed else "limited", decision.backend).inc()
+        rate_headers = [
+            (b"x-ratelimit-limit", str(decision.limit).encode()),
+            (b"x-ratelimit-remaining", str(max(0, decision.remaining)).encode()),
+        ]
+
+        if not decision.allowed:
+            body = json.dumps({"detail": "Rate limit exceeded; retry later."}).encode()
+            await send({
+                "type": "http.response.start",
+                "status": 429,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"retry-after", str(max(1, math.ceil(decision.retry_after))).encode()),
+                    *rate_headers,
+                ],
+            })
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": [*message.get("headers", []), *rate_headers]}
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
@@ -0,0 +1,273 @@
+# gpt-nexus/app/retry.py
+"""
+Retries and a dead-letter queue for commands that agents report as failed.
+
+When an agent's tool raises, the agent publishes message_type="error" with
+the command's request_id (and `retryable`: false for errors a retry cannot
+fix, e.g. a malformed command). Without this module the work was dropped
+there.
+
+- Remember: every command published to an agent also leaves a retry record,
+  a hash at retry:cmd:<request_id>. It holds the agent type, priority class,
+  tenant, command and attempt count, and expires after
+  RETRY_COMMAND_TTL_SECONDS. It is written in the same pipeline as the
+  publish, so it costs no extra round trip. A result deletes it.
+- Schedule: on an error, the attempt is retried unless it was the
+  RETRY_MAX_ATTEMPTS-th or the agent said it is not retryable. The retry goes
+  into the sorted set retry:due, scored by the time of the next attempt.
+  Backoff is exponential with full jitter: uniform(0, min(RETRY_MAX_SECONDS,
+  RETRY_BASE_SECONDS * 2^(attempt-1))). Commands that failed together
+  therefore come back spread out, not in lockstep. Every Nexus worker sees
+  every inbox message, so one SET NX key per attempt picks the worker that
+  handles the failure.
+- Dispatch: each worker polls every RETRY_POLL_SECONDS. A Lua script takes at
+  most RETRY_BATCH_SIZE due entries, atomically, so no two workers take the
+  same one. They are written back to the command outbox in one transaction,
+  with their original priority and tenant. From there they queue behind the
+  dispatch scheduler's windows like any other command. A dependency that
+  fails everything therefore sees at most one batch of retries per poll per
+  worker, within its agent type's window, never the whole backlog at once.
+- Dead letters: a command out of attempts or not retryable is pushed onto the
+  list retry:dlq with its last error. The list is capped at RETRY_DLQ_MAX
+  entries, newest first. `replay()` puts entries back on retry:due with a
+  fresh attempt count. It is used by /admin/dlq/replay and by the
+  dlq_tool.py script at the repository root.
+
+Retries reuse the command's request_id, so results, the backlog and
+single-flight still match them. A query whose command is being retried keeps
+its waiters until the retry answers.
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence
+
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", 5))  # dispatches per command, the first included
+RETRY_BASE_SECONDS = float(os.getenv("RETRY_BASE_SECONDS", 2))
+RETRY_MAX_SECONDS = float(os.getenv("RETRY_MAX_SECONDS", 300))
+RETRY_BATCH_SIZE = int(os.getenv("RETRY_BATCH_SIZE", 100))
+RETRY_POLL_SECONDS = float(os.getenv("RETRY_POLL_SECONDS", 1))
+RETRY_COMMAND_TTL_SECONDS = int(os.getenv("RETRY_COMMAND_TTL_SECONDS", 3600))
+RETRY_DLQ_MAX = int(os.getenv("RETRY_DLQ_MAX", 10000))
+
+logger = logging.getLogger("nexus.retry")
+
+# KEYS: the due set. ARGV: now, batch size. Removes and returns up to batch size members due by now.
+_TAKE_DUE_SCRIPT = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[2]))
+if #due > 0 then
+    redis.call('ZREM', KEYS[1], unpack(due))
+end
+return due
+"""
+
+
+def backoff_seconds(attempt: int, base: float = RETRY_BASE_SECONDS, cap: float = RETRY_MAX_SECONDS,
+                    rng: Optional[random.Random] = None) -> float:
+    """Full-jitter exponential backoff before retrying a command whose `attempt`-th dispatch failed."""
+    return (rng or random).uniform(0, min(cap, base * 2 ** max(0, attempt - 1)))
+
+
+def _text(value: Any) -> str:
+    return value.decode() if isinstance(value, bytes) else str(value)
+
+
+class RetryScheduler:
+    """
+    Retry records, the due set and the DLQ, all in Redis and shared by every worker.
+
+    `outcomes` (a counter labelled by outcome: scheduled, dead_lettered, requeued, replayed)
+    is an optional metric, counted by the worker that did the work.
+    """
+
+    def __init__(
+        self,
+        redis: Any,
+        namespace: str = "retry",
+        max_attempts: int = RETRY_MAX_ATTEMPTS,
+        base_seconds: float = RETRY_BASE_SECONDS,
+        max_seconds: float = RETRY_MAX_SECONDS,
+        batch_size: int = RETRY_BATCH_SIZE,
+        command_ttl_seconds: int = RETRY_COMMAND_TTL_SECONDS,
+        dlq_max: int = RETRY_DLQ_MAX,
+        outcomes=None,
+    ):
+        self.redis = redis
+        self.namespace = namespace
+        self.max_attempts = max_attempts
+        self.base_seconds = base_seconds
+        self.max_seconds = max_seconds
+        self.batch_size = batch_size
+        self.command_ttl_seconds = command_ttl_seconds
+        self.dlq_max = dlq_max
+        self.outcomes = outcomes
+        self.due_key = f"{namespace}:due"
+        self.dlq_key = f"{namespace}:dlq"
+        self._take_due = redis.register_script(_TAKE_DUE_SCRIPT)
+        self.totals = {"scheduled": 0, "dead_lettered": 0, "requeued": 0, "replayed": 0}
+
+    def _record_key(self, request_id: str) -> str:
+        return f"{self.namespace}:cmd:{request_id}"
+
+    def remember(self, pipeline: Any, request_id: str, agent_type: str, command: Dict[str, Any],
+                 priority: str, tenant: Any) -> None:
+        """Queues the retry record for a command onto the pipeline that publishes it; each call is one attempt."""
+        key = self._record_key(request_id)
+        pipeline.hset(key, mapping={
+            "agent_type": agent_type, "priority": priority, "tenant": str(tenant), "command": json.dumps(command, default=str),
+        })
+        pipeline.hincrby(key, "attempt", 1)
+        pipeline.expire(key, self.command_ttl_seconds)
+
+    async def forget(self, request_id: str) -> None:
+        """The command succeeded; it will not be retried."""
+        await self.redis.unlink(self._record_key(request_id))
+
+    async def failed(self, request_id: str, error: Any, retryable: bool = True, now: Optional[float] = None) -> Optional[str]:
+        """
+        Handles an agent's error for a command. Returns "scheduled" (a retry will follow, so
+        waiters should keep waiting), "dead_lettered", or None for a command with no retry
+        record (never remembered, expired, or already dead-lettered). Every worker gets the
+        same answer; only the first to claim the attempt writes it.
+        """
+        now = time.time() if now is None else now
+        key = self._record_key(request_id)
+        record = {_text(field): _text(value) for field, value in (await self.redis.hgetall(key)).items()}
+        if not record:
+            return None
+        attempt = int(record.get("attempt", 1))
+        outcome = "scheduled" if retryable and attempt < self.max_attempts else "dead_lettered"
+        # Every worker reads the inbox; the first to claim this attempt handles it.
+        if not await self.redis.set(f"{key}:handled:{attempt}", outcome, nx=True, ex=self.command_ttl_seconds):
+            return outcome
+
+        pipeline = self.redis.pipeline(transaction=True)
+        if outcome == "dead_lettered":
+            entry = {
+                "request_id": request_id, "agent_type": record.get("agent_type"), "priority": record.get("priority"),
+                "tenant": record.get("tenant"), "command": json.loads(record.get("command") or "null"),
+                "attempts": attempt, "error": error, "retryable": retryable, "dead_at": now,
+            }
+            pipeline.lpush(self.dlq_key, json.dumps(entry, default=str))
+            pipeline.ltrim(self.dlq_key, 0, self.dlq_max - 1)
+            pipeline.delete(key)
+            await pipeline.execute()
+            logger.warning("Command dead-lettered", extra={"request_id": request_id, "attempts": attempt, "retryable": retryable, "error": error})
+        else:
+            delay = backoff_seconds(attempt, self.base_seconds, self.max_seconds)
+            pipeline.hset(key, "last_error", json.dumps(error, default=str))
+            pipeline.expire(key, self.command_ttl_seconds + int(delay) + 1)
+            pipeline.zadd(self.due_key, {request_id: now + delay})
+            await pipeline.execute()
+            logger.info("Command retry scheduled", extra={"request_id": request_id, "attempt": attempt, "delay_seconds": round(delay, 3)})
+        self._count(outcome, 1)
+        return outcome
+
+    async def take_due(self, now: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Removes up to batch_size due retries from the set and returns their records."""
+        now = time.time() if now is None else now
+        request_ids = [_text(member) for member in await self._take_due(keys=[self.due_key], args=[now, self.batch_size])]
+        if not request_ids:
+            return []
+        pipeline = self.redis.pipeline(transaction=False)
+        for request_id in request_ids:
+            pipeline.hgetall(self._record_key(request_id))
+        records = []
+        for request_id, raw in zip(request_ids, await pipeline.execute()):
+            record = {_text(field): _text(value) for field, value in raw.items()}
+            if not record:  # expired while waiting; nothing left to retry
+                continue
+            records.append({
+                "request_id": request_id, "agent_type": record["agent_type"], "priority": record["priority"],
+                "tenant": record["tenant"], "command": json.loads(record["command"]), "attempt": int(record.get("attempt", 1)),
+            })
+        return records
+
+    async def reschedule(self, request_ids: Sequence[str], delay_seconds: float, now: Optional[float] = None) -> None:
+        """Puts taken retries back, e.g. when they could not be written to the outbox."""
+        if request_ids:
+            due = (time.time() if now is None else now) + delay_seconds
+            await self.redis.zadd(self.due_key, {request_id: due for request_id in request_ids})
+
+    async def run(self, requeue: Callable[[List[Dict[str, Any]]], Awaitable[None]], poll_seconds: float = RETRY_POLL_SECONDS) -> None:
+        """Every poll, hands one batch of due retries to `requeue` (which writes them to the outbox)."""
+        while True:
+            await asyncio.sleep(poll_seconds)
+            records = []
+            try:
+                records = await self.take_due()
+                if records:
+                    await requeue(records)
+                    self._count("requeued", len(records))
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Retry pass failed", extra={"retries": len(records)})
+                try:
+                    await self.reschedule([record["request_id"] for record in records], self.base_seconds)
+                except Exception:
+                    logger.exception("Could not put retries back; they are lost")
+
+    async def dead_letters(self, start: int = 0, count: int = 50) -> List[Dict[str, Any]]:
+        """DLQ entries, newest first."""
+        return [json.loads(entry) for entry in await self.redis.lrange(self.dlq_key, start, start + count - 1)]
+
+    async def dlq_length(self) -> int:
+        return await self.redis.llen(self.dlq_key)
+
+    async def replay(self, request_ids: Optional[Sequence[str]] = None, limit: int = 100, now: Optional[float] = None) -> List[str]:
+        """
+        Moves DLQ entries back onto the due set with a fresh attempt count: the given request_ids,
+        or up to `limit` of the oldest entries. Returns the request_ids replayed.
+        """
+        now = time.time() if now is None else now
+        wanted = set(request_ids) if request_ids is not None else None
+        entries = await self.redis.lrange(self.dlq_key, 0, -1)
+        chosen = []
+        for raw in reversed(entries):  # oldest first
+            entry = json.loads(raw)
+            if (wanted is None or entry["request_id"] in wanted) and len(chosen) < limit:
+                chosen.append((raw, entry))
+        if not chosen:
+            return []
+        pipeline = self.redis.pipeline(transaction=True)
+        for raw, entry in chosen:
+            key = self._record_key(entry["request_id"])
+            pipeline.lrem(self.dlq_key, 1, raw)
+            pipeline.delete(key, *(f"{key}:handled:{attempt}" for attempt in range(1, self.max_attempts + 1)))
+            pipeline.hset(key, mapping={
+                "agent_type": entry["agent_type"], "priority": entry["priority"], "tenant": entry["tenant"],
+                "command": json.dumps(entry["command"], default=str), "attempt": 0,
+            })
+            pipeline.expire(key, self.command_ttl_seconds)
+            pipeline.zadd(self.due_key, {entry["request_id"]: now})
+        await pipeline.execute()
+        self._count("replayed", len(chosen))
+        return [entry["request_id"] for _, entry in chosen]
+
+    async def purge(self) -> int:
+        """Drops every DLQ entry; returns how many there were."""
+        pipeline = self.redis.pipeline(transaction=True)
+        pipeline.llen(self.dlq_key)
+        pipeline.delete(self.dlq_key)
+        length, _ = await pipeline.execute()
+        return length
+
+    async def stats(self) -> Dict[str, Any]:
+        pipeline = self.redis.pipeline(transaction=False)
+        pipeline.zcard(self.due_key)
+        pipeline.zcount(self.due_key, "-inf", time.time())
+        pipeline.llen(self.dlq_key)
+        scheduled, overdue, dead = await pipeline.execute()
+        return {
+            "max_attempts": self.max_attempts, "scheduled": scheduled, "due_now": overdue, "dead_letters": dead,
+            **{f"{name}_total": value for name, value in self.totals.items()},
+        }
+
+    def _count(self, outcome: str, amount: int) -> None:
+        self.totals[outcome] += amount
+        if self.outcomes is not None and amount:
+            self.outcomes.labels(outcome).inc(amount)
@@ -0,0 +1,166 @@
+# gpt-nexus/app/singleflight.py
+"""
+Request coalescing ("single-flight") for identical in-flight agent commands.
+
+When many users send the same query at once, only the first caller (the leader)
+publishes a command to the agent. Every other caller (a follower) is handed the
+leader's request_id and waits on the same result. Coordination across uvicorn
+workers goes through a Redis lock key per query; results are stored under a
+Redis result key so any worker can answer any waiter. The callers that joined
+a flight are kept in a Redis set, so only they can read its result.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import time
+from typing import Any, Dict, Optional, Tuple, Union
+
+from redis.asyncio import Redis
+
+SINGLEFLIGHT_LOCK_TTL_SECONDS = int(os.getenv("SINGLEFLIGHT_LOCK_TTL_SECONDS", 60))
+SINGLEFLIGHT_RESULT_TTL_SECONDS = int(os.getenv("SINGLEFLIGHT_RESULT_TTL_SECONDS", 300))
+
+# Deletes the lock only if it is still owned by the given request_id, so a slow
+# leader can never release a lock that has since been taken by a new flight.
+_RELEASE_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def make_flight_key(agent_id: str, command: str, text: str) -> str:
+    """Builds the coalescing key for a command. Case and whitespace are normalized."""
+    normalized = " ".join(text.lower().split())
+    return hashlib.sha256(f"{agent_id}|{command}|{normalized}".encode("utf-8")).hexdigest()
+
+
+def _as_str(value: Any) -> Optional[str]:
+    if isinstance(value, bytes):
+        return value.decode("utf-8")
+    return value
+
+
+class SingleFlight:
+    def __init__(
+        self,
+        redis: Redis,
+        namespace: str = "singleflight",
+        lock_ttl_seconds: int = SINGLEFLIGHT_LOCK_TTL_SECONDS,
+        result_ttl_seconds: int = SINGLEFLIGHT_RESULT_TTL_SECONDS,
+    ):
+        self.redis = redis
+        self.namespace = namespace
+        self.lock_ttl_seconds = lock_ttl_seconds
+        self.result_ttl_seconds = result_ttl_seconds
+        # flight key -> (request_id, local expiry); avoids a Redis round trip for local herds
+        self._inflight: Dict[str, Tuple[str, float]] = {}
+        self._keys_by_request: Dict[str, str] = {}
+        self._waiters: Dict[str, asyncio.Future] = {}
+        self._waiting: Dict[str, int] = {}  # request_id -> local callers blocked in wait()
+        self.stats = {"leaders": 0, "followers": 0, "resolved": 0}
+
+    def _lock_key(self, key: str) -> str:
+        return f"{self.namespace}:lock:{key}"
+
+    def _result_key(self, request_id: str) -> str:
+        return f"{self.namespace}:result:{request_id}"
+
+    def _members_key(self, request_id: str) -> str:
+        return f"{self.namespace}:members:{request_id}"
+
+    async def join(self, key: str, request_id: str, member: Union[str, int, None] = None) -> Tuple[bool, str]:
+        """
+        Joins the flight for `key`. Returns (is_leader, flight_request_id).
+        The leader is responsible for dispatching the command; followers must not.
+        `member` (e.g. the caller's user id) is recorded as allowed to read the result.
+        """
+        now = time.monotonic()
+        local = self._inflight.get(key)
+        if local and local[1] > now:
+            self.stats["followers"] += 1
+            if member is not None:
+                await self.add_member(local[0], member)
+            return False, local[0]
+
+        while True:
+            acquired = await self.redis.set(self._lock_key(key), request_id, nx=True, ex=self.lock_ttl_seconds)
+            if acquired:
+                owner, is_leader = request_id, True
+                break
+            owner = _as_str(await self.redis.get(self._lock_key(key)))
+            if owner is not None:
+                is_leader = False
+                break
+            # The lock expired between SET NX and GET; try to take it again.
+
+        self._inflight[key] = (owner, now + self.lock_ttl_seconds)
+        self._keys_by_request[owner] = key
+        self.stats["leaders" if is_leader else "followers"] += 1
+        if member is not None:
+            await self.add_member(owner, member)
+        return is_leader, owner
+
+    async def add_member(self, request_id: str, member: Union[str, int]) -> None:
+        """Allows `member` to read the flight's result; kept as long as the result can be."""
+        pipeline = self.redis.pipeline(transaction=False)
+        pipeline.sadd(self._members_key(request_id), str(member))
+        pipeline.expire(self._members_key(request_id), self.lock_ttl_seconds + self.result_ttl_seconds)
+        await pipeline.execute()
+
+    async def is_member(self, request_id: str, member: Union[str, int]) -> bool:
+        return bool(await self.redis.sismember(self._members_key(request_id), str(member)))
+
+    async def resolve(self, request_id: str, result: Dict[str, Any]) -> None:
+        """Stores the result for a flight and wakes every local waiter."""
+        await self.redis.set(self._result_key(request_id), json.dumps(result), ex=self.result_ttl_seconds)
+        key = self._keys_by_request.pop(request_id, None)
+        if key is not None:
+            self._inflight.pop(key, None)
+            await self.redis.eval(_RELEASE_LOCK_SCRIPT, 1, self._lock_key(key), request_id)
+        waiter = self._waiters.pop(request_id, None)
+        if waiter is not None and not waiter.done():
+            waiter.set_result(result)
+        self.stats["resolved"] += 1
+
+    async def abandon(self, key: str, request_id: str) -> None:
+        """Releases a flight whose leader failed to dispatch, so the next caller retries."""
+        self._keys_by_request.pop(request_id, None)
+        local = self._inflight.get(key)
+        if local and local[0] == request_id:
+            self._inflight.pop(key, None)
+        await self.redis.eval(_RELEASE_LOCK_SCRIPT, 1, self._lock_key(key), request_id)
+
+    async def wait(self, request_id: str, timeout: float = 0.0) -> Optional[Dict[str, Any]]:
+        """Returns the flight result, waiting up to `timeout` seconds. None if still pending."""
+        if timeout <= 0:
+            stored = await self.redis.get(self._result_key(request_id))
+            return json.loads(stored) if stored is not None else None
+
+        # Register the waiter before checking Redis so a result landing in between is not missed.
+        waiter = self._waiters.get(request_id)
+        if waiter is None:
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters[request_id] = waiter
+        self._waiting[request_id] = self._waiting.get(request_id, 0) + 1
+        try:
+            stored = await self.redis.get(self._result_key(request_id))
+            if stored is not None:
+                return json.loads(stored)
+            # shield() so one waiter timing out does not cancel the future for the others
+            return await asyncio.wait_for(asyncio.shield(waiter), timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            # The last local caller to stop waiting drops the future, whether or not a result came.
+            remaining = self._waiting.pop(request_id) - 1
+            if remaining:
+                self._waiting[request_id] = remaining
+            elif self._waiters.get(request_id) is waiter:
+                del self._waiters[request_id]
+
+    def depths(self) -> Dict[str, int]:
+        """Flights this worker leads or follows, and requests blocked waiting on a result."""
+        return {"inflight": len(self._inflight), "waiters": len(self._waiters)}
@@ -0,0 +1,152 @@
+# gpt-nexus/app/token_cache.py
+"""
+Bearer token verification with a decoded-claims cache.
+
+The UI sends the same bearer token with every request of a session, so verifying
+its signature each time is wasted work. `TokenVerifier.verify()` keeps a bounded
+LRU cache of claims from tokens it has already verified:
+
+- Entries are keyed by the SHA-256 of the full token, signature included, so a
+  hit means the token is byte-for-byte one that passed verification. Raw
+  tokens are never stored.
+- A cached entry is only used while its `exp` is in the future; an expired
+  entry is dropped and the token goes through full verification again (and
+  fails).
+- Rejected tokens are not cached, so invalid tokens cannot flood the cache.
+
+Verification runs on one of two backends, chosen with JWT_BACKEND:
+
+- "jose" (the default): python-jose, imported on first use.
+- "native": a standard-library HMAC verifier for HS256/HS384/HS512. It applies
+  the same checks python-jose makes for our tokens (algorithm allow-list,
+  constant-time signature comparison, exp/nbf/iat, and rejecting an "aud" when
+  no audience is expected), without jose's generic key handling.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+JWT_CACHE_SIZE = int(os.getenv("JWT_CACHE_SIZE", 10000))
+JWT_BACKEND = os.getenv("JWT_BACKEND", "jose")
+
+_HMAC_DIGESTS = {"HS256": hashlib.sha256, "HS384": hashlib.sha384, "HS512": hashlib.sha512}
+
+
+class InvalidTokenError(Exception):
+    """The token is malformed, has a bad signature, or its claims are not valid now."""
+
+
+def _b64url_decode(segment: str) -> bytes:
+    return base64.urlsafe_b64decode(segment + "=" * (-len(segment) % 4))
+
+
+def _numeric_claim(claims: Dict[str, Any], name: str) -> Optional[float]:
+    if name not in claims:
+        return None
+    try:
+        return float(claims[name])
+    except (TypeError, ValueError):
+        raise InvalidTokenError(f"Invalid '{name}' claim.")
+
+
+def decode_hmac_token(token: str, secret: str, algorithms: List[str]) -> Dict[str, Any]:
+    """Verifies an HS256/384/512 token with the standard library and returns its claims."""
+    try:
+        header_segment, payload_segment, signature_segment = token.split(".")
+        header = json.loads(_b64url_decode(header_segment))
+        signature = _b64url_decode(signature_segment)
+    except (ValueError, TypeError):
+        raise InvalidTokenError("Malformed token.")
+    if not isinstance(header, dict):
+        raise InvalidTokenError("Malformed token header.")
+    algorithm = header.get("alg")
+    if algorithm not in algorithms or algorithm not in _HMAC_DIGESTS:
+        raise InvalidTokenError("Token algorithm is not allowed.")
+
+    signing_input = f"{header_segment}.{payload_segment}".encode("ascii", errors="replace")
+    expected = hmac.new(secret.encode("utf-8"), signing_input, _HMAC_DIGESTS[algorithm]).digest()
+    if not hmac.compare_digest(expected, signature):
+        raise InvalidTokenError("Signature verification failed.")
+
+    try:
+        claims = json.loads(_b64url_decode(payload_segment))
+    except (ValueError, TypeError):
+        raise InvalidTokenError("Malformed token payload.")
+    if not isinstance(claims, dict):
+        raise InvalidTokenError("Malformed token payload.")
+
+    now = time.time()
+    expires_at = _numeric_claim(claims, "exp")
+    if expires_at is not None and expires_at < now:
+        raise InvalidTokenError("Signature has expired.")
+    not_before = _numeric_claim(claims, "nbf")
+    if not_before is not None and not_before > now:
+        raise InvalidTokenError("The token is not yet valid.")
+    _numeric_claim(claims, "iat")
+    if "aud" in claims:
+        raise InvalidTokenError("Invalid audience.")  # we never issue or expect an audience
+    return claims
+
+
+def decode_jose_token(token: str, secret: str, algorithms: List[str]) -> Dict[str, Any]:
+    from jose import JWTError, jwt
+    try:
+        return jwt.decode(token, secret, algorithms=algorithms)
+    except JWTError as e:
+        raise InvalidTokenError(str(e))
+
+
+_BACKENDS = {"jose": decode_jose_token, "native": decode_hmac_token}
+
+
+class TokenVerifier:
+    def __init__(self, secret: str, algorithms: List[str], cache_size: int = JWT_CACHE_SIZE, backend: str = JWT_BACKEND):
+        if backend not in _BACKENDS:
+            raise ValueError(f"Unknown JWT backend: {backend}")
+        self.secret = secret
+        self.algorithms = algorithms
+        self.cache_size = cache_size
+        self.backend = backend
+        self._decode = _BACKENDS[backend]
+        # token digest -> (claims, expiry epoch or None)
+        self._cache: "OrderedDict[bytes, Tuple[Dict[str, Any], Optional[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "expired": 0, "rejected": 0}
+
+    def verify(self, token: str) -> Dict[str, Any]:
+        """Returns the token's claims; raises InvalidTokenError if it does not verify."""
+        key = hashlib.sha256(token.encode("utf-8", errors="surrogateescape")).digest()
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                claims, expires_at = cached
+                if expires_at is None or expires_at > time.time():
+                    self._cache.move_to_end(key)
+                    self.stats["hits"] += 1
+                    return dict(claims)
+                del self._cache[key]
+                self.stats["expired"] += 1
+
+        try:
+            claims = self._decode(token, self.secret, self.algorithms)
+        except InvalidTokenError:
+            self.stats["rejected"] += 1
+            raise
+        self.stats["misses"] += 1
+        if self.cache_size > 0:
+            expires_at = _numeric_claim(claims, "exp")
+            with self._lock:
+                self._cache[key] = (dict(claims), expires_at)
+                if len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return claims
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
@@ -1,25 +1,47 @@
 # gpt-nexus/main.py
-from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File as FastAPIFile, BackgroundTasks
+# Start timing (and, with NEXUS_PROFILE_STARTUP=1, profiling) imports before anything heavy loads.
+import time
+from app.startup import PROFILE_STARTUP, ImportProfiler, StartupReport
+IMPORTS_STARTED = time.perf_counter()
+IMPORT_PROFILER = ImportProfiler.start() if PROFILE_STARTUP else None
+
+from fastapi import FastAPI, Depends, HTTPException, status, UploadFile
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from datetime import timedelta, datetime
-from typing import List, Dict, Any, Union
+from typing import List, Dict, Any, Tuple, Union
 from uuid import uuid4
+from functools import lru_cache
 import os
 import json
 import asyncio
+import logging
 from redis.asyncio import Redis
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy import delete
-
-# Security imports
-from passlib.context import CryptContext
-from jose import JWTError, jwt
+from sqlalchemy import delete, update
 
 # Import your database and models
-from app.database import get_db, create_db_and_tables # Import create_db_and_tables
+from app.database import AsyncSessionLocal, get_db, prepare_database, dispose_engine, get_pool_stats
+from app.admission import AdmissionController, AdmissionRejected
+from app.agent_load import LoadHistory
+from app.autoscaler import AUTOSCALE_ENABLED, Autoscaler, CommandBacklog, build_actuator
+from app.dispatch import DispatchScheduler
+from app.async_logging import configure_logging, logging_stats, shutdown_logging
+from app.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, REGISTRY as METRICS, RequestMetricsMiddleware
 from app.models import User, File # Import your User and File ORM models
+from app.outbox import OutboxRelay
+from app.rate_limit import RateLimiter, RateLimitMiddleware
+from app.retry import RetryScheduler
+from app.singleflight import SingleFlight, make_flight_key
+from app.bus_codec import DEFAULT_CODEC, decode_message, get_codec, negotiate
+from app.claim_check import ClaimCheckStore, claim_keys
+from app.token_cache import InvalidTokenError, TokenVerifier
+from app.tracing import Tracer, build_exporters, summarize
+
+IMPORTS_MS = (time.perf_counter() - IMPORTS_STARTED) * 1000
+if IMPORT_PROFILER is not None:
+    IMPORT_PROFILER.stop()
 
 # --- Configuration (from environment variables) ---
 # It's good practice to get these from environment variables
@@ -28,6 +50,16 @@ ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 30))
 REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
 REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
+PUBSUB_CHANNEL_ORCHESTRATOR_INBOX = "orchestrator_inbox"
+AGENT_TYPE_QUEUE_PREFIX = "agent_queue:" # commands for an agent type with no replica reporting load; one replica takes each
+NEXUS_SENDER_ID = "gpt-nexus" # sender_id on the tool_command envelopes Nexus sends to agents
+QUERY_RESULT_MAX_WAIT_SECONDS = float(os.getenv("QUERY_RESULT_MAX_WAIT_SECONDS", 30))
+
+# Records go through a queue to a writer thread; see app/async_logging.py for LOG_* settings.
+logger = logging.getLogger("nexus")
+
+# Spans for the query -> agent -> inbox path; see app/tracing.py for TRACE_* settings.
+tracer = Tracer("gpt-nexus", build_exporters())
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -36,15 +68,92 @@ app = FastAPI(
     version="0.1.0",
 )
 
+# --- Metrics ---
+# Exposed at /metrics in the Prometheus text format; see app/metrics.py.
+HTTP_REQUEST_SECONDS = METRICS.histogram(
+    "nexus_http_request_seconds", "HTTP request latency by route template.", ("method", "route", "status")
+)
+REDIS_PUBLISH_SECONDS = METRICS.histogram(
+    "nexus_redis_publish_seconds", "Latency of Redis PUBLISH calls, by channel.", ("channel",)
+)
+INBOX_LAG_SECONDS = METRICS.histogram(
+    "nexus_inbox_lag_seconds", "Time from an agent sending a message to Nexus picking it off the inbox.", ("message_type",)
+)
+INBOX_MESSAGES = METRICS.counter(
+    "nexus_inbox_messages_total", "Messages read from the orchestrator inbox.", ("message_type",)
+)
+RATE_LIMIT_DECISIONS = METRICS.counter(
+    "nexus_rate_limit_decisions_total", "Rate limit checks by outcome and by where they were decided.", ("result", "backend")
+)
+RATE_LIMIT_CHECK_SECONDS = METRICS.histogram(
+    "nexus_rate_limit_check_seconds", "Time spent checking the rate limit, per request.", ("backend",)
+)
+ADMISSION_REJECTED = METRICS.counter(
+    "nexus_admission_rejected_total", "Requests refused with 429 by admission control.", ("route", "reason")
+)
+DISPATCH_WAIT_SECONDS = METRICS.histogram(
+    "nexus_dispatch_wait_seconds", "Time commands spent in the dispatch scheduler before being sent, by priority class.", ("priority",)
+)
+OUTBOX_MESSAGES = METRICS.counter(
+    "nexus_outbox_messages_total", "Outbox rows handled by this worker's relay, by outcome.", ("outcome",)
+)
+OUTBOX_BATCH_SIZE = METRICS.histogram(
+    "nexus_outbox_batch_size", "Commands published per pipelined round trip.", buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500)
+)
+RETRY_COMMANDS = METRICS.counter(
+    "nexus_retry_commands_total", "Failed commands retried or dead-lettered, and retries requeued or replayed, by outcome.", ("outcome",)
+)
+DISPATCH_COMMANDS = METRICS.counter(
+    "nexus_dispatch_commands_total", "Commands leaving the dispatch scheduler, by priority class and outcome.", ("priority", "outcome")
+)
+app.add_middleware(RequestMetricsMiddleware, histogram=HTTP_REQUEST_SECONDS)
+
 # --- Security Setup ---
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# passlib/bcrypt and jose are imported on first use (login, registration, the first
+# authenticated request) rather than at import time, keeping them off the cold-start path.
+@lru_cache(maxsize=None)
+def get_pwd_context():
+    from passlib.context import CryptContext
+    return CryptContext(schemes=["bcrypt"], deprecated="auto")
+
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/token")
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    return get_pwd_context().verify(plain_password, hashed_password)
 
 def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+    return get_pwd_context().hash(password)
+
+# Verified bearer tokens are cached (keyed by token hash, until exp), so a session's
+# repeated requests skip signature verification; see app/token_cache.py.
+token_verifier = TokenVerifier(SECRET_KEY, [ALGORITHM])
+
+# --- Rate Limiting ---
+# RATE_LIMIT_PER_MINUTE (security.rate_limit_per_minute) per client, shared by all workers
+# through Redis; see app/rate_limit.py. Added last, so limited requests stop before any other work.
+def rate_limit_client(scope: dict) -> str:
+    # The user in a valid bearer token (verification is cached), else the peer address.
+    for name, value in scope["headers"]:
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() == "bearer":
+                try:
+                    username = token_verifier.verify(token).get("sub")
+                except InvalidTokenError:
+                    username = None
+                if username:
+                    return f"user:{username}"
+            break
+    client = scope.get("client")
+    return f"ip:{client[0] if client else 'unknown'}"
+
+app.add_middleware(
+    RateLimitMiddleware,
+    get_limiter=lambda: getattr(app.state, "rate_limiter", None),
+    identify=rate_limit_client,
+    decisions=RATE_LIMIT_DECISIONS,
+    check_seconds=RATE_LIMIT_CHECK_SECONDS,
+)
 
 def create_access_token(data: dict, expires_delta: Union[timedelta, None] = None) -> str:
     to_encode = data.copy()
@@ -53,6 +162,7 @@ def create_access_token(data: dict, expires_delta: Union[timedelta, None] = None
     else:
         expire = datetime.utcnow() + timedelta(minutes=15)
     to_encode.update({"exp": expire})
+    from jose import jwt
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
@@ -63,18 +173,18 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username === None: # Changed from 'is None' to '=== None' for testing
-            raise credentials_exception
-    except JWTError:
+        payload = token_verifier.verify(token)
+    except InvalidTokenError:
+        raise credentials_exception
+    username: str = payload.get("sub")
+    if username is None:
         raise credentials_exception
 
     # Query the database for the user
     result = await db.execute(select(User).filter(User.username == username))
     user = result.scalar_one_or_none()
 
-    if user === None: # Changed from 'is None' to '=== None' for testing
+    if user is None:
         raise credentials_exception
     return user
 
@@ -83,35 +193,281 @@ async def get_redis_client() -> Redis:
     redis_client = Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
     return redis_client
 
+async def get_bus_redis_client() -> Redis:
+    # Bus frames may be binary (msgpack, zstd), so this client does not decode responses.
+    return Redis(host=REDIS_HOST, port=REDIS_PORT)
+
 # --- In-memory Agent Registry (to be enhanced with DB persistence) ---
 # Currently in-memory, eventually leverage DB and Redis heartbeats
 agent_registry: Dict[str, Dict[str, Any]] = {}
+# Load snapshots from heartbeats, per agent, in a fixed-size time-bucketed ring (see app/agent_load.py)
+agent_load = LoadHistory()
+# Commands dispatched but not yet answered, per agent; drives replica routing and autoscaling (see app/autoscaler.py)
+command_backlog = CommandBacklog()
+# Per-user and global caps on unanswered work, enforced on /query and /ingest (see app/admission.py)
+admission = AdmissionController()
+
+# Scrape-time gauges: nothing is computed between scrapes.
+METRICS.gauge("nexus_agent_registry_size", "Agents in the in-memory registry.", function=lambda: len(agent_registry))
+METRICS.gauge(
+    "nexus_agent_load", "Latest load reported by each agent's heartbeat.", ("agent_id", "measure"),
+    function=lambda: {
+        (agent_id, measure): value
+        for agent_id in agent_load.agents()
+        for measure, value in (agent_load.latest(agent_id) or {}).items()
+        if measure in ("in_flight", "queue_depth", "latency_p50_ms", "latency_p99_ms", "error_rate", "cpu_percent", "rss_bytes")
+        and value is not None
+    },
+)
+METRICS.gauge(
+    "nexus_agent_backlog", "Commands dispatched to each agent and not yet answered.", ("agent_id",),
+    function=lambda: {(agent_id,): depth for agent_id, depth in command_backlog.targets().items()},
+)
+METRICS.gauge(
+    "nexus_autoscaler_desired_replicas", "Replica count the autoscaler last decided on, by agent type.", ("agent_type",),
+    function=lambda: {
+        (agent_type,): decision.desired
+        for agent_type, decision in (app.state.autoscaler.decisions.items() if hasattr(app.state, "autoscaler") else ())
+    },
+)
+METRICS.gauge(
+    "nexus_admission_inflight", "Admitted requests whose agent reply is still outstanding, by lane.", ("lane",),
+    function=lambda: (lambda stats: {("user",): stats["inflight"] - stats["admin_inflight"], ("admin",): stats["admin_inflight"]})(admission.stats()),
+)
+METRICS.gauge(
+    "nexus_dispatch_queued", "Commands waiting in the dispatch scheduler, by priority class.", ("priority",),
+    function=lambda: {
+        (priority,): stats["queued"]
+        for priority, stats in (app.state.dispatcher.stats()["classes"].items() if hasattr(app.state, "dispatcher") else ())
+    },
+)
+METRICS.gauge(
+    "nexus_queue_depth", "Work waiting in this worker, by queue.", ("queue",),
+    function=lambda: {
+        (f"singleflight_{name}",): depth
+        for name, depth in (app.state.single_flight.depths() if hasattr(app.state, "single_flight") else {}).items()
+    },
+)
+METRICS.gauge(
+    "nexus_db_pool_connections", "Database pool connections by state.", ("state",),
+    function=lambda: {(state,): value for state, value in get_pool_stats().items() if state in ("size", "checked_out", "checked_in", "overflow")},
+)
+METRICS.callback_counter(
+    "nexus_log_records_dropped_total", "Log records dropped because the log queue was full.",
+    function=lambda: logging_stats()["dropped"],
+)
+METRICS.callback_counter(
+    "nexus_db_pool_wait_seconds_total", "Time spent waiting for a pooled database connection.",
+    function=lambda: get_pool_stats()["wait_seconds_total"],
+)
 
 # --- FastAPI Event Handlers ---
 @app.on_event("startup")
 async def startup_event():
-    print("Application startup: Initializing database and Redis.")
-    # This call will create tables only if they don't exist.
-    # It will also ensure the database connection is active.
-    await create_db_and_tables()
+    configure_logging("gpt-nexus")
+    logger.info("Application startup: initializing database and Redis.")
+    report = StartupReport(imports_ms=IMPORTS_MS, import_profiler=IMPORT_PROFILER)
+    # Verifies the Alembic revision with one query (see DB_SCHEMA_MODE in app/database.py);
+    # this also opens the first pooled connection.
+    with report.phase("database"):
+        schema_status = await prepare_database()
     # Initialize Redis client on startup
-    app.state.redis = await get_redis_client()
-    print("Database tables checked/created. Redis client initialized.")
+    with report.phase("redis"):
+        app.state.redis = await get_redis_client()
+        app.state.bus_redis = await get_bus_redis_client()
+    with report.phase("services"):
+        app.state.claims = ClaimCheckStore(app.state.bus_redis)
+        app.state.single_flight = SingleFlight(app.state.redis)
+        app.state.rate_limiter = RateLimiter(app.state.redis)
+        # Commands wait here for room at their agent type, in priority and fair-share order (see app/dispatch.py).
+        app.state.dispatcher = DispatchScheduler(
+            outstanding=command_backlog.depth,
+            replicas=lambda agent_type: len(agent_load.agents(f"{agent_type}-")),
+            waits=DISPATCH_WAIT_SECONDS,
+            outcomes=DISPATCH_COMMANDS,
+        )
+        # Commands are written to the outbox table with the change that caused them; the relay
+        # claims committed rows and feeds them through the scheduler (see app/outbox.py).
+        app.state.outbox = OutboxRelay(
+            AsyncSessionLocal, app.state.dispatcher, publish_commands, on_expired=expire_command,
+            messages=OUTBOX_MESSAGES, batch_sizes=OUTBOX_BATCH_SIZE,
+        )
+        app.state.dispatcher.send_batch = app.state.outbox.send_batch
+        # Commands an agent reports as failed come back through the outbox with backoff, or
+        # land in the dead-letter queue (see app/retry.py).
+        app.state.retry = RetryScheduler(app.state.redis, outcomes=RETRY_COMMANDS)
+        app.state.retry_task = asyncio.create_task(app.state.retry.run(app.state.outbox.requeue))
+        app.state.dispatch_task = asyncio.create_task(app.state.dispatcher.run())
+        app.state.outbox_task = asyncio.create_task(app.state.outbox.run())
+        app.state.inbox_task = asyncio.create_task(orchestrator_inbox_listener())
+        if AUTOSCALE_ENABLED:
+            app.state.autoscaler = Autoscaler(
+                agent_load, command_backlog, build_actuator(),
+                pending=lambda agent_type: app.state.dispatcher.stats()["agents"].get(agent_type, {}).get("queued", 0),
+            )
+            app.state.autoscaler_task = asyncio.create_task(app.state.autoscaler.run())
+    report.finish()
+    app.state.startup_report = report
+    logger.info(f"Database {schema_status}. Redis client initialized.", extra={"startup": report.as_dict()})
     # TODO: Implement initial agent registration/discovery via Redis if needed
     # For now, agents register themselves via heartbeats
 
 @app.on_event("shutdown")
 async def shutdown_event():
-    print("Application shutdown: Closing Redis connection.")
+    logger.info("Application shutdown: closing Redis connection.")
+    if hasattr(app.state, 'inbox_task'):
+        app.state.inbox_task.cancel()
+        await asyncio.gather(app.state.inbox_task, return_exceptions=True)
+    if hasattr(app.state, 'retry_task'):
+        app.state.retry_task.cancel()
+        await asyncio.gather(app.state.retry_task, return_exceptions=True)
+    if hasattr(app.state, 'outbox_task'):
+        app.state.outbox_task.cancel()
+        await asyncio.gather(app.state.outbox_task, return_exceptions=True)
+    if hasattr(app.state, 'dispatch_task'):
+        app.state.dispatch_task.cancel()
+        await asyncio.gather(app.state.dispatch_task, return_exceptions=True)
+    if hasattr(app.state, 'autoscaler_task'):
+        app.state.autoscaler_task.cancel()
+        await asyncio.gather(app.state.autoscaler_task, return_exceptions=True)
+        await app.state.autoscaler.actuator.close()
     if hasattr(app.state, 'redis') and app.state.redis:
         await app.state.redis.close()
-    print("Redis connection closed.")
+    if hasattr(app.state, 'bus_redis') and app.state.bus_redis:
+        await app.state.bus_redis.close()
+    logger.info("Redis connection closed.")
+    await dispose_engine()
+    tracer.close()
+    shutdown_logging()
 
 # --- Utility Functions (Agent Communication) ---
-async def publish_command_to_agent(agent_id: str, command: Dict[str, Any]):
-    channel = f"nexus_commands_{agent_id}"
-    await app.state.redis.publish(channel, json.dumps(command))
-    print(f"Published command to {channel}: {command}")
+def admit_request(route: str, current_user: User, agent_type: str) -> str:
+    # Sheds load before any work is done; the ticket is held until the agent replies.
+    try:
+        return admission.admit(current_user.id, current_user.is_admin, command_backlog.depth(agent_type))
+    except AdmissionRejected as e:
+        ADMISSION_REJECTED.labels(route, e.reason).inc()
+        logger.warning("Request refused by admission control", extra={"route": route, "user": current_user.username, "reason": e.reason})
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=f"Nexus is overloaded ({e.reason}); retry later.",
+            headers={"Retry-After": str(e.retry_after)},
+        )
+
+async def expire_command(command: Dict[str, Any]):
+    # The command outlived its dispatch deadline: answer anyone waiting on it (for a query,
+    # every follower of the flight) with an error instead of sending work whose caller has given up.
+    admission.release(command["request_id"])
+    await app.state.single_flight.resolve(command["request_id"], {
+        "request_id": command["request_id"],
+        "error": "The request expired before an agent could take it; retry.",
+        "expired": True,
+    })
+
+def codec_for_agent(agent_id: str):
+    # A command queued for an agent type rather than one replica may be taken by any replica, so
+    # all of them must agree on the codec; otherwise fall back to plain JSON, which every agent decodes.
+    negotiated = {
+        info.get("codec", DEFAULT_CODEC) for registered_id, info in agent_registry.items()
+        if registered_id == agent_id or registered_id.startswith(f"{agent_id}-")
+    }
+    return get_codec(negotiated.pop() if len(negotiated) == 1 else DEFAULT_CODEC)
+
+async def publish_commands(commands: List[Tuple[str, Dict[str, Any], str, str]]):
+    # Publishes (agent type, command, priority class, tenant) tuples in one pipelined round trip;
+    # the outbox relay's batches arrive here. The same pipeline leaves each command's retry record.
+    # Each command goes to its agent type's live replica with the fewest unanswered commands; with
+    # no replica reporting load, to the type's shared queue, where exactly one replica takes it (a
+    # channel would fan out to every replica and run the command on each). Commands are counted in
+    # the backlog as they are routed, so a batch spreads across replicas.
+    pipeline = app.state.redis.pipeline(transaction=False)
+    routed = []
+    for agent_id, command, priority, tenant in commands:
+        target = command_backlog.route(agent_id, agent_load.agents(f"{agent_id}-"))
+        channel = f"agent_commands:{target}" if target != agent_id else f"{AGENT_TYPE_QUEUE_PREFIX}{agent_id}"
+        # Every command carries a request_id, so its reply can be matched against the backlog.
+        request_id = command.get("request_id") or str(uuid4())
+        # Continues the trace of the request that built the command, if any. The agent reads
+        # traceparent and sent_at from the envelope to parent its spans and time the queue wait.
+        span = tracer.start_span("nexus.publish", parent=command.get("traceparent"), attributes={"channel": channel, "batch": len(commands)})
+        app.state.retry.remember(pipeline, request_id, agent_id, {**command, "request_id": request_id}, priority, tenant)
+        # Agents take a RedisMessage envelope whose payload is a ToolCallPayload plus the request_id
+        # (see templates/agent_app.py.j2). Large values travel through the claim-check store instead of the bus.
+        payload = await app.state.claims.offload({
+            "tool_name": command["tool_name"], "tool_arguments": command.get("tool_arguments") or {}, "request_id": request_id,
+        })
+        envelope = {
+            "sender_id": NEXUS_SENDER_ID, "message_type": "tool_command", "payload": payload,
+            "traceparent": span.traceparent, "sent_at": time.time(),
+        }
+        frame = codec_for_agent(target).encode(envelope)
+        if target == agent_id:
+            pipeline.lpush(channel, frame)
+        else:
+            pipeline.publish(channel, frame)
+        command_backlog.dispatched(target, request_id)
+        routed.append((span, request_id))
+    try:
+        with REDIS_PUBLISH_SECONDS.labels("pipeline").time():
+            await pipeline.execute()
+    except Exception as e:
+        for span, request_id in routed:
+            command_backlog.completed(request_id)
+            span.status = "error"
+            span.set("error", repr(e))
+        raise
+    finally:
+        for span, _ in routed:
+            tracer.finish(span)
+    logger.info("Published commands", extra={"commands": len(routed), "request_ids": [request_id for _, request_id in routed]})
+
+async def orchestrator_inbox_listener():
+    # Every worker listens to the inbox so each can resolve its own local waiters.
+    pubsub = app.state.bus_redis.pubsub()
+    await pubsub.subscribe(PUBSUB_CHANNEL_ORCHESTRATOR_INBOX)
+    try:
+        while True:
+            message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+            if not message:
+                continue
+            received_at = time.time()
+            try:
+                msg = decode_message(message["data"])
+                message_type = str(msg.get("message_type"))
+                INBOX_MESSAGES.labels(message_type).inc()
+                traceparent = msg.get("traceparent")
+                # sent_at is the agent's wall clock, so this includes any clock skew between hosts.
+                if isinstance(msg.get("sent_at"), (int, float)):
+                    INBOX_LAG_SECONDS.labels(message_type).observe(max(0.0, received_at - msg["sent_at"]))
+                    admission.observe_inbox_lag(max(0.0, received_at - msg["sent_at"]))
+                    if traceparent:
+                        tracer.record("nexus.inbox.queue_wait", msg["sent_at"], received_at, parent=traceparent)
+                # The agent ships the spans it recorded for this command along with the reply.
+                tracer.ingest(msg.get("spans"))
+                with tracer.span("nexus.inbox.handle", parent=traceparent, start=received_at,
+                                 attributes={"message_type": message_type}):
+                    payload = msg.get("payload") or {}
+                    request_id = payload.get("request_id")
+                    # Only final messages resolve a flight; "stream" messages carry partial output.
+                    if request_id and message_type in ("result", "error"):
+                        if message_type == "result":
+                            retry = None
+                            await app.state.retry.forget(request_id)
+                        else:
+                            # Agents mark errors a retry cannot fix with retryable=false.
+                            retry = await app.state.retry.failed(request_id, payload.get("error"), payload.get("retryable") is not False)
+                        command_backlog.completed(request_id)
+                        app.state.dispatcher.wake()  # the reply freed room in the agent's dispatch window
+                        # A retried command keeps its admission ticket and its waiters until the retry answers.
+                        if retry != "scheduled":
+                            admission.release(request_id)
+                            await app.state.single_flight.resolve(request_id, payload)
+            except Exception:
+                logger.exception("Error handling orchestrator inbox message")
+    except asyncio.CancelledError:
+        pass
+    finally:
+        await pubsub.unsubscribe(PUBSUB_CHANNEL_ORCHESTRATOR_INBOX)
 
 # --- API Endpoints ---
 
@@ -130,8 +486,7 @@ async def register_user(
     hashed_password = get_password_hash(password)
     new_user = User(username=username, hashed_password=hashed_password, email=email)
     db.add(new_user)
-    await db.commit()
-    await db.refresh(new_user)
+    await db.commit() # The INSERT returns the id; sessions don't expire objects on commit, so no refresh
     return {"message": "User registered successfully", "user_id": new_user.id}
 
 @app.post("/auth/token", response_model=Dict[str, str], summary="Authenticate user and get JWT token")
@@ -169,6 +524,98 @@ async def read_users_me(current_user: User = Depends(get_current_user)):
     }
 
 
+# --- Admin Endpoints ---
+
+@app.get("/metrics", response_class=PlainTextResponse, summary="Prometheus metrics for this worker")
+async def metrics():
+    # Unauthenticated like most scrape targets; restrict it at the network level.
+    return PlainTextResponse(METRICS.render(), media_type=METRICS_CONTENT_TYPE)
+
+@app.get("/admin/db/pool", summary="Database connection pool status and wait times")
+async def database_pool_status(current_user: User = Depends(get_current_user)):
+    if not current_user.is_admin:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
+    return get_pool_stats()
+
+@app.get("/admin/startup", summary="Timing breakdown of the last startup")
+async def startup_timings(current_user: User = Depends(get_current_user)):
+    if not current_user.is_admin:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
+    return app.state.startup_report.as_dict()
+
+@app.get("/admin/traces", summary="Span latency by hop and the slowest recent traces")
+async def trace_summary(slowest: int = 10, current_user: User = Depends(get_current_user)):
+    if not current_user.is_admin:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
+    if tracer.memory is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="The in-memory trace exporter is not enabled")
+    return summarize(tracer.memory.spans(), slowest=slowest)
+
+@app.get("/admin/traces/{trace_id}", summary="Every recorded span of one trace, in start order")
+async def trace_detail(trace_id: str, current_user: User = Depends(get_current_user)):
+    if not current_user.is_admin:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
+    spans = tracer.memory.spans(trace_id) if tracer.memory is not None else []
+    if not spans:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Trace not found")
+    return {"trace_id": trace_id, "spans": spans}
+
+@app.get("/admin/autoscaler", summary="Autoscaler policy, last decisions and the command backlog per agent")
+async def autoscaler_status(current_user: User = Depends(get_current_user)):
+    if not current_user.is_admin:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
+    if not hasattr(app.state, "autoscaler"):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="The autoscaler is not enabled (AUTOSCALE_ENABLED=1)")
+    return {**app.state.autoscaler.status(), "backlog": command_backlog.targets()}
+
+@app.get("/admin/admission", summary="Admission control limits, in-flight requests and rejections")
+async def admission_status(current_user: User = Depends(get_current_user)):
+    if not current_user.is_admin:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
+    limits = {
+        "max_inflight": admission.max_inflight, "user_max_inflight": admission.user_max_inflight,
+        "max_backlog": admission.max_backlog, "max_inbox_lag_seconds": admission.max_inbox_lag_seconds,
+        "admin_headroom": admission.admin_headroom,
+    }
+    return {"limits": limits, **admission.stats()}
+
+@app.get("/admin/dispatch", summary="Dispatch scheduler queues, waits and outcomes by priority class")
+async def dispatch_status(current_user: User = Depends(get_current_user)):
+    if not current_user.is_admin:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
+    dispatcher = app.state.dispatcher
+    return {"window_per_replica": dispatcher.window_per_replica, "max_queued": dispatcher.max_queued, **dispatcher.stats()}
+
+@app.get("/admin/outbox", summary="Unsent outbox rows by priority class, and this worker's relay")
+async def outbox_status(current_user: User = Depends(get_current_user)):
+    if not current_user.is_admin:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
+    return {"pending": await app.state.outbox.pending(), "relay": app.state.outbox.stats()}
+
+@app.get("/admin/dlq", summary="Scheduled retries and the newest dead-lettered commands")
+async def dlq_status(start: int = 0, count: int = 50, current_user: User = Depends(get_current_user)):
+    if not current_user.is_admin:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
+    return {"retry": await app.state.retry.stats(), "dead_letters": await app.state.retry.dead_letters(start, min(count, 500))}
+
+@app.post("/admin/dlq/replay", summary="Send dead-lettered commands again, with a fresh attempt count")
+async def dlq_replay(request_ids: Union[List[str], None] = None, limit: int = 100, current_user: User = Depends(get_current_user)):
+    # With no request_ids, replays up to `limit` of the oldest entries.
+    if not current_user.is_admin:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
+    replayed = await app.state.retry.replay(request_ids, limit=limit)
+    logger.info("Replayed dead-lettered commands", extra={"admin_id": current_user.id, "request_ids": replayed})
+    return {"replayed": replayed}
+
+@app.delete("/admin/dlq", summary="Drop every dead-lettered command")
+async def dlq_purge(current_user: User = Depends(get_current_user)):
+    if not current_user.is_admin:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
+    purged = await app.state.retry.purge()
+    logger.warning("Purged the dead-letter queue", extra={"admin_id": current_user.id, "purged": purged})
+    return {"purged": purged}
+
+
 # --- Agent Management Endpoints ---
 
 @app.post("/agent/heartbeat", summary="Agent heartbeat to register and update status")
@@ -180,27 +627,48 @@ async def agent_heartbeat(agent_info: Dict[str, Any], redis: Redis = Depends(get
         raise HTTPException(status_code=400, detail="Agent ID is required")
 
     agent_info["last_heartbeat_at"] = datetime.utcnow().isoformat()
+    # Pick the best bus codec both sides support; the agent switches to it on this response.
+    agent_info["codec"] = negotiate(agent_info.get("codecs"))
     agent_registry[agent_id] = agent_info
-    print(f"Received heartbeat from agent: {agent_id}. Registry size: {len(agent_registry)}")
+    if isinstance(agent_info.get("load"), dict):
+        agent_load.record(agent_id, agent_info["load"])
+        agent_load.prune()
+    logger.info(
+        "Received heartbeat", extra={"agent_id": agent_id, "registry_size": len(agent_registry), "sample_key": "heartbeat"}
+    )
 
     # Publish heartbeat to a dedicated Redis channel for broader system awareness if needed
-    await redis.publish("agent_heartbeats", json.dumps({"agent_id": agent_id, "status": "active", "timestamp": agent_info["last_heartbeat_at"]}))
+    with REDIS_PUBLISH_SECONDS.labels("agent_heartbeats").time():
+        await redis.publish("agent_heartbeats", json.dumps({"agent_id": agent_id, "status": "active", "timestamp": agent_info["last_heartbeat_at"]}))
 
-    return {"status": "ok", "message": f"Heartbeat received from {agent_id}"}
+    return {"status": "ok", "message": f"Heartbeat received from {agent_id}", "codec": agent_info["codec"]}
 
 @app.get("/agents", summary="List registered agents")
 async def list_agents(current_user: User = Depends(get_current_user)): # Protected route
     return list(agent_registry.values())
 
+@app.get("/agents/{agent_id}/load", summary="An agent's load history from its heartbeats")
+async def get_agent_load(
+    agent_id: str,
+    window: float = 600.0, # Seconds of history to return
+    current_user: User = Depends(get_current_user)
+):
+    history = agent_load.history(agent_id, window)
+    if not history:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No load reported by this agent in the window")
+    return {"agent_id": agent_id, "latest": agent_load.latest(agent_id), "history": history}
+
 # --- Core Nexus Functionality Endpoints ---
 
 @app.post("/ingest", summary="Ingest data (e.g., files, text) for processing")
 async def ingest_data(
-    file: FastAPIFile, # Non-default argument
-    background_tasks: BackgroundTasks, # Moved to be a non-default argument
+    file: UploadFile, # Non-default argument
     current_user: User = Depends(get_current_user), # Default argument
     db: AsyncSession = Depends(get_db) # Default argument
 ):
+    # Refuse up front (429) if this user or the ingestion agents already have too much outstanding work.
+    ticket = admit_request("/ingest", current_user, "gpt-agent_research")
+
     # This is where we'll implement actual file storage and metadata persistence.
     # For now, simulate storage and save metadata to DB.
 
@@ -226,25 +694,34 @@ async def ingest_data(
         processing_status="uploaded"
     )
     db.add(new_file)
-    await db.commit()
-    await db.refresh(new_file) # Refresh to get the database-generated ID and timestamps
-
-    print(f"File metadata recorded for user {current_user.username}: {new_file.file_name}")
-
-    # 3. Trigger ingestion agent via Redis (in background)
-    ingestion_command = {
-        "command": "process_file",
-        "file_id": new_file.id,
-        "user_id": current_user.id,
-        "file_path": new_file.file_path,
-        "file_name": new_file.file_name,
-        "metadata": new_file.metadata_json # Pass relevant metadata for processing
-    }
-
-    # You would typically find an appropriate agent (e.g., 'gpt-agent_ingestion') and publish to its channel
-    # For now, let's assume 'gpt-agent_research' might handle initial processing
-    # TODO: Implement proper agent selection/routing for ingestion
-    background_tasks.add_task(publish_command_to_agent, "gpt-agent_research", ingestion_command)
+    try:
+        await db.flush() # INSERT ... RETURNING brings back the ID and timestamps (eager_defaults), no refresh needed
+
+        # 3. Trigger ingestion agent via Redis: the command is written to the outbox in the same
+        # transaction as the file row, and the relay publishes it once committed.
+        ingestion_command = {
+            "tool_name": "process_file",
+            "tool_arguments": {
+                "file_id": new_file.id,
+                "user_id": current_user.id,
+                "file_path": new_file.file_path,
+                "file_name": new_file.file_name,
+                "metadata": new_file.metadata_json, # Pass relevant metadata for processing
+            },
+            "request_id": str(uuid4()) # The agent echoes it back; its reply releases the admission ticket
+        }
+        # You would typically find an appropriate agent (e.g., 'gpt-agent_ingestion') and publish to its channel
+        # For now, let's assume 'gpt-agent_research' might handle initial processing
+        # TODO: Implement proper agent selection/routing for ingestion
+        app.state.outbox.enqueue(db, "gpt-agent_research", ingestion_command, "ingest", current_user.id)
+        await db.commit()
+    except Exception:
+        admission.release(ticket)
+        raise
+    admission.bind(ticket, ingestion_command["request_id"])
+    app.state.outbox.notify()
+
+    logger.info("File metadata recorded", extra={"user": current_user.username, "file_id": new_file.id, "file_name": new_file.file_name})
 
     return {
         "message": "File upload accepted and processing initiated.",
@@ -258,8 +735,8 @@ async def ingest_data(
 @app.post("/query", summary="Query the AI Agent Ecosystem")
 async def query_nexus(
     query_text: Dict[str, str], # Non-default argument
-    background_tasks: BackgroundTasks, # Moved to be a non-default argument
-    current_user: User = Depends(get_current_user) # Default argument
+    current_user: User = Depends(get_current_user), # Default argument
+    db: AsyncSession = Depends(get_db)
 ):
     query = query_text.get("query")
     if not query:
@@ -269,20 +746,103 @@ async def query_nexus(
     # This currently simulates a response. In a later module, this will involve:
     # 1. Calling gpt-agent_research via Redis for semantic search/retrieval.
     # 2. Calling gpt-agent_strategy via Redis to formulate the response using LLMs.
-    print(f"Received query from {current_user.username}: {query}")
+    logger.info("Received query", extra={"user": current_user.username, "query": query})
 
     # Example: Send command to gpt-agent_strategy for processing
     # In a real scenario, you'd route based on query type, available agents, etc.
     strategy_command = {
-        "command": "generate_response",
-        "query": query,
-        "user_id": current_user.id,
-        "context": "Simulated context for now.", # This would come from research agent
+        "tool_name": "plan_task",
+        "tool_arguments": {
+            "request": query,
+            "user_id": current_user.id,
+            "context": "Simulated context for now.", # This would come from research agent
+        },
         "request_id": str(uuid4()) # Unique ID for this request
     }
-    background_tasks.add_task(publish_command_to_agent, "gpt-agent_strategy", strategy_command)
 
-    return {"message": "Query received, processing initiated by strategy agent (simulated).", "query_id": strategy_command["request_id"]}
+    # Identical in-flight queries share one agent execution; followers get the leader's query_id.
+    flight_key = make_flight_key("gpt-agent_strategy", strategy_command["tool_name"], query)
+    with tracer.span("nexus.query", attributes={"request_id": strategy_command["request_id"]}) as span:
+        is_leader, query_id = await app.state.single_flight.join(flight_key, strategy_command["request_id"], member=current_user.id)
+        span.set("coalesced", not is_leader)
+        if is_leader:
+            # Only the leader adds agent work, so only the leader goes through admission: refuse (429)
+            # if this user or the strategy agents already have too much outstanding work. A follower
+            # of a query already in flight is never refused.
+            try:
+                ticket = admit_request("/query", current_user, "gpt-agent_strategy")
+            except HTTPException:
+                await app.state.single_flight.abandon(flight_key, strategy_command["request_id"])
+                raise
+            admission.bind(ticket, strategy_command["request_id"])
+            # The publish (and everything the agent does) continues this trace.
+            strategy_command["traceparent"] = span.traceparent
+            # The leader dispatches on behalf of every follower, through the outbox. If the row
+            # cannot be written, release the flight so the next identical query can retry.
+            try:
+                app.state.outbox.enqueue(db, "gpt-agent_strategy", strategy_command, "interactive", current_user.id)
+                await db.commit()
+            except Exception:
+                admission.release(strategy_command["request_id"])
+                await app.state.single_flight.abandon(flight_key, strategy_command["request_id"])
+                raise
+            app.state.outbox.notify()
+
+    return {
+        "message": "Query received, processing initiated by strategy agent (simulated).",
+        "query_id": query_id,
+        "coalesced": not is_leader,
+        "trace_id": span.trace_id,
+    }
+
+
+@app.get("/query/{query_id}", summary="Get the result of a query, optionally waiting for it")
+async def get_query_result(
+    query_id: str,
+    wait: float = 0.0, # Seconds to wait for the result before reporting it as pending
+    inline: bool = False, # Replace claim-check references with the stored data
+    current_user: User = Depends(get_current_user)
+):
+    # Only callers that joined the query's flight (and admins) may read it; others get the same 404 as an unknown id.
+    if not current_user.is_admin and not await app.state.single_flight.is_member(query_id, current_user.id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Query not found")
+    timeout = max(0.0, min(wait, QUERY_RESULT_MAX_WAIT_SECONDS))
+    result = await app.state.single_flight.wait(query_id, timeout=timeout)
+    if result is None:
+        return {"query_id": query_id, "status": "pending"}
+    if inline:
+        try:
+            result = await app.state.claims.resolve(result)
+        except KeyError as e:
+            raise HTTPException(status_code=status.HTTP_410_GONE, detail=str(e))
+    return {"query_id": query_id, "status": "completed", "result": result}
+
+
+@app.get("/claims/{claim_key}", summary="Stream a large payload offloaded by the claim-check store")
+async def get_claim(
+    claim_key: str,
+    query_id: str, # The query whose result references the claim
+    current_user: User = Depends(get_current_user)
+):
+    # Blobs are content-addressed, so the key alone proves nothing: the caller must be able to read
+    # a query result that references it.
+    if not current_user.is_admin and not await app.state.single_flight.is_member(query_id, current_user.id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Claim not found or expired")
+    result = await app.state.single_flight.wait(query_id)
+    if result is None or claim_key not in claim_keys(result):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Claim not found or expired")
+    chunks = app.state.claims.stream(claim_key)
+    try:
+        first_chunk = await chunks.__anext__() # Surface a missing claim as 404 before streaming starts
+    except (KeyError, StopAsyncIteration):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Claim not found or expired")
+
+    async def body():
+        yield first_chunk
+        async for chunk in chunks:
+            yield chunk
+
+    return StreamingResponse(body(), media_type="application/octet-stream")
 
 
 # --- New File Management Endpoints (From Module 1) ---
@@ -321,8 +881,7 @@ async def delete_user_files(
     user_id: int,
     file_ids: List[int], # List of file IDs to delete
     current_user: User = Depends(get_current_user),
-    db: AsyncSession = Depends(get_db),
-    background_tasks: BackgroundTasks
+    db: AsyncSession = Depends(get_db)
 ):
     # Security check: Ensure the requesting user is either the owner or an admin
     if current_user.id != user_id and not current_user.is_admin:
@@ -349,12 +908,11 @@ async def delete_user_files(
         deleted_count += 1
         deleted_ids.append(file_obj.id)
 
-        # Trigger cleanup task for an agent if needed (e.g., delete from S3/disk)
-        # background_tasks.add_task(publish_command_to_agent, "gpt-agent_ops_execution", {
-        #     "command": "delete_physical_file",
-        #     "file_path": file_obj.file_path,
-        #     "file_id": file_obj.id
-        # })
+        # Trigger cleanup task for an agent if needed (e.g., delete from S3/disk), committed with the delete
+        # app.state.outbox.enqueue(db, "gpt-agent_ops_execution", {
+        #     "tool_name": "delete_physical_file",
+        #     "tool_arguments": {"file_path": file_obj.file_path, "file_id": file_obj.id}
+        # }, "maintenance", current_user.id)
 
     await db.commit()
 
@@ -365,40 +923,41 @@ async def reprocess_user_file(
     user_id: int,
     file_id: int,
     current_user: User = Depends(get_current_user),
-    db: AsyncSession = Depends(get_db),
-    background_tasks: BackgroundTasks
+    db: AsyncSession = Depends(get_db)
 ):
     # Security check: Ensure the requesting user is either the owner or an admin
     if current_user.id != user_id and not current_user.is_admin:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized to reprocess this file")
 
-    # Fetch the file to ensure it exists and belongs to the user
+    # Update the status and read back what the command needs in one UPDATE ... RETURNING;
+    # no row means the file doesn't exist or doesn't belong to the user
     result = await db.execute(
-        select(File).filter(File.id == file_id, File.user_id == user_id)
+        update(File)
+        .where(File.id == file_id, File.user_id == user_id)
+        .values(processing_status="reprocessing", last_processed_at=None) # Reset last processed timestamp
+        .returning(File.id, File.file_path, File.file_name, File.metadata_json, File.processing_status)
     )
-    file_to_reprocess = result.scalar_one_or_none()
+    file_to_reprocess = result.one_or_none()
 
     if not file_to_reprocess:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File not found or not authorized for re-processing.")
 
-    # Update the status in the database
-    file_to_reprocess.processing_status = "reprocessing"
-    file_to_reprocess.last_processed_at = None # Reset last processed timestamp
-    db.add(file_to_reprocess)
-    await db.commit()
-    await db.refresh(file_to_reprocess)
-
-    # Publish a command to the ingestion agent to re-process this file
+    # Publish a command to the ingestion agent to re-process this file, committed together with the status change
     reprocess_command = {
-        "command": "process_file",
-        "file_id": file_to_reprocess.id,
-        "user_id": current_user.id,
-        "file_path": file_to_reprocess.file_path,
-        "file_name": file_to_reprocess.file_name,
-        "metadata": file_to_reprocess.metadata_json
+        "tool_name": "process_file",
+        "tool_arguments": {
+            "file_id": file_to_reprocess.id,
+            "user_id": current_user.id,
+            "file_path": file_to_reprocess.file_path,
+            "file_name": file_to_reprocess.file_name,
+            "metadata": file_to_reprocess.metadata_json
+        }
     }
     # TODO: Identify the correct ingestion agent (e.g., 'gpt-agent_ingestion')
-    background_tasks.add_task(publish_command_to_agent, "gpt-agent_research", reprocess_command)
+    # Bulk work: queued behind queries and uploads, and shared fairly with other users' reprocessing.
+    app.state.outbox.enqueue(db, "gpt-agent_research", reprocess_command, "maintenance", current_user.id)
+    await db.commit()
+    app.state.outbox.notify()
 
 
     return {
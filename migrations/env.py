@@ -1,35 +1,34 @@
 # migrations/env.py
 from logging.config import fileConfig
+import asyncio
 import os
 import sys
 
-from sqlalchemy import engine_from_config
 from sqlalchemy import pool
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import async_engine_from_config
 
 from alembic import context
 
-# --- IMPORTANT: Add the project root to sys.path ---
-# This makes the 'gpt_nexus' package discoverable when Alembic runs.
-# Assuming your project structure is:
+# --- IMPORTANT: Add the Nexus service directory to sys.path ---
+# The ORM models live in gpt-nexus/app/models.py and are imported by main.py as
+# 'app.models', so Alembic imports them the same way.
+# Project structure:
 # nexus_orchestrator_project/
 # ├── gpt-nexus/
-# │   ├── __init__.py (make sure this file exists, even if empty)
-# │   ├── config.py
-# │   └── models.py
+# │   ├── main.py
+# │   └── app/
+# │       ├── __init__.py
+# │       └── models.py
 # └── migrations/
 #     └── env.py
-#     └── ...
-# Get the absolute path to the directory containing this env.py
+#     └── versions/
 current_dir = os.path.dirname(os.path.abspath(__file__))
-# Get the parent directory (which should be 'nexus_orchestrator_project')
-project_root = os.path.join(current_dir, '..')
-# Add the project root to the sys.path
-sys.path.insert(0, project_root)
+nexus_dir = os.path.join(current_dir, '..', 'gpt-nexus')
+sys.path.insert(0, nexus_dir)
 
-# --- Import your Base and settings ---
-# Now, with project_root in sys.path, you should be able to import gpt_nexus
-from gpt_nexus.models import Base
-from gpt_nexus.config import settings
+# --- Import your Base ---
+from app.models import Base
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
@@ -60,30 +59,42 @@ def run_migrations_offline() -> None:
         context.run_migrations()
 
 
-def run_migrations_online() -> None:
-    """Run migrations in 'online' mode."""
+def do_run_migrations(connection: Connection) -> None:
+    context.configure(
+        connection=connection,
+        target_metadata=target_metadata,
+    )
+
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+async def run_async_migrations() -> None:
+    """Run migrations through the same asyncpg driver Nexus uses."""
     configuration = config.get_section(config.config_ini_section)
     
-    # Set the sqlalchemy.url from your settings
-    db_url = settings.DATABASE_URL
+    # Set the sqlalchemy.url from the environment (same variable Nexus uses)
+    db_url = os.getenv("DATABASE_URL", configuration["sqlalchemy.url"])
     configuration["sqlalchemy.url"] = db_url
 
     print(f"Alembic attempting to connect to: {db_url}") # <-- NEW: Print the URL
 
-    connectable = engine_from_config(
+    # A migration run is one short-lived connection, so no pooling here.
+    connectable = async_engine_from_config(
         configuration,
         prefix="sqlalchemy.",
         poolclass=pool.NullPool,
     )
 
-    with connectable.connect() as connection:
-        context.configure(
-            connection=connection,
-            target_metadata=target_metadata,
-        )
+    async with connectable.connect() as connection:
+        await connection.run_sync(do_run_migrations)
+
+    await connectable.dispose()
 
-        with context.begin_transaction():
-            context.run_migrations()
+
+def run_migrations_online() -> None:
+    """Run migrations in 'online' mode."""
+    asyncio.run(run_async_migrations())
 
 
 if context.is_offline_mode():
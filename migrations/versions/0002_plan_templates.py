@@ -0,0 +1,43 @@
+"""Add plan_templates for persisted strategy plans
+
+Revision ID: 0002_plan_templates
+Revises: 0001_initial_schema
+Create Date: 2026-10-19 09:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0002_plan_templates'
+down_revision: Union[str, None] = '0001_initial_schema'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'plan_templates',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('signature', sa.String(length=512), nullable=False),
+        sa.Column('plan_json', sa.JSON(), nullable=False),
+        sa.Column('description', sa.Text(), nullable=True),
+        sa.Column('rule', sa.String(length=150), nullable=True),
+        sa.Column('hit_count', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.Column('last_used_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(op.f('ix_plan_templates_id'), 'plan_templates', ['id'], unique=False)
+    op.create_index(op.f('ix_plan_templates_signature'), 'plan_templates', ['signature'], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_plan_templates_signature'), table_name='plan_templates')
+    op.drop_index(op.f('ix_plan_templates_id'), table_name='plan_templates')
+    op.drop_table('plan_templates')
@@ -0,0 +1,45 @@
+"""Add command_outbox for transactional command dispatch
+
+Revision ID: 0003_command_outbox
+Revises: 0002_plan_templates
+Create Date: 2026-10-19 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0003_command_outbox'
+down_revision: Union[str, None] = '0002_plan_templates'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'command_outbox',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('request_id', sa.String(length=64), nullable=False),
+        sa.Column('agent_type', sa.String(length=255), nullable=False),
+        sa.Column('priority', sa.Integer(), nullable=False),
+        sa.Column('tenant', sa.String(length=150), nullable=False),
+        sa.Column('command', sa.JSON(), nullable=False),
+        sa.Column('deadline_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('claimed_by', sa.String(length=64), nullable=True),
+        sa.Column('claimed_until', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('request_id'),
+    )
+    op.create_index('ix_command_outbox_claim', 'command_outbox', ['priority', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_command_outbox_claim', table_name='command_outbox')
+    op.drop_table('command_outbox')
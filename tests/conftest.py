@@ -0,0 +1,87 @@
+# tests/conftest.py
+"""
+Shared setup for the test suite (run with `pytest tests/`, see run_tests.sh).
+
+Nexus and the agents are not installed packages, so their directories go on
+sys.path here, the way the scripts in benchmarks/ do it. Each agent's
+agent_app.py has the same module name, so tests load those by path with
+`load_agent_app()`.
+"""
+import importlib.util
+import os
+import sys
+
+import pytest
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for directory in ("gpt-nexus", "gpt-agent_comms", "gpt-agent_ops_execution", "gpt-agent_strategy", "gpt-agent_research"):
+    path = os.path.join(PROJECT_ROOT, directory)
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+
+def load_agent_app(agent_dir: str):
+    """Imports <agent_dir>/agent_app.py under a name of its own."""
+    name = f"{agent_dir.replace('-', '_')}_app"
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.spec_from_file_location(name, os.path.join(PROJECT_ROOT, agent_dir, "agent_app.py"))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def nexus(tmp_path, monkeypatch):
+    """
+    A running Nexus app (TestClient) on a throwaway SQLite database and an in-process fakeredis
+    server, with a registered user. Yields (client, auth headers, fakeredis server).
+    """
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("aiosqlite")
+    from fakeredis import aioredis as fake_aioredis
+    from fastapi.testclient import TestClient
+    from sqlalchemy import event
+    from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+    import app.database as database
+
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'nexus.db'}")
+    for name, listener in (("before_cursor_execute", database._before_cursor_execute), ("after_cursor_execute", database._after_cursor_execute)):
+        event.listen(engine.sync_engine, name, listener)
+    monkeypatch.setattr(database, "DB_SCHEMA_MODE", "create")
+    monkeypatch.setattr(database, "engine", engine)
+    monkeypatch.setattr(database, "AsyncSessionLocal", async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False))
+
+    import main
+
+    server = fakeredis.FakeServer()
+
+    async def redis_client():
+        return fake_aioredis.FakeRedis(server=server, decode_responses=True)
+
+    async def bus_redis_client():
+        return fake_aioredis.FakeRedis(server=server)
+
+    # Endpoints depend on the original get_redis_client; startup calls whatever the module holds.
+    main.app.dependency_overrides[main.get_redis_client] = redis_client
+    monkeypatch.setattr(main, "AsyncSessionLocal", database.AsyncSessionLocal)
+    monkeypatch.setattr(main, "get_redis_client", redis_client)
+    monkeypatch.setattr(main, "get_bus_redis_client", bus_redis_client)
+    # Per-worker routing state is module-global; start each test with no replicas known.
+    monkeypatch.setattr(main, "agent_registry", {})
+    monkeypatch.setattr(main, "agent_load", main.LoadHistory())
+    monkeypatch.setattr(main, "command_backlog", main.CommandBacklog())
+    # bcrypt is slow and beside the point here
+    monkeypatch.setattr(main, "get_password_hash", lambda password: f"plain:{password}")
+    monkeypatch.setattr(main, "verify_password", lambda password, hashed: hashed == f"plain:{password}")
+    try:
+        with TestClient(main.app) as client:
+            main.app.state.rate_limiter.limit.per_minute = 0
+            client.post("/auth/register", params={"username": "tester", "password": "secret"})
+            token = client.post("/auth/token", data={"username": "tester", "password": "secret"}).json()["access_token"]
+            yield client, {"Authorization": f"Bearer {token}"}, server
+    finally:
+        main.app.dependency_overrides.clear()
+        engine.sync_engine.dispose()
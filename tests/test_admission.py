@@ -0,0 +1,104 @@
+# tests/test_admission.py
+import pytest
+
+from app.admission import AdmissionController, AdmissionRejected
+
+
+def make_controller(**kwargs):
+    settings = dict(max_inflight=4, user_max_inflight=2, max_backlog=10, max_inbox_lag_seconds=5, admin_headroom=1.5, ticket_ttl_seconds=60)
+    settings.update(kwargs)
+    return AdmissionController(**settings)
+
+
+def rejection(controller, *args, **kwargs):
+    with pytest.raises(AdmissionRejected) as raised:
+        controller.admit(*args, **kwargs)
+    return raised.value
+
+
+def test_user_cap_and_release():
+    controller = make_controller()
+    first = controller.admit("alice", False, backlog=0, now=0)
+    controller.admit("alice", False, backlog=0, now=0)
+    assert rejection(controller, "alice", False, backlog=0, now=0).reason == "user_inflight"
+    controller.admit("bob", False, backlog=0, now=0)  # the cap is per user
+    controller.release(first)
+    controller.admit("alice", False, backlog=0, now=0)
+    assert controller.stats(now=0)["inflight"] == 3
+
+
+def test_admins_have_no_user_cap_and_headroom_on_global_limits():
+    controller = make_controller(user_max_inflight=1)
+    for user in ("a", "b", "c", "d"):
+        controller.admit(user, False, backlog=0, now=0)
+    assert rejection(controller, "e", False, backlog=0, now=0).reason == "inflight"
+    # 4 * 1.5 = 6 tickets for admins, and no per-user cap.
+    controller.admit("root", True, backlog=0, now=0)
+    controller.admit("root", True, backlog=0, now=0)
+    assert rejection(controller, "root", True, backlog=0, now=0).reason == "inflight"
+    assert controller.stats(now=0)["admin_inflight"] == 2
+
+    assert rejection(make_controller(), "alice", False, backlog=10, now=0).reason == "backlog"
+    make_controller().admit("root", True, backlog=14, now=0)
+
+
+def test_inbox_lag_sheds_load_and_sets_retry_after():
+    controller = make_controller()
+    controller.observe_inbox_lag(12, now=0)
+    refused = rejection(controller, "alice", False, backlog=0, now=1)
+    assert (refused.reason, refused.retry_after) == ("inbox_lag", 12)
+    # Stale lag samples are ignored.
+    controller.admit("alice", False, backlog=0, now=1000)
+
+    lagging = make_controller()
+    lagging.observe_inbox_lag(6, now=0)  # over 5s, but within the admins' 7.5s
+    assert rejection(lagging, "alice", False, backlog=0, now=1).reason == "inbox_lag"
+    lagging.admit("root", True, backlog=0, now=1)
+
+
+def test_tickets_expire_after_their_ttl():
+    controller = make_controller(user_max_inflight=1, ticket_ttl_seconds=60)
+    ticket = controller.admit("alice", False, backlog=0, now=0)
+    controller.bind(ticket, "rid", now=0)
+    assert rejection(controller, "alice", False, backlog=0, now=59).reason == "user_inflight"
+    controller.admit("alice", False, backlog=0, now=61)
+    assert controller.stats(now=61)["inflight"] == 1
+
+
+def test_bind_keys_the_ticket_by_request_id():
+    controller = make_controller()
+    ticket = controller.admit("alice", False, backlog=0, now=0)
+    controller.bind(ticket, "rid", now=0)
+    controller.release(ticket)  # the ticket id no longer holds anything
+    assert controller.stats(now=0)["inflight"] == 1
+    controller.release("rid")
+    assert controller.stats(now=0)["inflight"] == 0
+    assert controller.stats(now=0)["users_inflight"] == 0
+
+
+def test_binding_a_request_id_twice_holds_one_ticket():
+    controller = make_controller()
+    controller.bind(controller.admit("alice", False, backlog=0, now=0), "rid", now=0)
+    controller.bind(controller.admit("alice", False, backlog=0, now=0), "rid", now=0)  # e.g. a retried dispatch
+    assert controller.stats(now=0)["inflight"] == 1
+    controller.release("rid")
+    assert controller.stats(now=0)["users_inflight"] == 0
+
+
+def test_followers_of_an_in_flight_query_skip_admission(nexus, monkeypatch):
+    import main
+
+    client, headers, _ = nexus
+    monkeypatch.setattr(main, "admission", make_controller(user_max_inflight=1))
+    leader = client.post("/query", json={"query": "Plan the Q3 launch"}, headers=headers)
+    follower = client.post("/query", json={"query": "Plan the Q3 launch"}, headers=headers)
+    other = client.post("/query", json={"query": "Plan the Q4 review"}, headers=headers)
+
+    assert leader.status_code == 200 and not leader.json()["coalesced"]
+    assert follower.status_code == 200 and follower.json()["coalesced"]
+    assert follower.json()["query_id"] == leader.json()["query_id"]
+    assert other.status_code == 429
+    # The refused leader released its flight, so the same query can be tried again later.
+    monkeypatch.setattr(main, "admission", make_controller())
+    retried = client.post("/query", json={"query": "Plan the Q4 review"}, headers=headers)
+    assert retried.status_code == 200 and not retried.json()["coalesced"]
@@ -0,0 +1,96 @@
+# tests/test_agent_listener.py
+"""The generated agent's command listeners: one task per command, bounded prefetch from the type queue."""
+import asyncio
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from conftest import load_agent_app
+
+
+@pytest.fixture
+def ops_agent(monkeypatch):
+    agent = load_agent_app("gpt-agent_ops_execution")
+    state = {"running": 0, "peak": 0, "done": 0}
+
+    async def slow_shell_command(command, args, on_output=None):
+        state["running"] += 1
+        state["peak"] = max(state["peak"], state["running"])
+        try:
+            await state["gate"].wait()
+        finally:
+            state["running"] -= 1
+        state["done"] += 1
+        return {"stdout": " ".join([command] + args), "success": True}
+
+    monkeypatch.setattr(agent, "execute_shell_command", slow_shell_command)
+    return agent, state
+
+
+def command_frame(agent, request_id):
+    return agent.BUS_CODEC.encode({
+        "sender_id": "gpt-nexus", "message_type": "tool_command",
+        "payload": {"tool_name": "execute_shell_command", "tool_arguments": {"command": "echo", "args": [request_id]}, "request_id": request_id},
+    })
+
+
+async def wait_for(condition, timeout=5.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, "condition not met in time"
+        await asyncio.sleep(0.01)
+
+
+def test_queued_commands_run_concurrently_up_to_the_prefetch(ops_agent, monkeypatch):
+    agent, state = ops_agent
+    monkeypatch.setattr(agent, "COMMAND_QUEUE_PREFETCH", 3)
+
+    async def scenario():
+        state["gate"] = asyncio.Event()
+        redis_conn = fakeredis.aioredis.FakeRedis()
+        for index in range(5):
+            await redis_conn.lpush(agent.AGENT_TYPE_COMMAND_QUEUE, command_frame(agent, f"r{index}"))
+        listener = asyncio.ensure_future(agent.command_queue_listener(redis_conn))
+        try:
+            await wait_for(lambda: state["running"] == 3)
+            await asyncio.sleep(0.05)  # a fourth command would have been taken by now
+            held_back = await redis_conn.llen(agent.AGENT_TYPE_COMMAND_QUEUE)  # left for other replicas
+            state["gate"].set()
+            await wait_for(lambda: state["done"] == 5)  # the last two start as slots free up
+            return held_back, await redis_conn.llen(agent.AGENT_TYPE_COMMAND_QUEUE)
+        finally:
+            listener.cancel()
+            await asyncio.gather(listener, return_exceptions=True)
+
+    held_back, remaining = asyncio.run(scenario())
+    assert state["peak"] == 3
+    assert held_back == 2
+    assert remaining == 0
+
+
+def test_replica_channel_commands_do_not_wait_for_each_other(ops_agent):
+    agent, state = ops_agent
+
+    async def scenario():
+        state["gate"] = asyncio.Event()
+        server = fakeredis.FakeServer()
+        listener = asyncio.ensure_future(agent.redis_listener(fakeredis.aioredis.FakeRedis(server=server)))
+        publisher = fakeredis.aioredis.FakeRedis(server=server)
+        in_flight_before = agent.LOAD.snapshot()["in_flight"]
+        try:
+            await asyncio.sleep(0.05)  # let the listener subscribe
+            for index in range(4):
+                await publisher.publish(agent.PUBSUB_CHANNEL_AGENT_COMMANDS, command_frame(agent, f"r{index}"))
+            await wait_for(lambda: state["running"] == 4)
+            in_flight = agent.LOAD.snapshot()["in_flight"] - in_flight_before
+            await agent.cancel_commands()
+            return in_flight, len(agent.COMMAND_TASKS)
+        finally:
+            listener.cancel()
+            await asyncio.gather(listener, return_exceptions=True)
+
+    in_flight, left = asyncio.run(scenario())
+    assert state["peak"] == 4
+    assert in_flight == 4
+    assert left == 0
@@ -0,0 +1,119 @@
+# tests/test_autoscaler.py
+import asyncio
+import json
+import sys
+
+import pytest
+
+from app.agent_load import LoadHistory
+from app.autoscaler import Autoscaler, CommandBacklog, LocalProcessActuator, LogActuator, ScalingPolicy
+
+AGENT_TYPE = "gpt-agent_research"
+
+
+def make_policy(**overrides):
+    settings = dict(min_replicas=1, max_replicas=8, target_backlog=4, target_utilization=0.7, target_p99_ms=5000,
+                    tolerance=0.1, up_cooldown_seconds=30, down_stabilization_seconds=300)
+    settings.update(overrides)
+    return ScalingPolicy(**settings)
+
+
+def test_recommend_holds_within_the_tolerance_band():
+    policy = make_policy()
+    assert policy.recommend(2, backlog=8.6, busy=0, p99_ms=None) == (2, pytest.approx(1.075))
+    assert policy.recommend(2, backlog=7.4, busy=0, p99_ms=None)[0] == 2
+    assert policy.recommend(2, backlog=9, busy=0, p99_ms=None)[0] == 3
+    assert policy.recommend(2, backlog=4, busy=0, p99_ms=None)[0] == 1
+
+
+def test_recommend_at_most_doubles_and_respects_bounds():
+    policy = make_policy(max_replicas=4)
+    assert policy.recommend(1, backlog=40, busy=0, p99_ms=None)[0] == 2
+    assert policy.recommend(3, backlog=400, busy=0, p99_ms=None)[0] == 4
+    assert policy.recommend(1, backlog=0, busy=0, p99_ms=None)[0] == 1
+
+
+def test_recommend_uses_the_highest_of_backlog_utilization_and_latency():
+    policy = make_policy()
+    assert policy.recommend(2, backlog=0, busy=2.8, p99_ms=None) == (4, pytest.approx(2.0))
+    assert policy.recommend(2, backlog=0, busy=0, p99_ms=7500) == (3, pytest.approx(1.5))
+
+
+def make_autoscaler(pending, **policy_overrides):
+    return Autoscaler(LoadHistory(), CommandBacklog(), LogActuator(), agent_types=[AGENT_TYPE],
+                      policy=make_policy(**policy_overrides), pending=lambda agent_type: pending["depth"])
+
+
+def test_scale_up_waits_out_the_cooldown():
+    pending = {"depth": 8}
+    autoscaler = make_autoscaler(pending)
+
+    async def scenario():
+        first = (await autoscaler.step(now=1000))[0]
+        pending["depth"] = 40
+        cooling = (await autoscaler.step(now=1010))[0]
+        after = (await autoscaler.step(now=1031))[0]
+        return first, cooling, after
+
+    first, cooling, after = asyncio.run(scenario())
+    assert (first.reason, first.current, first.desired) == ("scale_up", 1, 2)
+    assert (cooling.reason, cooling.desired) == ("up_cooldown", 2)
+    assert (after.reason, after.current, after.desired) == ("scale_up", 2, 4)
+    assert autoscaler.actuator.replicas(AGENT_TYPE) == 4
+
+
+def test_scale_down_waits_for_the_stabilization_window():
+    pending = {"depth": 8}
+    autoscaler = make_autoscaler(pending)
+
+    async def scenario():
+        await autoscaler.step(now=1000)
+        pending["depth"] = 0
+        lull = (await autoscaler.step(now=1100))[0]
+        settled = (await autoscaler.step(now=1301))[0]
+        return lull, settled
+
+    lull, settled = asyncio.run(scenario())
+    assert (lull.reason, lull.current, lull.desired) == ("down_stabilization", 2, 2)
+    assert (settled.reason, settled.current, settled.desired) == ("scale_down", 2, 1)
+
+
+def test_replica_heartbeats_count_toward_backlog_and_latency():
+    autoscaler = make_autoscaler({"depth": 0})
+    autoscaler.load.record(f"{AGENT_TYPE}-001", {"in_flight": 6, "queue_depth": 6, "latency_p99_ms": 1000}, now=1000)
+    decision = autoscaler.evaluate(AGENT_TYPE, now=1001)
+    assert (decision.backlog, decision.p99_ms, decision.desired) == (12, 1000, 2)
+
+
+AGENT_STUB = """
+import json, os, sys, time
+with open(os.path.join(sys.argv[0] + "." + os.environ["AGENT_ID"] + ".json"), "w") as out:
+    json.dump({"agent_id": os.environ["AGENT_ID"], "nexus_url": os.environ["NEXUS_ORCHESTRATOR_URL"]}, out)
+time.sleep(60)
+"""
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="uses POSIX process signals")
+def test_local_replicas_do_not_reuse_the_default_agent_id(tmp_path):
+    agent_dir = tmp_path / AGENT_TYPE
+    agent_dir.mkdir()
+    (agent_dir / "agent_app.py").write_text(AGENT_STUB)
+    actuator = LocalProcessActuator(str(tmp_path), stop_timeout_seconds=5, nexus_url="http://127.0.0.1:8123")
+
+    async def scenario():
+        try:
+            await actuator.scale(AGENT_TYPE, 2)
+            for _ in range(100):
+                if len(list(agent_dir.glob("*.json"))) == 2:
+                    break
+                await asyncio.sleep(0.05)
+            await actuator.scale(AGENT_TYPE, 1)
+            return actuator.replicas(AGENT_TYPE), sorted(actuator._running(AGENT_TYPE))
+        finally:
+            await actuator.close()
+
+    replicas, running = asyncio.run(scenario())
+    started = sorted((json.loads(path.read_text()) for path in agent_dir.glob("*.json")), key=lambda seen: seen["agent_id"])
+    assert [seen["agent_id"] for seen in started] == [f"{AGENT_TYPE}-local-001", f"{AGENT_TYPE}-local-002"]
+    assert {seen["nexus_url"] for seen in started} == {"http://127.0.0.1:8123"}
+    assert (replicas, running) == (1, [f"{AGENT_TYPE}-local-001"])
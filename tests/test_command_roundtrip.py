@@ -0,0 +1,73 @@
+# tests/test_command_roundtrip.py
+"""Nexus -> outbox -> bus -> agent -> orchestrator inbox -> waiter, with a real agent listener."""
+import pytest
+
+from conftest import load_agent_app
+
+
+def start_agent(client, server):
+    """A strategy agent's listeners, running on Nexus's event loop against the same fakeredis server."""
+    from fakeredis import aioredis as fake_aioredis
+
+    agent = load_agent_app("gpt-agent_strategy")
+    listeners = [client.portal.start_task_soon(listener, fake_aioredis.FakeRedis(server=server))
+                 for listener in (agent.redis_listener, agent.command_queue_listener)]
+    return agent, listeners
+
+
+@pytest.fixture
+def strategy_agent(nexus):
+    client, headers, server = nexus
+    agent, listeners = start_agent(client, server)
+    yield agent
+    for listener in listeners:
+        listener.cancel()
+
+
+def query(client, headers, text):
+    response = client.post("/query", json={"query": text}, headers=headers)
+    assert response.status_code == 200, response.text
+    query_id = response.json()["query_id"]
+    return client.get(f"/query/{query_id}", params={"wait": 10}, headers=headers).json()
+
+
+def test_query_reaches_agent_type_channel_and_result_comes_back(nexus, strategy_agent):
+    client, headers, _ = nexus
+    # No replica reports load, so Nexus queues the command on agent_queue:gpt-agent_strategy.
+    reply = query(client, headers, "Plan the Q3 launch for Acme")
+    assert reply["status"] == "completed", reply
+    assert "error" not in reply["result"]
+    assert "plan" in reply["result"]
+    assert reply["result"]["request_id"] == reply["query_id"]
+
+
+def test_query_reaches_replica_channel_after_heartbeat(nexus, strategy_agent):
+    client, headers, _ = nexus
+    # A heartbeat with load makes the agent a routable replica: agent_commands:<AGENT_ID>.
+    response = client.post("/agent/heartbeat", json={"agent_id": strategy_agent.AGENT_ID, "load": strategy_agent.LOAD.snapshot()})
+    assert response.status_code == 200
+    reply = query(client, headers, "Plan the Q4 review for Acme")
+    assert reply["status"] == "completed", reply
+    assert "plan" in reply["result"]
+
+
+def test_type_queued_command_runs_on_exactly_one_replica(nexus, monkeypatch):
+    client, headers, server = nexus
+    # Three competing consumers of the type's queue (the module is shared, which is fine for BRPOP).
+    replicas = [start_agent(client, server) for _ in range(3)]
+    agent, handled = replicas[0][0], []
+    handle = agent.handle_message
+
+    def counting(redis_conn, source, data):
+        handled.append(source)
+        return handle(redis_conn, source, data)
+
+    monkeypatch.setattr(agent, "handle_message", counting)
+    try:
+        reply = query(client, headers, "Plan the Q1 kickoff for Acme")
+        assert reply["status"] == "completed", reply
+        assert handled == ["agent_queue:gpt-agent_strategy"]
+    finally:
+        for _, listeners in replicas:
+            for listener in listeners:
+                listener.cancel()
@@ -0,0 +1,167 @@
+# tests/test_delivery.py
+import asyncio
+import time
+from typing import Any, Dict, Optional
+
+import pytest
+
+pytest.importorskip("jinja2")
+
+from delivery import DeliveryEngine, IdempotencyStore, Provider, StubProvider, TokenBucket
+
+
+class FailingProvider(Provider):
+    name = "failing"
+
+    async def send(self, recipient: str, message_content: str, subject: Optional[str] = None) -> Dict[str, Any]:
+        raise ConnectionError("provider down")
+
+
+def test_provider_is_abstract():
+    with pytest.raises(TypeError):
+        Provider()
+
+
+def test_token_bucket_allows_a_burst_then_throttles_to_rate():
+    async def scenario():
+        bucket = TokenBucket(rate=100, capacity=5)
+        started = time.monotonic()
+        for _ in range(5):
+            await bucket.acquire()
+        burst = time.monotonic() - started
+        for _ in range(5):
+            await bucket.acquire()
+        return burst, time.monotonic() - started
+
+    burst, total = asyncio.run(scenario())
+    assert burst < 0.03
+    assert total >= 0.045  # five more tokens at 100/s
+
+
+def test_token_bucket_refills_while_idle_up_to_capacity():
+    async def scenario():
+        bucket = TokenBucket(rate=100, capacity=3)
+        for _ in range(3):
+            await bucket.acquire()
+        await asyncio.sleep(0.1)  # enough for 10 tokens, capped at 3
+        started = time.monotonic()
+        for _ in range(3):
+            await bucket.acquire()
+        refilled = time.monotonic() - started
+        await bucket.acquire()
+        return refilled, time.monotonic() - started
+
+    refilled, with_one_more = asyncio.run(scenario())
+    assert refilled < 0.03
+    assert with_one_more >= 0.008
+
+
+def test_idempotency_store_suppresses_duplicates_until_released():
+    async def scenario():
+        store = IdempotencyStore(window_seconds=60)
+        return [await store.claim("k"), await store.claim("k"), await store.claim("other"),
+                await store.release("k"), await store.claim("k")]
+
+    assert asyncio.run(scenario()) == [True, False, True, None, True]
+
+
+def test_idempotency_store_forgets_keys_after_the_window():
+    async def scenario():
+        store = IdempotencyStore(window_seconds=0)
+        return await store.claim("k"), await store.claim("k")
+
+    assert asyncio.run(scenario()) == (True, True)
+
+
+def test_idempotency_store_window_is_shared_through_redis():
+    fakeredis = pytest.importorskip("fakeredis")
+
+    async def scenario():
+        redis = fakeredis.aioredis.FakeRedis()
+        first, second = IdempotencyStore(redis, window_seconds=60), IdempotencyStore(redis, window_seconds=60)
+        return await first.claim("k"), await second.claim("k")
+
+    assert asyncio.run(scenario()) == (True, False)
+
+
+def test_delivery_aggregates_per_recipient_outcomes():
+    async def scenario():
+        email = StubProvider("email")
+        engine = DeliveryEngine(providers={"email": email, "sms": FailingProvider()}, idempotency=IdempotencyStore())
+        first = await engine.deliver(
+            ["a@example.com", "b@example.com", {"recipient": "+15550100", "channel": "sms"}],
+            message_content="Launch moved to Friday", subject="Launch",
+        )
+        again = await engine.deliver(["a@example.com"], message_content="Launch moved to Friday", subject="Launch")
+        return email, first, again
+
+    email, first, again = asyncio.run(scenario())
+    assert (first["status"], first["total"], first["sent"], first["duplicates"], first["failed"]) == ("partial", 3, 2, 0, 1)
+    assert first["channels"] == {"email": 2, "sms": 1}
+    by_recipient = {outcome["recipient"]: outcome for outcome in first["results"]}
+    assert by_recipient["+15550100"]["status"] == "failed"
+    assert "provider down" in by_recipient["+15550100"]["error"]
+    assert by_recipient["a@example.com"]["status"] == "success"
+    assert [sent["recipient"] for sent in email.sent] == ["a@example.com", "b@example.com"]
+    assert (again["status"], again["duplicates"], again["sent"]) == ("success", 1, 0)
+
+
+def test_delivery_failed_send_can_be_retried():
+    async def scenario():
+        engine = DeliveryEngine(providers={"sms": FailingProvider()}, idempotency=IdempotencyStore())
+        first = await engine.deliver(["+15550100"], message_content="hi", channel="sms")
+        engine.providers["sms"] = StubProvider("sms")
+        return first, await engine.deliver(["+15550100"], message_content="hi", channel="sms")
+
+    first, retried = asyncio.run(scenario())
+    assert first["status"] == "failed"
+    assert (retried["status"], retried["sent"]) == ("success", 1)
+
+
+def test_delivery_reports_recipients_without_a_body():
+    result = asyncio.run(DeliveryEngine(idempotency=IdempotencyStore()).deliver(["a@example.com"]))
+    assert result["status"] == "failed"
+    assert "Could not build message" in result["results"][0]["error"]
+
+
+def test_delivery_renders_inline_template_source_per_recipient():
+    async def scenario():
+        email = StubProvider("email")
+        engine = DeliveryEngine(providers={"email": email}, idempotency=IdempotencyStore())
+        result = await engine.deliver(
+            [{"recipient": "a@example.com", "template_context": {"name": "Ada"}},
+             {"recipient": "b@example.com", "template_context": {"name": "Bo"}}],
+            template_source="Hi {{ name }}, your {{ item }} shipped.", template_context={"item": "order"},
+        )
+        return email, result, engine.renderer
+
+    email, result, renderer = asyncio.run(scenario())
+    assert result["status"] == "success"
+    assert [sent["message_content"] for sent in email.sent] == ["Hi Ada, your order shipped.", "Hi Bo, your order shipped."]
+    assert len(renderer._inline) == 1  # compiled once for both recipients
+
+
+@pytest.mark.parametrize("source", [
+    "{{ cycler.__init__.__globals__.os.getcwd() }}",
+    "{{ ''.__class__.__mro__[1].__subclasses__() }}",
+    "{{ recipients.append('x') }}",
+])
+def test_inline_template_source_is_sandboxed(source):
+    from jinja2.exceptions import SecurityError
+    from message_templates import MessageRenderer
+
+    with pytest.raises(SecurityError):
+        MessageRenderer().render_inline(source, {"recipients": []})
+
+
+def test_delivery_refuses_a_template_injection_payload():
+    async def scenario():
+        email = StubProvider("email")
+        engine = DeliveryEngine(providers={"email": email}, idempotency=IdempotencyStore())
+        result = await engine.deliver(["a@example.com"], template_source="{{ cycler.__init__.__globals__.os.getcwd() }}")
+        return email, result
+
+    email, result = asyncio.run(scenario())
+    assert result["status"] == "failed"
+    assert "unsafe" in result["results"][0]["error"]
+    assert email.sent == []
@@ -0,0 +1,92 @@
+# tests/test_dispatch.py
+import asyncio
+
+import pytest
+
+from app import dispatch
+from app.dispatch import DispatchScheduler, TenantQueues
+
+AGENT_TYPE = "gpt-agent_research"
+
+
+def make_scheduler(sent, outstanding, **kwargs):
+    async def send_batch(jobs):
+        sent.extend(job.payload for job in jobs)
+
+    return DispatchScheduler(outstanding=lambda agent_type: outstanding["count"], replicas=lambda agent_type: 1,
+                             send_batch=send_batch, deadlines={}, **kwargs)
+
+
+def test_default_has_no_window_so_unanswered_commands_do_not_block():
+    async def scenario():
+        sent, outstanding = [], {"count": 1000}  # e.g. agents that never reply
+        scheduler = make_scheduler(sent, outstanding)
+        for index in range(50):
+            scheduler.submit(AGENT_TYPE, None, "maintenance", tenant=1, payload=index)
+        started = scheduler.dispatch_ready()
+        await asyncio.sleep(0)
+        return scheduler, started, sent
+
+    scheduler, started, sent = asyncio.run(scenario())
+    assert scheduler.room(AGENT_TYPE) is None
+    assert started == 50
+    assert sent == list(range(50))
+
+
+def test_window_holds_commands_until_replies_free_room():
+    async def scenario():
+        sent, outstanding = [], {"count": 0}
+        scheduler = make_scheduler(sent, outstanding, window_per_replica=2)
+        for index in range(5):
+            scheduler.submit(AGENT_TYPE, None, "ingest", tenant=1, payload=index)
+        first = scheduler.dispatch_ready()
+        await asyncio.sleep(0)
+        outstanding["count"] = 2  # the two sent commands are unanswered
+        blocked = scheduler.dispatch_ready()
+        outstanding["count"] = 0  # both replied
+        resumed = scheduler.dispatch_ready()
+        await asyncio.sleep(0)
+        return first, blocked, resumed, sent
+
+    assert asyncio.run(scenario()) == (2, 0, 2, [0, 1, 2, 3])
+
+
+def test_queries_go_ahead_of_queued_bulk_work():
+    async def scenario():
+        sent, outstanding = [], {"count": 0}
+        scheduler = make_scheduler(sent, outstanding, window_per_replica=1)
+        for index in range(3):
+            scheduler.submit(AGENT_TYPE, None, "maintenance", tenant=1, payload=f"reprocess-{index}")
+        scheduler.submit(AGENT_TYPE, None, "interactive", tenant=2, payload="query")
+        scheduler.dispatch_ready()
+        await asyncio.sleep(0)
+        return sent
+
+    assert asyncio.run(scenario()) == ["query"]
+
+
+@pytest.mark.parametrize("setting, spec", [
+    ("DISPATCH_TENANT_WEIGHTS", "alice=2,bob=0"),
+    ("DISPATCH_TENANT_WEIGHTS", "bob=-1"),
+    ("DISPATCH_CLASS_WEIGHTS", "interactive=16,ingest=0,maintenance=1"),
+])
+def test_non_positive_weights_are_rejected(monkeypatch, setting, spec):
+    monkeypatch.setattr(dispatch, setting, spec)
+    with pytest.raises(ValueError, match=setting):
+        DispatchScheduler(outstanding=lambda agent_type: 0, replicas=lambda agent_type: 1)
+
+
+def test_explicit_zero_tenant_weight_is_rejected():
+    with pytest.raises(ValueError, match="bob=0"):
+        DispatchScheduler(outstanding=lambda agent_type: 0, replicas=lambda agent_type: 1, tenant_weights={"bob": 0})
+
+
+def test_fractional_tenant_weight_takes_several_turns_per_command():
+    weights = {"light": 0.5, "heavy": 1.0}
+    queues = TenantQueues(lambda tenant: weights[tenant])
+    for index in range(4):
+        for tenant in weights:
+            queues.push(dispatch.Job(AGENT_TYPE, "ingest", tenant, None, None, float("inf"), 0.0, f"{tenant}-{index}"))
+    order = [queues.pop().tenant for _ in range(8)]
+    assert order[:6].count("heavy") == 4  # heavy drains at twice light's rate
+    assert order.count("light") == 4
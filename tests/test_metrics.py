@@ -0,0 +1,150 @@
+# tests/test_metrics.py
+"""Prometheus text rendering of app/metrics.py, checked in-process."""
+import threading
+
+import pytest
+
+from app.metrics import CONTENT_TYPE, MetricsRegistry
+
+
+def lines(registry):
+    return registry.render().splitlines()
+
+
+def test_counter_renders_help_type_and_one_sample_per_label_set():
+    registry = MetricsRegistry()
+    requests = registry.counter("http_requests_total", "HTTP requests.", ["method", "status"])
+    requests.labels("GET", "200").inc()
+    requests.labels("GET", "200").inc(2)
+    requests.labels("POST", "500").inc(0.5)
+
+    assert lines(registry) == [
+        "# HELP http_requests_total HTTP requests.",
+        "# TYPE http_requests_total counter",
+        'http_requests_total{method="GET",status="200"} 3',
+        'http_requests_total{method="POST",status="500"} 0.5',
+    ]
+
+
+def test_counter_sums_increments_from_every_thread():
+    registry = MetricsRegistry()
+    counter = registry.counter("work_total", "Work done.")
+
+    def work():
+        for _ in range(1000):
+            counter.inc()
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert "work_total 4000" in lines(registry)
+
+
+def test_labels_must_match_the_declared_names():
+    counter = MetricsRegistry().counter("jobs_total", "Jobs.", ["queue"])
+    with pytest.raises(ValueError):
+        counter.labels("a", "b")
+
+
+def test_histogram_renders_cumulative_buckets_sum_and_count():
+    registry = MetricsRegistry()
+    latency = registry.histogram("latency_seconds", "Latency.", ["route"], buckets=[0.5, 0.1])
+    for value in (0.05, 0.1, 0.3, 2.0):
+        latency.labels("/query").observe(value)
+
+    assert lines(registry) == [
+        "# HELP latency_seconds Latency.",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{route="/query",le="0.1"} 2',  # bounds are sorted; le is inclusive
+        'latency_seconds_bucket{route="/query",le="0.5"} 3',
+        'latency_seconds_bucket{route="/query",le="+Inf"} 4',
+        'latency_seconds_sum{route="/query"} 2.45',
+        'latency_seconds_count{route="/query"} 4',
+    ]
+
+
+def test_histogram_time_observes_elapsed_seconds():
+    registry = MetricsRegistry()
+    histogram = registry.histogram("op_seconds", "Op.", buckets=[60])
+    with histogram.time():
+        pass
+    assert 'op_seconds_bucket{le="60"} 1' in lines(registry)
+    assert "op_seconds_count 1" in lines(registry)
+
+
+def test_gauge_function_is_read_at_scrape_time():
+    registry = MetricsRegistry()
+    depth = {"value": 1}
+    registry.gauge("queue_depth", "Queue depth.", function=lambda: depth["value"])
+    registry.gauge("pool_size", "Pool size.", ["pool"], function=lambda: {("db",): 5, ("redis",): 2.5})
+
+    assert "queue_depth 1" in lines(registry)
+    depth["value"] = 7
+    rendered = lines(registry)
+    assert "queue_depth 7" in rendered
+    assert 'pool_size{pool="db"} 5' in rendered
+    assert 'pool_size{pool="redis"} 2.5' in rendered
+
+
+def test_set_gauge_and_callback_counter():
+    registry = MetricsRegistry()
+    registry.gauge("replicas", "Replicas.").set(3)
+    registry.callback_counter("checkouts_total", "Pool checkouts.", function=lambda: 12)
+
+    rendered = lines(registry)
+    assert "replicas 3" in rendered
+    assert "# TYPE checkouts_total counter" in rendered
+    assert "checkouts_total 12" in rendered
+
+
+def test_label_values_and_help_text_are_escaped():
+    registry = MetricsRegistry()
+    registry.counter("odd_total", 'Help with a \\ and\na newline.', ["path"]).labels('C:\\tmp\n"x"').inc()
+
+    assert lines(registry) == [
+        "# HELP odd_total Help with a \\\\ and\\na newline.",
+        "# TYPE odd_total counter",
+        'odd_total{path="C:\\\\tmp\\n\\"x\\""} 1',
+    ]
+
+
+def test_value_formatting():
+    registry = MetricsRegistry()
+    registry.gauge("big", "Big.").set(1e20)
+    registry.gauge("inf", "Inf.").set(float("inf"))
+    registry.gauge("neg_inf", "Negative inf.").set(float("-inf"))
+    registry.gauge("whole", "Whole.").set(2.0)
+
+    rendered = lines(registry)
+    assert "big 1e+20" in rendered
+    assert "inf +Inf" in rendered
+    assert "neg_inf -Inf" in rendered
+    assert "whole 2" in rendered
+
+
+def test_duplicate_names_are_rejected():
+    registry = MetricsRegistry()
+    registry.counter("dup_total", "Dup.")
+    with pytest.raises(ValueError):
+        registry.gauge("dup_total", "Dup again.")
+
+
+def test_failing_gauge_does_not_break_the_scrape():
+    registry = MetricsRegistry()
+    registry.gauge("broken", "Broken.", function=lambda: 1 / 0)
+    registry.counter("fine_total", "Fine.").inc()
+
+    rendered = lines(registry)
+    assert rendered[0].startswith("# broken unavailable:")
+    assert "fine_total 1" in rendered
+    assert registry.render().endswith("\n")
+
+
+def test_metrics_endpoint_serves_the_exposition_format(nexus):
+    client, _, _ = nexus
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == CONTENT_TYPE
+    assert "# TYPE " in response.text
@@ -0,0 +1,104 @@
+# tests/test_native_commands.py
+"""
+Parity between the ops agent's in-process commands (native_commands.py) and the
+same argv run as a real subprocess (CommandExecutor with native_commands=False).
+"""
+import asyncio
+import shutil
+import subprocess
+
+import pytest
+
+from executor import CommandExecutor
+from native_commands import run_native
+
+COMPARED_FIELDS = ("stdout", "stderr", "success", "return_code", "truncated", "timed_out")
+
+PARITY_CASES = [
+    ["echo", "hello", "world"],
+    ["echo", "-n", "no newline"],
+    ["echo"],
+    ["pwd"],
+    ["date", "+%Y-%m-%d"],
+    ["cat", "docs/notes.txt"],
+    ["cat", "docs/notes.txt", "docs/Zeta.md"],
+    ["cat", "missing.txt"],
+    ["cat", "docs"],
+    ["cat", "docs/notes.txt", "missing.txt", "docs/Zeta.md"],
+    ["cat", "big.log"],
+    ["ls"],
+    ["ls", "docs"],
+    ["ls", "docs/empty"],
+    ["ls", "docs", "big.log", "missing"],
+    ["ls", "docs/notes.txt"],
+]
+
+# Forms the native path does not implement; they must go to a real subprocess.
+FALLBACK_CASES = [
+    ["echo", "-e", "a\\tb"],
+    ["ls", "-la"],
+    ["cat", "-n", "docs/notes.txt"],
+    ["pwd", "-P"],
+    ["date", "-u"],
+]
+
+
+def _gnu_coreutils() -> bool:
+    try:
+        return "GNU coreutils" in subprocess.run(["ls", "--version"], capture_output=True, text=True).stdout
+    except OSError:
+        return False
+
+
+pytestmark = pytest.mark.skipif(
+    not (_gnu_coreutils() and shutil.which("date") and shutil.which("cat")),
+    reason="native commands reproduce GNU coreutils output",
+)
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    # The native forms match coreutils in the C locale, which is what the subprocesses inherit.
+    monkeypatch.setenv("LC_ALL", "C")
+    (tmp_path / "docs" / "empty").mkdir(parents=True)
+    (tmp_path / "docs" / "notes.txt").write_text("line one\nline two\n")
+    (tmp_path / "docs" / "Zeta.md").write_text("# Zeta\n")
+    (tmp_path / "docs" / ".hidden").write_text("hidden\n")
+    (tmp_path / "big.log").write_bytes(b"x" * 5000 + b"\n")
+    return str(tmp_path)
+
+
+def run_both(argv, cwd, max_output_bytes):
+    async def both():
+        native = await run_native(argv, cwd, max_output_bytes)
+        forked = await CommandExecutor(native_commands=False, max_output_bytes=max_output_bytes).run(argv, cwd=cwd)
+        return native, forked
+
+    return asyncio.run(both())
+
+
+@pytest.mark.parametrize("max_output_bytes", [1024 * 1024, 4096], ids=["default-cap", "4KB-cap"])
+@pytest.mark.parametrize("argv", PARITY_CASES, ids=lambda argv: " ".join(argv) or "empty")
+def test_native_matches_subprocess(workdir, argv, max_output_bytes):
+    native, forked = run_both(argv, workdir, max_output_bytes)
+    assert native is not None, "expected an in-process answer"
+    assert set(native) == set(forked)
+    assert {field: native[field] for field in COMPARED_FIELDS} == {field: forked[field] for field in COMPARED_FIELDS}
+
+
+@pytest.mark.parametrize("argv", FALLBACK_CASES, ids=lambda argv: " ".join(argv))
+def test_unsupported_forms_fall_back_to_subprocess(workdir, argv):
+    assert asyncio.run(run_native(argv, workdir, 1024 * 1024)) is None
+
+
+def test_executor_uses_native_path_for_supported_forms(workdir):
+    executor = CommandExecutor()
+    result = asyncio.run(executor.run(["cat", "docs/notes.txt"], cwd=workdir))
+    assert result["stdout"] == "line one\nline two"
+    assert executor.stats["native"] == 1
+    assert executor.stats["executed"] == 0
+
+
+def test_non_c_locale_date_goes_to_subprocess(workdir, monkeypatch):
+    monkeypatch.setenv("LC_ALL", "de_DE.UTF-8")
+    assert asyncio.run(run_native(["date"], workdir, 1024)) is None
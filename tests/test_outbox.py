@@ -0,0 +1,177 @@
+# tests/test_outbox.py
+"""OutboxRelay against a throwaway SQLite database, with a real DispatchScheduler in front of a fake publish."""
+import asyncio
+from datetime import timedelta
+
+import pytest
+
+pytest.importorskip("aiosqlite")
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from app.dispatch import DispatchScheduler
+from app.models import Base, OutboxMessage
+from app.outbox import OutboxRelay, utcnow
+
+AGENT_TYPE = "gpt-agent_research"
+
+
+class Bus:
+    """A publish() that records what it sent, or fails while `down`."""
+
+    def __init__(self):
+        self.sent = []
+        self.down = False
+
+    async def __call__(self, commands):
+        if self.down:
+            raise ConnectionError("redis down")
+        self.sent.extend(commands)
+
+
+def run(tmp_path, scenario):
+    async def main():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'outbox.db'}")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        sessions = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+        try:
+            return await scenario(sessions)
+        finally:
+            await engine.dispose()
+
+    return asyncio.run(main())
+
+
+def make_relay(sessions, bus, **kwargs):
+    dispatcher = DispatchScheduler(outstanding=lambda agent_type: 0, replicas=lambda agent_type: 1, deadlines={})
+    relay = OutboxRelay(sessions, dispatcher, bus, **kwargs)
+    dispatcher.send_batch = relay.send_batch
+    return relay
+
+
+async def add(sessions, relay, rows, deadline_seconds=None):
+    """rows: (priority, tenant) pairs; returns their request_ids in order."""
+    async with sessions() as session:
+        added = [relay.enqueue(session, AGENT_TYPE, {"tool_name": "process_file", "tool_arguments": {"n": index}},
+                               priority, tenant, deadline_seconds=deadline_seconds)
+                 for index, (priority, tenant) in enumerate(rows)]
+        await session.commit()
+        return [row.request_id for row in added]
+
+
+async def table(sessions):
+    async with sessions() as session:
+        return (await session.execute(select(OutboxMessage).order_by(OutboxMessage.id))).scalars().all()
+
+
+async def settle(condition, timeout=5.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not await condition():
+        assert asyncio.get_running_loop().time() < deadline, "condition not met in time"
+        await asyncio.sleep(0.01)
+
+
+def test_claim_takes_queries_first_and_caps_each_tenant(tmp_path):
+    async def scenario(sessions):
+        relay = make_relay(sessions, Bus(), batch_size=10, claim_per_tenant=2)
+        await add(sessions, relay, [("maintenance", "bulk")] * 5 + [("ingest", "alice")] * 3 + [("interactive", "bob")])
+        first = await relay.claim([0, 1, 2])
+        second = await make_relay(sessions, Bus(), batch_size=10, claim_per_tenant=2).claim([0, 1, 2])
+        return first, second
+
+    first, second = run(tmp_path, scenario)
+    assert [(row.priority, row.tenant) for row in first] == [(0, "bob"), (1, "alice"), (1, "alice"), (2, "bulk"), (2, "bulk")]
+    # Claimed rows are leased; a second relay only sees what was left behind.
+    assert [(row.priority, row.tenant) for row in second] == [(1, "alice"), (2, "bulk"), (2, "bulk")]
+
+
+def test_lapsed_lease_is_claimed_again_and_renew_extends_it(tmp_path):
+    async def scenario(sessions):
+        holder = make_relay(sessions, Bus(), lease_seconds=60)
+        await add(sessions, holder, [("ingest", "alice")])
+        await holder.pump()
+        before = (await table(sessions))[0].claimed_until
+        await asyncio.sleep(0.01)
+        await holder.renew()
+        after = (await table(sessions))[0].claimed_until
+        blocked = await make_relay(sessions, Bus()).claim([0, 1, 2])
+
+        lapsed = make_relay(sessions, Bus(), lease_seconds=0)
+        await add(sessions, lapsed, [("ingest", "carol")])
+        await lapsed.claim([1])
+        return before, after, blocked, await make_relay(sessions, Bus()).claim([0, 1, 2])
+
+    before, after, blocked, reclaimed = run(tmp_path, scenario)
+    assert after > before
+    assert blocked == []
+    assert [row.tenant for row in reclaimed] == ["carol"]
+
+
+def test_published_rows_are_deleted(tmp_path):
+    async def scenario(sessions):
+        bus = Bus()
+        relay = make_relay(sessions, bus)
+        request_ids = await add(sessions, relay, [("ingest", "alice"), ("interactive", "bob")])
+        await relay.pump()
+        relay.dispatcher.dispatch_ready()
+        await settle(lambda: _empty(sessions))
+        return bus.sent, request_ids, relay.stats()
+
+    sent, request_ids, stats = run(tmp_path, scenario)
+    assert [(agent_type, priority, tenant) for agent_type, _, priority, tenant in sent] == [
+        (AGENT_TYPE, "interactive", "bob"), (AGENT_TYPE, "ingest", "alice"),
+    ]
+    assert sorted(command["request_id"] for _, command, _, _ in sent) == sorted(request_ids)
+    assert (stats["published_total"], stats["batches_total"], stats["held"]["ingest"]) == (2, 1, 0)
+
+
+def test_failed_publish_releases_rows_for_a_later_retry(tmp_path):
+    async def scenario(sessions):
+        bus = Bus()
+        bus.down = True
+        relay = make_relay(sessions, bus, retry_seconds=30)
+        await add(sessions, relay, [("ingest", "alice"), ("ingest", "bob")])
+        await relay.pump()
+        relay.dispatcher.dispatch_ready()
+        await settle(lambda: _released(sessions))
+        rows = await table(sessions)
+        return rows, relay.stats(), await relay.claim([0, 1, 2])
+
+    rows, stats, claimable_now = run(tmp_path, scenario)
+    assert len(rows) == 2  # nothing is lost
+    assert all(row.claimed_by is None for row in rows)
+    # Claimable again only after retry_seconds.
+    assert all(row.claimed_until.replace(tzinfo=None) > (utcnow() + timedelta(seconds=20)).replace(tzinfo=None) for row in rows)
+    assert claimable_now == []
+    assert (stats["failed_total"], stats["published_total"], sum(stats["held"].values())) == (2, 0, 0)
+
+
+def test_rows_past_their_deadline_are_dropped_and_reported(tmp_path):
+    async def scenario(sessions):
+        bus, expired = Bus(), []
+
+        async def on_expired(command):
+            expired.append(command["request_id"])
+
+        relay = make_relay(sessions, bus, on_expired=on_expired)
+        request_ids = await add(sessions, relay, [("interactive", "bob")], deadline_seconds=0.01)
+        await asyncio.sleep(0.05)
+        await relay.pump()
+        relay.dispatcher.dispatch_ready()
+        return request_ids, expired, bus.sent, await table(sessions), relay.stats()
+
+    request_ids, expired, sent, rows, stats = run(tmp_path, scenario)
+    assert expired == request_ids
+    assert sent == []
+    assert rows == []
+    assert stats["expired_total"] == 1
+
+
+async def _empty(sessions):
+    return not await table(sessions)
+
+
+async def _released(sessions):
+    return all(row.claimed_by is None for row in await table(sessions))
@@ -0,0 +1,92 @@
+# tests/test_rate_limit.py
+import asyncio
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from app.rate_limit import LocalGCRA, Limit, RateLimiter
+
+
+def test_zero_limits_disable_limiting_instead_of_crashing():
+    limiter = RateLimiter(per_minute=0, route_limits={"/query": 0, "/auth/token": 10})
+    assert limiter.limit.per_minute == 0
+    assert list(limiter.route_limits) == ["/auth/token"]
+
+
+def test_local_gcra_allows_the_burst_then_spaces_requests():
+    gcra, limit = LocalGCRA(), Limit(60, burst=3)  # one per second, three back to back
+    decisions = [gcra.check(["client"], [limit], now=0.0) for _ in range(4)]
+    assert [allowed for allowed, _, _ in decisions] == [True, True, True, False]
+    assert [remaining for _, remaining, _ in decisions[:3]] == [2, 1, 0]
+    assert decisions[3][2] == pytest.approx(1000)  # ms until the next request fits
+    assert gcra.check(["client"], [limit], now=1000.0)[0]
+    assert not gcra.check(["client"], [limit], now=1000.0)[0]
+
+
+def test_local_gcra_checks_every_key_before_updating_any():
+    gcra, client_limit, route_limit = LocalGCRA(), Limit(60, burst=5), Limit(60, burst=1)
+    assert gcra.check(["client", "client:/query"], [client_limit, route_limit], now=0.0)[0]
+    assert not gcra.check(["client", "client:/query"], [client_limit, route_limit], now=0.0)[0]
+    # The refused request did not use up the client-wide allowance.
+    assert gcra.check(["client"], [client_limit], now=0.0)[1] == 3
+
+
+def test_redis_script_enforces_client_and_route_limits_together():
+    async def scenario():
+        limiter = RateLimiter(fakeredis.aioredis.FakeRedis(), per_minute=60, burst=3, route_limits={"/query": 1})
+        first = await limiter.check("alice", "/query")
+        second = await limiter.check("alice", "/query")
+        other_route = await limiter.check("alice", "/auth/me")
+        other_client = await limiter.check("bob", "/query")
+        return first, second, other_route, other_client
+
+    first, second, other_route, other_client = asyncio.run(scenario())
+    assert (first.allowed, first.backend, first.limit) == (True, "redis", 1)
+    assert not second.allowed
+    assert 0 < second.retry_after <= 60
+    # The refused /query request wrote nothing, so alice still has two of three client-wide requests left.
+    assert (other_route.allowed, other_route.remaining) == (True, 1)
+    assert other_client.allowed
+
+
+class HangingRedis:
+    def register_script(self, source):
+        async def script(keys, args):
+            await asyncio.sleep(10)
+        return script
+
+
+def test_slow_redis_falls_back_to_local_limits_for_a_while():
+    async def scenario():
+        limiter = RateLimiter(HangingRedis(), per_minute=60, burst=2, route_limits={}, redis_timeout_ms=10, fallback_seconds=60)
+        return [await limiter.check("alice", "/query") for _ in range(3)], limiter.fallbacks_total
+
+    decisions, fallbacks = asyncio.run(scenario())
+    assert [decision.backend for decision in decisions] == ["local"] * 3
+    assert [decision.allowed for decision in decisions] == [True, True, False]
+    assert fallbacks == 1  # Redis was skipped after the first timeout
+
+
+def test_middleware_answers_429_with_retry_after(nexus):
+    import main
+
+    client, headers, server = nexus
+    main.app.state.rate_limiter = RateLimiter(fakeredis.aioredis.FakeRedis(server=server), per_minute=60, burst=2, route_limits={})
+    responses = [client.get("/auth/me", headers=headers) for _ in range(3)]
+    assert [response.status_code for response in responses] == [200, 200, 429]
+    assert [response.headers["x-ratelimit-remaining"] for response in responses] == ["1", "0", "0"]
+    assert responses[0].headers["x-ratelimit-limit"] == "60"
+    assert int(responses[2].headers["retry-after"]) >= 1
+    # Exempt routes are never limited.
+    assert all(client.get("/metrics").status_code == 200 for _ in range(5))
+
+
+def test_middleware_skips_checks_when_limiting_is_disabled(nexus):
+    import main
+
+    client, headers, _ = nexus
+    main.app.state.rate_limiter = RateLimiter(per_minute=0, route_limits={"/auth/me": 0})
+    responses = [client.get("/auth/me", headers=headers) for _ in range(5)]
+    assert {response.status_code for response in responses} == {200}
+    assert "x-ratelimit-limit" not in responses[0].headers
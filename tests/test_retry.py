@@ -0,0 +1,127 @@
+# tests/test_retry.py
+import asyncio
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from app.retry import RetryScheduler, backoff_seconds
+
+COMMAND = {"tool_name": "process_file", "tool_arguments": {"file_id": 7}}
+
+
+def make_retry(redis=None, **kwargs):
+    return RetryScheduler(redis or fakeredis.aioredis.FakeRedis(), **{"max_attempts": 3, "base_seconds": 1, "max_seconds": 10, **kwargs})
+
+
+async def dispatch(retry, request_id, command=COMMAND):
+    """One attempt: what publish_commands does for each command."""
+    pipeline = retry.redis.pipeline(transaction=False)
+    retry.remember(pipeline, request_id, "gpt-agent_research", {**command, "request_id": request_id}, "ingest", 42)
+    await pipeline.execute()
+
+
+def test_backoff_is_full_jitter_capped_exponential():
+    class Upper:
+        def uniform(self, low, high):
+            return high
+
+    assert [backoff_seconds(attempt, 1, 10, rng=Upper()) for attempt in (1, 2, 3, 4, 5)] == [1, 2, 4, 8, 10]
+
+
+def test_failures_are_scheduled_until_max_attempts_then_dead_lettered():
+    async def scenario():
+        retry, outcomes = make_retry(), []
+        for _ in range(3):
+            await dispatch(retry, "rid")
+            outcomes.append(await retry.failed("rid", "boom", now=1000))
+        return retry, outcomes, await retry.dead_letters(), await retry.stats()
+
+    retry, outcomes, dead, stats = asyncio.run(scenario())
+    assert outcomes == ["scheduled", "scheduled", "dead_lettered"]
+    assert len(dead) == 1
+    assert (dead[0]["request_id"], dead[0]["attempts"], dead[0]["error"], dead[0]["tenant"]) == ("rid", 3, "boom", "42")
+    assert dead[0]["command"]["tool_name"] == "process_file"
+    assert (stats["scheduled_total"], stats["dead_lettered_total"]) == (2, 1)
+
+
+def test_non_retryable_error_is_dead_lettered_at_once():
+    async def scenario():
+        retry = make_retry()
+        await dispatch(retry, "rid")
+        outcome = await retry.failed("rid", "bad arguments", retryable=False)
+        return outcome, await retry.dead_letters(), await retry.redis.zcard(retry.due_key), await retry.failed("rid", "again")
+
+    outcome, dead, due, again = asyncio.run(scenario())
+    assert outcome == "dead_lettered"
+    assert (dead[0]["attempts"], dead[0]["retryable"]) == (1, False)
+    assert due == 0
+    assert again is None  # the record is gone
+
+
+def test_concurrent_failures_of_one_attempt_schedule_one_retry():
+    async def scenario():
+        redis = fakeredis.aioredis.FakeRedis()
+        workers = [make_retry(redis) for _ in range(4)]  # every Nexus worker reads the same inbox message
+        await dispatch(workers[0], "rid")
+        outcomes = await asyncio.gather(*(worker.failed("rid", "boom") for worker in workers))
+        return outcomes, sum(worker.totals["scheduled"] for worker in workers), await redis.zcard(workers[0].due_key)
+
+    outcomes, handled, due = asyncio.run(scenario())
+    assert outcomes == ["scheduled"] * 4  # waiters keep waiting on every worker
+    assert handled == 1
+    assert due == 1
+
+
+def test_take_due_hands_out_each_retry_once():
+    async def scenario():
+        redis = fakeredis.aioredis.FakeRedis()
+        first, second = make_retry(redis, batch_size=3), make_retry(redis, batch_size=3)
+        for index in range(5):
+            await dispatch(first, f"rid-{index}")
+            await first.failed(f"rid-{index}", "boom", now=1000)
+        early = await first.take_due(now=1000 - 1)
+        batches = await asyncio.gather(first.take_due(now=2000), second.take_due(now=2000))
+        return early, batches, await first.take_due(now=2000)
+
+    early, batches, after = asyncio.run(scenario())
+    assert early == []
+    taken = [record["request_id"] for batch in batches for record in batch]
+    assert sorted(taken) == [f"rid-{index}" for index in range(5)]
+    assert max(len(batch) for batch in batches) == 3
+    assert after == []
+    record = batches[0][0]
+    assert (record["agent_type"], record["priority"], record["tenant"], record["attempt"]) == ("gpt-agent_research", "ingest", "42", 1)
+    assert record["command"]["request_id"] == record["request_id"]
+
+
+def test_replay_resets_the_attempt_count():
+    async def scenario():
+        retry = make_retry()
+        for _ in range(3):
+            await dispatch(retry, "rid")
+            await retry.failed("rid", "boom", now=1000)
+        replayed = await retry.replay(now=1000)
+        taken = await retry.take_due(now=1000)
+        # The replayed command is dispatched again and gets a full set of attempts.
+        await dispatch(retry, "rid")
+        after_replay = await retry.failed("rid", "boom", now=1000)
+        return replayed, taken, after_replay, await retry.dlq_length(), retry.totals["replayed"]
+
+    replayed, taken, after_replay, dlq_length, replayed_total = asyncio.run(scenario())
+    assert replayed == ["rid"]
+    assert [record["attempt"] for record in taken] == [0]
+    assert after_replay == "scheduled"
+    assert dlq_length == 0
+    assert replayed_total == 1
+
+
+def test_dead_letter_queue_is_capped_newest_first():
+    async def scenario():
+        retry = make_retry(dlq_max=2)
+        for index in range(3):
+            await dispatch(retry, f"rid-{index}")
+            await retry.failed(f"rid-{index}", "boom", retryable=False)
+        return [entry["request_id"] for entry in await retry.dead_letters()]
+
+    assert asyncio.run(scenario()) == ["rid-2", "rid-1"]
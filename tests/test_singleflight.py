@@ -0,0 +1,60 @@
+# tests/test_singleflight.py
+import asyncio
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from app.singleflight import SingleFlight
+
+
+def make_flight():
+    return SingleFlight(fakeredis.aioredis.FakeRedis(decode_responses=True))
+
+
+def test_timed_out_waiters_are_dropped():
+    async def scenario():
+        flight = make_flight()
+        results = await asyncio.gather(*(flight.wait(f"unknown-{i}", timeout=0.01) for i in range(50)))
+        return results, flight.depths()
+
+    results, depths = asyncio.run(scenario())
+    assert results == [None] * 50
+    assert depths["waiters"] == 0
+
+
+def test_shared_waiter_survives_one_caller_timing_out():
+    async def scenario():
+        flight = make_flight()
+        await flight.join("key", "rid")
+        patient = asyncio.ensure_future(flight.wait("rid", timeout=5))
+        impatient = await flight.wait("rid", timeout=0.01)
+        await flight.resolve("rid", {"answer": 42})
+        return impatient, await patient, flight.depths()
+
+    impatient, patient, depths = asyncio.run(scenario())
+    assert impatient is None
+    assert patient == {"answer": 42}
+    assert depths["waiters"] == 0
+
+
+def test_members_are_leader_and_followers_only():
+    async def scenario():
+        flight = make_flight()
+        await flight.join("key", "rid", member=1)
+        await flight.join("key", "other-rid", member=2)  # follower of rid
+        return [await flight.is_member("rid", user) for user in (1, 2, 3)]
+
+    assert asyncio.run(scenario()) == [True, True, False]
+
+
+def test_query_result_is_private_to_its_callers(nexus):
+    client, headers, _ = nexus
+    query_id = client.post("/query", json={"query": "Plan the Q3 launch"}, headers=headers).json()["query_id"]
+    assert client.get(f"/query/{query_id}", headers=headers).json()["status"] == "pending"
+
+    client.post("/auth/register", params={"username": "intruder", "password": "secret"})
+    token = client.post("/auth/token", data={"username": "intruder", "password": "secret"}).json()["access_token"]
+    intruder = {"Authorization": f"Bearer {token}"}
+    assert client.get(f"/query/{query_id}", headers=intruder).status_code == 404
+    assert client.get(f"/claims/{'0' * 64}", params={"query_id": query_id}, headers=intruder).status_code == 404
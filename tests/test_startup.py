@@ -0,0 +1,28 @@
+# tests/test_startup.py
+import time
+
+from app.startup import StartupReport
+
+
+def test_total_stops_at_finish():
+    report = StartupReport(imports_ms=100.0)
+    with report.phase("database"):
+        time.sleep(0.01)
+    report.finish()
+    total = report.total_ms()
+    time.sleep(0.02)
+    assert report.total_ms() == total
+    assert report.as_dict()["total_ms"] == round(total, 3)
+    assert 110.0 <= total < 200.0
+    assert list(report.as_dict()["phases_ms"]) == ["imports", "database"]
+
+
+def test_startup_report_is_fixed_once_nexus_is_up(nexus):
+    client, _, _ = nexus
+    import main
+
+    report = main.app.state.startup_report
+    assert report.finished is not None
+    first = report.as_dict()["total_ms"]
+    time.sleep(0.02)
+    assert report.as_dict()["total_ms"] == first